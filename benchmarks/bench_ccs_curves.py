@@ -0,0 +1,58 @@
+"""Artifact size, accuracy and drift -> CCS conversion time: calibrated CSV rows vs PCHIP curves
+
+Run from the repository root with: python -m benchmarks.bench_ccs_curves
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from ims_tools.ccs_curves import CCSCurves
+from ims_tools.twims_calibration import PowerLawCalibration
+
+
+def calibrated_tables(n_proteins=5, charges=range(8, 24), n_rows=8000, mass=20000.0):
+    """Tables like Process Output Files writes, generated from a power-law calibration"""
+    calibration = PowerLawCalibration(np.log(350), 0.55, np.eye(2) * 1e-6, 0.01, "Nitrogen", 0.0, 20, 0.99)
+    drift_ms = np.linspace(0.5, 20, n_rows)
+    tables = {}
+    for p in range(n_proteins):
+        parts = []
+        for z in charges:
+            ccs, ccs_std = calibration.predict(drift_ms, mass + 1000 * p, z)
+            parts.append(pd.DataFrame({"Z": z, "Drift": drift_ms / 1000, "CCS": ccs, "CCS Std.Dev.": ccs_std}))
+        tables[f"protein_{p}"] = pd.concat(parts, ignore_index=True)
+    return tables
+
+
+def main(n_queries=20000):
+    tables = calibrated_tables()
+    csv_size = sum(len(df.to_csv(index=False)) for df in tables.values())
+    began = time.perf_counter()
+    curves = CCSCurves.from_tables(tables)
+    fit_time = time.perf_counter() - began
+    print(f"{curves.source_rows} rows in {len(curves.keys)} (protein, Z) tables -> {curves.n_knots} knots "
+          f"(fitted in {fit_time:.2f} s)")
+    print(f"artifact size: CSV {csv_size / 1e6:.1f} MB, curves JSON {len(curves.to_json()) / 1e3:.1f} kB")
+
+    worst = 0.0
+    for protein, df in tables.items():
+        for z, part in df.groupby("Z"):
+            ccs, _ = curves.evaluate(protein, z, part["Drift"].to_numpy())
+            worst = max(worst, np.max(np.abs(ccs - part["CCS"]) / part["CCS"]))
+    print(f"max relative CCS error on the calibrated rows: {worst:.1e}")
+
+    part = tables["protein_0"][tables["protein_0"]["Z"] == 12].reset_index(drop=True)
+    queries = np.random.default_rng(0).uniform(part["Drift"].min(), part["Drift"].max(), n_queries)
+    began = time.perf_counter()
+    nearest = [part.loc[(part["Drift"] - q).abs().idxmin(), "CCS"] for q in queries[:2000]]
+    table_rate = 2000 / (time.perf_counter() - began)
+    began = time.perf_counter()
+    ccs, _ = curves.evaluate("protein_0", 12, queries)
+    curve_rate = n_queries / (time.perf_counter() - began)
+    print(f"conversion: nearest row {table_rate:,.0f} points/s, curve {curve_rate:,.0f} points/s "
+          f"(max difference {np.max(np.abs(ccs[:2000] - nearest) / ccs[:2000]):.1e}, from the table's row spacing)")
+
+
+if __name__ == "__main__":
+    main()
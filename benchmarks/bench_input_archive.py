@@ -0,0 +1,104 @@
+"""Wall time and download size for building the IMSCal input ZIP from a 200-sample upload
+
+Compares the previous extract-to-disk / to_csv / walk-and-store route with streaming the .dat
+files straight into a compressed in-memory archive.
+Run from the repository root with: python -m benchmarks.bench_input_archive
+"""
+import io
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from ims_tools.archive import UploadedArchive
+from ims_tools.atd_fitting import gaussian
+from ims_tools.input_files import read_sample_atds, write_sample_inputs
+from ims_tools.workers import iter_prefetched
+
+
+def synthetic_upload(n_samples=200, charges=range(8, 16), n_points=200, seed=0):
+    """ZIP bytes laid out like a user upload: one folder per sample, one '<z>.txt' ATD per charge state"""
+    rng = np.random.default_rng(seed)
+    drift_time = np.linspace(0.05, 20, n_points)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for i in range(n_samples):
+            for z in charges:
+                intensity = gaussian(drift_time, rng.uniform(1e3, 1e5), rng.uniform(3, 15), rng.uniform(0.2, 1))
+                text = "\n".join(f"{t:.4f}\t{y:.1f}" for t, y in zip(drift_time, intensity))
+                zipf.writestr(f"sample_{i:03d}/{z}.txt", text)
+    return buffer.getvalue()
+
+
+# The route previously taken by pages/4_get_input_files.py, kept here as the reference point
+def legacy_input_zip(data, masses, drift_mode="Synapt"):
+    temp_dir = tempfile.mkdtemp(prefix="bench_samples_")
+    try:
+        with zipfile.ZipFile(io.BytesIO(data)) as zip_ref:
+            zip_ref.extractall(temp_dir)
+        sample_paths = []
+        for sample in sorted(os.listdir(temp_dir)):
+            folder = os.path.join(temp_dir, sample)
+            for filename in os.listdir(folder):
+                if filename.endswith(".txt") and filename[0].isdigit():
+                    values = np.loadtxt(os.path.join(folder, filename))
+                    df = pd.DataFrame({"index": np.arange(len(values)), "mass": masses[sample],
+                                       "charge": filename[:-4], "intensity": values[:, 1],
+                                       "drift_time": np.maximum(values[:, 0], 0)})
+                    df.to_csv(os.path.join(folder, f"input_{filename[:-4]}.dat"), sep=" ", index=False, header=False)
+            sample_paths.append(folder)
+
+        zip_buffer = io.BytesIO()
+        with zipfile.ZipFile(zip_buffer, "w") as zipf:
+            for sample_folder in sample_paths:
+                for root, _, files in os.walk(sample_folder):
+                    for file in files:
+                        full_path = os.path.join(root, file)
+                        zipf.write(full_path, arcname=os.path.relpath(full_path, os.path.dirname(sample_folder)))
+        return zip_buffer.getvalue()
+    finally:
+        shutil.rmtree(temp_dir)
+
+
+def streamed_input_zip(data, masses, drift_mode="Synapt"):
+    archive = UploadedArchive(data)
+    samples = list(archive.folders)
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
+        parsed = iter_prefetched(lambda sample: (sample, *read_sample_atds(archive, sample, drift_mode)), samples)
+        for sample, atds, _ in parsed:
+            write_sample_inputs(zipf, sample, atds, masses[sample])
+    archive.close()
+    return zip_buffer.getvalue()
+
+
+def dat_members(zip_bytes):
+    with zipfile.ZipFile(io.BytesIO(zip_bytes)) as zipf:
+        return {name: zipf.read(name) for name in zipf.namelist() if name.endswith(".dat")}
+
+
+def main(n_samples=200):
+    data = synthetic_upload(n_samples)
+    masses = {f"sample_{i:03d}": 10000.0 + i for i in range(n_samples)}
+
+    results = {}
+    for name, build in (("extract + walk (stored)", legacy_input_zip), ("streamed (deflated)", streamed_input_zip)):
+        began = time.perf_counter()
+        output = build(data, masses)
+        results[name] = (time.perf_counter() - began, output)
+
+    (legacy_time, legacy_zip), (streamed_time, streamed_zip) = results.values()
+    assert dat_members(legacy_zip) == dat_members(streamed_zip), ".dat contents differ"
+    print(f"{n_samples} samples, upload {len(data) / 1e6:.1f} MB")
+    for name, (elapsed, output) in results.items():
+        print(f"{name:24s} {elapsed:6.2f} s  {len(output) / 1e6:7.2f} MB download")
+    print(f"{legacy_time / streamed_time:.1f}x faster, {len(legacy_zip) / len(streamed_zip):.1f}x smaller; "
+          f"raw .txt files no longer included, .dat contents identical")
+
+
+if __name__ == "__main__":
+    main()
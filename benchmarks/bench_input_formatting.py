@@ -0,0 +1,64 @@
+"""Rows/second for formatting IMSCal input files: per-file DataFrame.to_csv vs one bulk formatting pass
+
+Run from the repository root with: python -m benchmarks.bench_input_formatting
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from ims_tools.atd_fitting import gaussian
+from ims_tools.input_files import format_input_rows, stack_input_rows
+
+
+def synthetic_samples(n_samples=100, charges=range(8, 18), n_points=300, seed=0):
+    """{sample: {'<z>.txt': (drift_time, intensity)}} with values parsed from text, as read_sample_atds returns"""
+    rng = np.random.default_rng(seed)
+    drift_time = np.round(np.linspace(0.05, 20, n_points), 4)
+    samples = {}
+    for i in range(n_samples):
+        samples[f"sample_{i:03d}"] = {
+            f"{z}.txt": (drift_time, np.round(gaussian(drift_time, rng.uniform(1e3, 1e5), rng.uniform(3, 15), 0.5), 1))
+            for z in charges
+        }
+    return samples
+
+
+# The per-file formatting previously used by pages/4_get_input_files.py, kept here as the reference point
+def per_file_to_csv(atds, mass):
+    files = []
+    for filename, (drift_time, intensity) in atds.items():
+        df = pd.DataFrame({"index": np.arange(len(drift_time)), "mass": mass, "charge": filename[:-4],
+                           "intensity": intensity, "drift_time": drift_time})
+        files.append(df.to_csv(sep=" ", index=False, header=False).encode("utf-8"))
+    return b"".join(files)
+
+
+def bulk_per_sample(atds, mass):
+    return format_input_rows(stack_input_rows(atds, mass)[0])
+
+
+def main():
+    samples = synthetic_samples()
+    n_rows = sum(len(d) for atds in samples.values() for d, _ in atds.values())
+
+    outputs = {}
+    for name, run in (
+        ("per-file to_csv", lambda: [per_file_to_csv(atds, 12000.0) for atds in samples.values()]),
+        ("bulk, per sample", lambda: [bulk_per_sample(atds, 12000.0) for atds in samples.values()]),
+        ("bulk, whole upload", lambda: [format_input_rows(np.concatenate(
+            [stack_input_rows(atds, 12000.0)[0] for atds in samples.values()]))]),
+    ):
+        began = time.perf_counter()
+        output = b"".join(run())
+        outputs[name] = (time.perf_counter() - began, output)
+
+    reference = outputs["per-file to_csv"][1]
+    print(f"{len(samples)} samples, {n_rows} rows")
+    for name, (elapsed, output) in outputs.items():
+        print(f"{name:20s} {n_rows / elapsed / 1e6:6.2f} M rows/s  "
+              f"({outputs['per-file to_csv'][0] / elapsed:.1f}x, identical output: {output == reference})")
+
+
+if __name__ == "__main__":
+    main()
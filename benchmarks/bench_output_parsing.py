@@ -0,0 +1,97 @@
+"""Time and peak memory for parsing IMSCal output_X.dat files: readlines/StringIO vs streaming from the marker
+
+Run from the repository root with: python -m benchmarks.bench_output_parsing
+"""
+import io
+import os
+import tempfile
+import time
+import tracemalloc
+import zipfile
+from io import StringIO
+
+import numpy as np
+import pandas as pd
+
+from ims_tools.archive import UploadedArchive
+from ims_tools.imscal_output import iter_output_tables
+
+
+def synthetic_outputs(n_proteins=10, charges=range(8, 28), n_rows=20000, header_lines=200, seed=0):
+    """ZIP bytes of protein folders holding output_<z>.dat files with a header and a [CALIBRATED DATA] block"""
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for p in range(n_proteins):
+            for z in charges:
+                drift = np.sort(rng.uniform(0.0005, 0.02, n_rows))
+                ccs = 500 + 1e5 * drift + rng.normal(0, 1, n_rows)
+                header = "".join(f"# parameter {i} = {rng.uniform():.6f}\n" for i in range(header_lines))
+                block = pd.DataFrame({"Z": z, "Drift": drift.round(6), "CCS": ccs.round(3),
+                                      "CCS Std.Dev.": (ccs * 0.01).round(3)}).to_csv(index=False)
+                zipf.writestr(f"protein_{p}/output_{z}.dat", f"[HEADER]\n{header}[CALIBRATED DATA]\n{block}")
+    return buffer.getvalue()
+
+
+# The route previously taken by pages/5_process_output_files.py, kept here as the reference point
+def legacy_parse(data):
+    protein_data = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with zipfile.ZipFile(io.BytesIO(data)) as zip_ref:
+            zip_ref.extractall(tmpdir)
+        for root, dirs, files in os.walk(tmpdir):
+            for file in sorted(files):
+                if file.startswith("output_") and file.endswith(".dat"):
+                    file_path = os.path.join(root, file)
+                    protein_name = os.path.relpath(file_path, tmpdir).split(os.sep)[0]
+                    with open(file_path, "r") as f:
+                        lines = f.readlines()
+                    cal_index = next(i for i, line in enumerate(lines) if line.strip() == "[CALIBRATED DATA]")
+                    df = pd.read_csv(StringIO("".join(lines[cal_index + 1:])))
+                    protein_data.setdefault(protein_name, []).append(df[["Z", "Drift", "CCS", "CCS Std.Dev."]])
+    return {name: pd.concat(dfs, ignore_index=True) for name, dfs in protein_data.items()}
+
+
+def streamed_parse(data):
+    archive = UploadedArchive(data)
+    protein_data = {}
+    for output in iter_output_tables(archive):
+        protein_data.setdefault(output.protein, []).append(output.table)
+    archive.close()
+    return {name: pd.concat(dfs, ignore_index=True) for name, dfs in protein_data.items()}
+
+
+def measure(parse, data):
+    tracemalloc.start()
+    began = time.perf_counter()
+    tables = parse(data)
+    elapsed = time.perf_counter() - began
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return tables, elapsed, peak
+
+
+def main():
+    data = synthetic_outputs()
+    with zipfile.ZipFile(io.BytesIO(data)) as zipf:
+        text_size = sum(info.file_size for info in zipf.infolist())
+    print(f"{text_size / 1e6:.0f} MB of output files ({len(data) / 1e6:.0f} MB zipped)")
+
+    results = {}
+    for name, parse in (("readlines + StringIO", legacy_parse), ("streamed from marker", streamed_parse)):
+        results[name] = measure(parse, data)
+        tables, elapsed, peak = results[name]
+        rows = sum(len(df) for df in tables.values())
+        print(f"{name:22s} {elapsed:6.2f} s  peak {peak / 1e6:7.1f} MB  {rows} rows, "
+              f"{sum(df.memory_usage().sum() for df in tables.values()) / 1e6:.0f} MB of tables")
+
+    # File order differs (directory walk vs archive order), so compare tables sorted by charge state and drift
+    legacy, streamed = ({k: df.sort_values(["Z", "Drift"], kind="stable").reset_index(drop=True) for k, df in r[0].items()}
+                        for r in results.values())
+    worst = max(np.max(np.abs(legacy[k][c].to_numpy() - streamed[k][c].to_numpy()) / np.abs(legacy[k][c].to_numpy()).max())
+                for k in legacy for c in ("Drift", "CCS", "CCS Std.Dev."))
+    print(f"max relative difference (float32 storage): {worst:.1e}")
+
+
+if __name__ == "__main__":
+    main()
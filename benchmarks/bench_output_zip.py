@@ -0,0 +1,81 @@
+"""Calibrated-drift download: ZIP_STORED after every protein is joined vs deflate pipelined with the join
+
+20 proteins x 10 charge states x 5k calibration points, each joined to a 10k-point raw ATD.
+The deflate only overlaps the join when more than one core is available (zlib releases the GIL).
+Run from the repository root with: python -m benchmarks.bench_output_zip
+"""
+import io
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from ims_tools.drift_join import match_intensities
+from ims_tools.zip_pipeline import PipelinedZipWriter
+
+
+def synthetic_proteins(n_proteins=20, n_charges=10, n_points=5000, n_raw=10000, seed=0):
+    """{protein: [(charge, cal_drift, cal_ccs, cal_std, raw_drift, raw_intensity)]}"""
+    rng = np.random.default_rng(seed)
+    raw_drift = np.linspace(0.0001, 0.02, n_raw)
+    proteins = {}
+    for p in range(n_proteins):
+        charges = []
+        for z in range(10, 10 + n_charges):
+            cal_drift = np.sort(rng.uniform(0.0001, 0.02, n_points))
+            cal_ccs = 1000 + cal_drift * 1e5 * z / 10
+            charges.append((z, cal_drift, cal_ccs, cal_ccs * 0.002, raw_drift, rng.uniform(0, 1e4, n_raw).round(1)))
+        proteins[f"Protein{p}"] = charges
+    return proteins
+
+
+def join_protein(charges):
+    return [pd.DataFrame({"Charge": z, "Drift": cal_drift, "CCS": cal_ccs, "CCS Std.Dev.": cal_std,
+                          "Intensity": match_intensities(raw_drift, raw_intensity, cal_drift)})
+            for z, cal_drift, cal_ccs, cal_std, raw_drift, raw_intensity in charges]
+
+
+# The archive previously built in pages/6_calibrate_atds.py, kept here as the reference point
+def stored_after_join(proteins):
+    output_buffers = {f"{name}.csv": join_protein(charges) for name, charges in proteins.items()}
+    zip_buffer = io.BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w") as zip_out:
+        for filename, dfs in output_buffers.items():
+            zip_out.writestr(filename, pd.concat(dfs, ignore_index=True).to_csv(index=False).encode("utf-8"))
+    return zip_buffer.getvalue()
+
+
+def pipelined(proteins, level):
+    zip_buffer = io.BytesIO()
+    with PipelinedZipWriter(zip_buffer, level=level) as zip_out:
+        for name, charges in proteins.items():
+            combined = pd.concat(join_protein(charges), ignore_index=True)
+            zip_out.add(f"{name}.csv", lambda combined=combined: combined.to_csv(index=False))
+    return zip_buffer.getvalue()
+
+
+def main():
+    proteins = synthetic_proteins()
+
+    began = time.perf_counter()
+    reference = stored_after_join(proteins)
+    reference_time = time.perf_counter() - began
+    expected = zipfile.ZipFile(io.BytesIO(reference))
+
+    n_points = sum(len(c[1]) for charges in proteins.values() for c in charges)
+    print(f"{len(proteins)} proteins, {n_points:,} calibrated points")
+    print(f"STORED after join:   {len(reference) / 1e6:7.1f} MB  {reference_time:6.2f} s")
+    for level in (1, 6, 9):
+        began = time.perf_counter()
+        archive = pipelined(proteins, level)
+        elapsed = time.perf_counter() - began
+        result = zipfile.ZipFile(io.BytesIO(archive))
+        same = result.testzip() is None and all(result.read(n) == expected.read(n) for n in expected.namelist())
+        print(f"pipelined, level {level}: {len(archive) / 1e6:7.1f} MB  {elapsed:6.2f} s  "
+              f"({len(reference) / len(archive):.1f}x smaller, {reference_time / elapsed:.2f}x the speed), "
+              f"identical CSVs: {same}")
+
+
+if __name__ == "__main__":
+    main()
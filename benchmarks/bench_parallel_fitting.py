@@ -0,0 +1,43 @@
+"""Wall time of calibrant ATD fitting on one thread vs across the shared worker pool
+
+The pool is timed twice: the first call starts it, later calls (Streamlit reruns) reuse it.
+
+Run from the repository root with: python -m benchmarks.bench_parallel_fitting
+"""
+import time
+
+from benchmarks.bench_atd_fitting import synthetic_atds
+from ims_tools.workers import default_worker_count, iter_fits
+
+
+def same_fit(a, b):
+    """Fits agree when both failed (params None) with the same flag, or both have identical parameters"""
+    if a[0] is None or b[0] is None:
+        return a[0] is None and b[0] is None and a[3] == b[3]
+    return bool((a[0] == b[0]).all())
+
+
+def main():
+    # A large multi-calibrant upload: 40 calibrants x 15 charge states with long ATDs
+    traces = synthetic_atds(n_calibrants=40, n_charges=15, n_points=2000)
+    # Worker counts are capped at the core count, so on a single-core host both runs are serial
+    n_workers = default_worker_count()
+
+    start = time.perf_counter()
+    serial = [fit for _, fit in iter_fits(traces, n_workers=1)]
+    serial_time = time.perf_counter() - start
+
+    timings = []
+    for _ in range(2):
+        start = time.perf_counter()
+        parallel = [fit for _, fit in iter_fits(traces, n_workers=n_workers)]
+        timings.append(time.perf_counter() - start)
+
+    identical = len(serial) == len(parallel) and all(same_fit(a, b) for a, b in zip(serial, parallel))
+    print(f"{len(traces)} ATDs, {n_workers} workers on {default_worker_count()} cores")
+    print(f"serial:              {serial_time:.2f} s")
+    print(f"pool, first call:    {timings[0]:.2f} s ({serial_time / timings[0]:.1f}x)")
+    print(f"pool, reused:        {timings[1]:.2f} s ({serial_time / timings[1]:.1f}x, identical results: {identical})")
+
+if __name__ == "__main__":
+    main()
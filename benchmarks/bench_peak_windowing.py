@@ -0,0 +1,46 @@
+"""Points per fit and fit time with and without region-of-interest windowing
+
+Run from the repository root with: python -m benchmarks.bench_peak_windowing
+"""
+import time
+
+import numpy as np
+
+from ims_tools.atd_fitting import find_peak_windows, fit_gaussians_batched, gaussian
+
+
+def baseline_heavy_atds(n_atds=60, n_points=800, seed=0):
+    """Narrow peaks on long, mostly-baseline drift axes, as exported from MassLynx"""
+    rng = np.random.default_rng(seed)
+    drift_time = np.linspace(0.1, 80, n_points)
+    traces = []
+    for _ in range(n_atds):
+        height = rng.uniform(1e3, 1e5)
+        intensity = gaussian(drift_time, height, rng.uniform(10, 60), rng.uniform(0.3, 1.2))
+        traces.append((drift_time, np.clip(intensity + rng.normal(0, 0.01 * height, n_points), 0, None)))
+    return traces
+
+
+def main(repeats=5):
+    traces = baseline_heavy_atds()
+    start, stop, flags = find_peak_windows(traces)
+    full_points = np.mean([len(d) for d, _ in traces])
+    window_points = np.mean(stop - start)
+
+    timings = {}
+    for window in (False, True):
+        began = time.perf_counter()
+        for _ in range(repeats):
+            results = fit_gaussians_batched(traces, window=window)
+        timings[window] = (time.perf_counter() - began) / repeats, results
+
+    apex_diff = max(abs(a[0][1] - b[0][1]) for a, b in zip(timings[False][1], timings[True][1]))
+    print(f"{len(traces)} ATDs, {int((flags != '').sum())} flagged")
+    print(f"points per fit: {full_points:.0f} -> {window_points:.0f} ({full_points / window_points:.1f}x fewer)")
+    print(f"whole trace: {timings[False][0] * 1000:8.1f} ms")
+    print(f"windowed:    {timings[True][0] * 1000:8.1f} ms ({timings[False][0] / timings[True][0]:.1f}x faster, "
+          f"max apex difference {apex_diff:.2e} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Charge-state window sums on a profile spectrum: a boolean mask per window vs searchsorted on a running total
+
+1M-point spectrum, 40 charge states x 5 species (protein plus adducts/proteoforms).
+Run from the repository root with: python -m benchmarks.bench_window_integration
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from ims_tools.mass_spectrum import PROTON_MASS, MassSpectrum
+
+
+def synthetic_spectrum(n_points=1_000_000, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({"m/z": np.linspace(500, 8000, n_points), "Intensity": rng.uniform(0, 1e3, n_points)})
+
+
+# The scale factors previously computed in pages/8_process_and_plot_IMS.py, kept here as the reference point
+def masked_sums(ms_df, masses, charges):
+    sums = {}
+    for mass in masses:
+        for z in charges:
+            mz = (mass + z * PROTON_MASS) / z
+            sums[mass, z] = ms_df[(ms_df["m/z"] >= mz * 0.99) & (ms_df["m/z"] <= mz * 1.01)]["Intensity"].sum()
+    return sums
+
+
+def main():
+    ms_df = synthetic_spectrum()
+    species = {"Protein": 50000.0, "Na": 50022.0, "K": 50038.0, "Phospho": 50080.0, "Dimer": 100000.0}
+    charges = np.arange(10, 50)
+
+    began = time.perf_counter()
+    legacy = masked_sums(ms_df, species.values(), charges)
+    legacy_time = time.perf_counter() - began
+
+    began = time.perf_counter()
+    spectrum = MassSpectrum.from_frame(ms_df)
+    build_time = time.perf_counter() - began
+    began = time.perf_counter()
+    windows = spectrum.species_windows(species, charges, 1.0)
+    window_time = time.perf_counter() - began
+
+    expected = np.array([legacy[species[name], z] for name, z in zip(windows["Species"], windows["Charge"])])
+    worst = np.max(np.abs(windows["Intensity"].to_numpy() - expected) / np.maximum(expected, 1))
+    print(f"{len(ms_df):,} points, {len(windows)} windows")
+    print(f"boolean masks:       {legacy_time * 1000:8.1f} ms")
+    print(f"sorted running sum:  {(build_time + window_time) * 1000:8.1f} ms "
+          f"(build {build_time * 1000:.1f} ms, windows {window_time * 1000:.2f} ms), "
+          f"{legacy_time / (build_time + window_time):.0f}x faster, max relative difference {worst:.1e}")
+
+
+if __name__ == "__main__":
+    main()
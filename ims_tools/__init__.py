@@ -0,0 +1 @@
+"""Shared processing helpers for the IM-MS Streamlit pages"""
@@ -0,0 +1,119 @@
+"""Reading uploaded ZIP archives without a shared extraction directory"""
+import fnmatch
+import io
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from ims_tools.fit_cache import content_hash
+
+# Archives that decompress beyond this many bytes are spilled to a private temporary directory
+SPILL_THRESHOLD = int(float(os.environ.get("IMS_ARCHIVE_SPILL_MB", 256)) * 1024 * 1024)
+
+
+def _is_hidden(part):
+    return part.startswith(("__MACOSX", "."))
+
+
+class UploadedArchive:
+    """Read-only view of an uploaded ZIP built from its central directory
+
+    `folders` maps each first-layer folder to the files directly inside it, in archive order.
+    Members are decoded straight from memory into NumPy arrays and kept for the lifetime of the
+    object; only archives larger than `spill_threshold` (uncompressed) are extracted to disk,
+    into a temporary directory owned by this object, and decoded on demand without being retained.
+    """
+
+    def __init__(self, data, spill_threshold=SPILL_THRESHOLD):
+        self.content_hash = content_hash(data)
+        self._zip = zipfile.ZipFile(io.BytesIO(data))
+        self._arrays = {}
+        self._spill_dir = None
+
+        self.folders = {}
+        for info in self._zip.infolist():
+            parts = info.filename.rstrip("/").split("/")
+            if any(_is_hidden(part) for part in parts):
+                continue
+            if len(parts) > 1 or info.is_dir():
+                files = self.folders.setdefault(parts[0], [])
+                if len(parts) == 2 and not info.is_dir():
+                    files.append(parts[1])
+
+        self.uncompressed_size = sum(info.file_size for info in self._zip.infolist())
+        if self.uncompressed_size > spill_threshold:
+            self._spill_dir = tempfile.TemporaryDirectory(prefix="ims_upload_")
+            self._zip.extractall(self._spill_dir.name)
+
+    @property
+    def spilled(self):
+        return self._spill_dir is not None
+
+    def atd_files(self, folder):
+        """Charge state ATD files (e.g. '12.txt') directly inside a folder"""
+        return [f for f in self.folders.get(folder, []) if f.endswith(".txt") and f[0].isdigit()]
+
+    def read_bytes(self, folder, filename):
+        member = f"{folder}/{filename}"
+        if self.spilled:
+            with open(os.path.join(self._spill_dir.name, folder, filename), "rb") as f:
+                return f.read()
+        return self._zip.read(member)
+
+    def find_files(self, pattern):
+        """(folder, member) pairs for files at any depth below a first-layer folder whose name matches `pattern`"""
+        matches = []
+        for info in self._zip.infolist():
+            parts = info.filename.split("/")
+            if info.is_dir() or len(parts) < 2 or any(_is_hidden(part) for part in parts):
+                continue
+            if fnmatch.fnmatch(parts[-1], pattern):
+                matches.append((parts[0], info.filename))
+        return matches
+
+    def file_members(self):
+        """Paths of every non-hidden file in the archive, at any depth, in archive order"""
+        return [info.filename for info in self._zip.infolist()
+                if not info.is_dir() and not any(_is_hidden(part) for part in info.filename.split("/"))]
+
+    def open_member(self, member):
+        """Binary stream over one member, decompressed incrementally rather than read whole"""
+        if self.spilled:
+            return open(os.path.join(self._spill_dir.name, *member.split("/")), "rb")
+        return self._zip.open(member)
+
+    def read_array(self, folder, filename):
+        """Decode a whitespace-delimited numeric member into a 2-D array"""
+        key = (folder, filename)
+        if key in self._arrays:
+            return self._arrays[key]
+        data = np.loadtxt(io.BytesIO(self.read_bytes(folder, filename)), ndmin=2)
+        if not self.spilled:
+            self._arrays[key] = data
+        return data
+
+    def read_atd(self, folder, filename):
+        """(drift time, intensity) arrays for one ATD member"""
+        data = self.read_array(folder, filename)
+        return data[:, 0], data[:, 1]
+
+    def close(self):
+        self._zip.close()
+        self._arrays.clear()
+        if self._spill_dir is not None:
+            self._spill_dir.cleanup()
+            self._spill_dir = None
+
+
+def session_archive(session_state, slot, uploaded_file, spill_threshold=SPILL_THRESHOLD):
+    """Return the UploadedArchive for an upload, reusing the one stored in this session if unchanged"""
+    data = uploaded_file.getvalue()
+    archive = session_state.get(slot)
+    if archive is None or archive.content_hash != content_hash(data):
+        if archive is not None:
+            archive.close()
+        archive = UploadedArchive(data, spill_threshold=spill_threshold)
+        session_state[slot] = archive
+    return archive
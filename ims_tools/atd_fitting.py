@@ -0,0 +1,237 @@
+"""Deterministic single-Gaussian fitting of calibrant ATDs"""
+import numpy as np
+from scipy.ndimage import uniform_filter1d
+from scipy.optimize import curve_fit
+
+# Everything that changes a fit result; included in cache keys for stored fits
+FIT_SETTINGS = {"model": "gaussian", "seed": "log-parabola", "max_iter": 100, "window_margin": 1.0,
+                "saturation_level": None, "min_ceiling": 1000.0, "noise_k": 3.0, "min_secondary": 5.0}
+
+
+def gaussian(x, amp, mean, stddev):
+    """Single Gaussian function"""
+    return amp * np.exp(-((x - mean) ** 2) / (2 * stddev ** 2))
+
+
+def gaussian_jacobian(x, amp, mean, stddev):
+    """Analytic derivatives of the Gaussian w.r.t. (amp, mean, stddev), stacked on the last axis"""
+    dx = x - mean
+    e = np.exp(-(dx ** 2) / (2 * stddev ** 2))
+    d_amp = e
+    d_mean = amp * e * dx / stddev ** 2
+    d_stddev = amp * e * dx ** 2 / stddev ** 3
+    return np.stack([d_amp, d_mean, d_stddev], axis=-1)
+
+
+def r_squared(y_true, y_pred):
+    """Coefficient of determination"""
+    ss_res = np.sum((y_true - y_pred) ** 2)
+    ss_tot = np.sum((y_true - np.mean(y_true)) ** 2)
+    return 1 - (ss_res / ss_tot)
+
+
+def initial_guess(drift_time, intensity):
+    """Seed (amp, mean, stddev) from a log-parabola through the apex, falling back to moments"""
+    drift_time = np.asarray(drift_time, dtype=float)
+    intensity = np.asarray(intensity, dtype=float)
+    apex = int(np.argmax(intensity))
+    amp = intensity[apex]
+
+    # Three points around the maximum: ln(y) is exactly quadratic for a Gaussian
+    if 0 < apex < len(intensity) - 1 and np.all(intensity[apex - 1:apex + 2] > 0):
+        x = drift_time[apex - 1:apex + 2]
+        c, b, a = np.polyfit(x, np.log(intensity[apex - 1:apex + 2]), 2)
+        if c < 0:
+            mean = -b / (2 * c)
+            stddev = np.sqrt(-1 / (2 * c))
+            if drift_time.min() <= mean <= drift_time.max() and np.isfinite(stddev):
+                return np.array([np.exp(a - b ** 2 / (4 * c)), mean, stddev])
+
+    # Otherwise use the first and second moments of the baseline-clipped trace
+    weights = np.clip(intensity - np.median(intensity), 0, None)
+    if weights.sum() <= 0:
+        weights = np.ones_like(intensity)
+    mean = np.sum(weights * drift_time) / weights.sum()
+    stddev = np.sqrt(np.sum(weights * (drift_time - mean) ** 2) / weights.sum())
+    if not np.isfinite(stddev) or stddev <= 0:
+        stddev = np.ptp(drift_time) / 10 or 1.0
+    return np.array([amp, drift_time[apex], stddev])
+
+
+def _pad_traces(traces):
+    """Stack ragged (drift_time, intensity) pairs into padded arrays plus a validity mask"""
+    n_points = max(len(d) for d, _ in traces)
+    x = np.zeros((len(traces), n_points))
+    y = np.zeros((len(traces), n_points))
+    mask = np.zeros((len(traces), n_points))
+    for i, (d, v) in enumerate(traces):
+        x[i, :len(d)] = d
+        # Pad drift times with the last value so the model stays finite in masked bins
+        x[i, len(d):] = d[-1] if len(d) else 0
+        y[i, :len(v)] = v
+        mask[i, :len(d)] = 1
+    return x, y, mask
+
+
+def _batched_levenberg_marquardt(x, y, mask, p0, max_iter=100, tol=1e-10):
+    """Fit every row of (x, y) to a Gaussian at once, one damped Gauss-Newton step per iteration"""
+    p = p0.copy()
+    lam = np.full(len(p), 1e-3)
+    active = np.ones(len(p), dtype=bool)
+
+    def cost(params):
+        resid = (y - gaussian(x, *(params[:, i, None] for i in range(3)))) * mask
+        return resid, np.sum(resid ** 2, axis=1)
+
+    resid, current = cost(p)
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        jac = gaussian_jacobian(x, *(p[:, i, None] for i in range(3))) * mask[..., None]
+        jtj = np.einsum('nmi,nmj->nij', jac, jac)
+        grad = np.einsum('nmi,nm->ni', jac, resid)
+        diag = np.einsum('nii->ni', jtj)
+        damped = jtj + (lam[:, None] * diag + 1e-12)[:, :, None] * np.eye(3)
+        step = np.linalg.solve(damped, grad[..., None])[..., 0]
+        step[~active] = 0
+
+        trial = p + step
+        trial_resid, trial_cost = cost(trial)
+        improved = active & np.isfinite(trial_cost) & (trial_cost < current)
+
+        p[improved] = trial[improved]
+        resid[improved] = trial_resid[improved]
+        converged = improved & ((current - trial_cost) <= tol * np.maximum(current, 1e-30))
+        current[improved] = trial_cost[improved]
+        lam = np.where(improved, lam / 10, lam * 10)
+
+        # Stop rows that converged or whose damping has blown up (no descent direction left)
+        active &= ~converged & (lam < 1e12)
+    return p
+
+
+def find_peak_windows(traces, margin=FIT_SETTINGS["window_margin"], smooth=5,
+                      saturation_level=FIT_SETTINGS["saturation_level"], min_ceiling=FIT_SETTINGS["min_ceiling"],
+                      noise_k=FIT_SETTINGS["noise_k"], min_secondary=FIT_SETTINGS["min_secondary"]):
+    """Locate the peak region of every trace in one vectorised pass
+
+    The window is the half-height span of the smoothed apex widened by `margin` times its width on
+    each side. Returns (start, stop, flags) arrays; flags are '' for usable traces, otherwise 'empty',
+    'saturated' or 'multimodal'.
+
+    A trace is saturated when at least three consecutive samples sit at its maximum and that maximum
+    is at a detector ceiling: within 1% of `saturation_level` if the ceiling is known, otherwise at
+    least `min_ceiling` counts, so low-count peaks that tie at the top by chance are still fitted.
+
+    A trace is multimodal when a second local maximum outside the window rises above the baseline by
+    30% of the main peak height and above the dip separating it from the apex by at least `noise_k`
+    times the trace's noise (1.4826 x MAD of raw minus smoothed) and `min_secondary` counts, so counting
+    noise on low-count peaks is not flagged.
+    """
+    x, y, mask = _pad_traces(traces)
+    n_traces, n_points = y.shape
+    lengths = mask.sum(axis=1).astype(int)
+    idx = np.arange(n_points)
+
+    # Extending each trace with its own last value makes mode="nearest" smooth it over its own length only,
+    # so results don't depend on which longer traces share the batch
+    last = np.array([v[-1] if len(v) else 0.0 for _, v in traces])
+    edged = np.where(mask > 0, y, last[:, None])
+    smoothed = np.where(mask > 0, uniform_filter1d(edged, size=smooth, axis=1, mode="nearest"), -np.inf)
+    apex = np.argmax(smoothed, axis=1)
+    peak = smoothed[np.arange(n_traces), apex]
+    baseline = np.array([np.median(v) if len(v) else 0.0 for _, v in traces])
+    height = peak - baseline
+    level = baseline + 0.5 * height
+
+    below = smoothed < level[:, None]
+    left = np.where(below & (idx < apex[:, None]), idx, -1).max(axis=1) + 1
+    right = np.where(below & (idx > apex[:, None]), idx, n_points).min(axis=1)
+    right = np.minimum(right, lengths)
+    pad = np.ceil(margin * (right - left)).astype(int)
+    start = np.maximum(left - pad, 0)
+    stop = np.minimum(right + pad, lengths)
+
+    flags = np.full(n_traces, "", dtype=object)
+    raw_max = np.where(mask > 0, y, -np.inf).max(axis=1)
+
+    # A second local maximum well outside the fit window means more than one conformer/peak
+    local_max = np.zeros_like(below)
+    local_max[:, 1:-1] = (smoothed[:, 1:-1] >= smoothed[:, :-2]) & (smoothed[:, 1:-1] >= smoothed[:, 2:])
+    outside = (idx < start[:, None]) | (idx >= stop[:, None])
+    residual = np.where(mask > 0, y - smoothed, np.nan)
+    noise = 1.4826 * np.nanmedian(np.abs(residual - np.nanmedian(residual, axis=1)[:, None]), axis=1)
+    # Prominence over the lowest point between the candidate and the apex, so shoulders of the main peak don't count
+    after = np.minimum.accumulate(np.where(idx >= apex[:, None], smoothed, np.inf), axis=1)
+    before = np.minimum.accumulate(np.where(idx <= apex[:, None], smoothed, np.inf)[:, ::-1], axis=1)[:, ::-1]
+    prominence = np.subtract(smoothed, np.where(idx > apex[:, None], after, before),
+                             out=np.full_like(smoothed, -np.inf), where=mask > 0)
+    floor = np.maximum(noise_k * np.nan_to_num(noise), min_secondary)
+    secondary = (local_max & outside & (mask > 0) & (smoothed > (baseline + 0.3 * height)[:, None])
+                 & (prominence > floor[:, None]))
+    flags[secondary.any(axis=1)] = "multimodal"
+
+    # Detector clipping shows up as a flat top: a run of consecutive points at the maximum, at the ceiling
+    at_max = (mask > 0) & (y == raw_max[:, None])
+    flat_top = (at_max[:, :-2] & at_max[:, 1:-1] & at_max[:, 2:]).any(axis=1) if n_points >= 3 else np.zeros(n_traces, bool)
+    at_ceiling = raw_max >= (0.99 * saturation_level if saturation_level is not None else min_ceiling)
+    flags[flat_top & at_ceiling] = "saturated"
+    flags[(lengths < 3) | ~(raw_max > 0) | ~(height > 0) | (stop - start < 3)] = "empty"
+    return start, stop, flags
+
+
+def fit_gaussians_batched(traces, max_iter=FIT_SETTINGS["max_iter"], window=True):
+    """Fit a single Gaussian to each (drift_time, intensity) pair as one batched problem
+
+    With `window`, only the peak region found by find_peak_windows is fitted and empty, saturated or
+    multimodal traces are not fitted at all. Returns a list of (params, r2, fitted_values, flag) in
+    input order; params is None where the trace was flagged or the fit failed.
+    Results are fully deterministic: seeds come from the data and no random restarts are used.
+    """
+    traces = [(np.asarray(d, dtype=float), np.asarray(v, dtype=float)) for d, v in traces]
+    results = [(None, -np.inf, None, "empty")] * len(traces)
+    if not traces:
+        return results
+
+    if window:
+        start, stop, flags = find_peak_windows(traces)
+    else:
+        start = np.zeros(len(traces), dtype=int)
+        stop = np.array([len(d) for d, _ in traces])
+        flags = np.array(["" if len(d) >= 3 and np.max(v) > 0 else "empty" for d, v in traces], dtype=object)
+    for i, flag in enumerate(flags):
+        if flag:
+            results[i] = (None, -np.inf, None, flag)
+    usable = [i for i, flag in enumerate(flags) if not flag]
+    if not usable:
+        return results
+
+    # Normalise each trace to unit height so one damping schedule suits every charge state
+    windows = [(traces[i][0][start[i]:stop[i]], traces[i][1][start[i]:stop[i]]) for i in usable]
+    scales = np.array([np.max(v) for _, v in windows])
+    x, y, mask = _pad_traces([(d, v / s) for (d, v), s in zip(windows, scales)])
+    p0 = np.array([initial_guess(d, v / s) for (d, v), s in zip(windows, scales)])
+    params = _batched_levenberg_marquardt(x, y, mask, p0, max_iter=max_iter)
+
+    for row, i in enumerate(usable):
+        drift_time, intensity = traces[i]
+        amp, mean, stddev = params[row]
+        amp *= scales[row]
+        stddev = abs(stddev)
+        if not (np.all(np.isfinite([amp, mean, stddev])) and amp > 0 and stddev > 0):
+            # Same seed, analytic Jacobian and a trust-region solver as a deterministic fallback
+            try:
+                fallback, _ = curve_fit(gaussian, *windows[row], p0=p0[row] * [scales[row], 1, 1],
+                                        jac=lambda xx, *pp: gaussian_jacobian(xx, *pp), method='trf')
+            except (RuntimeError, ValueError):
+                results[i] = (None, -np.inf, None, "")
+                continue
+            amp, mean, stddev = fallback[0], fallback[1], abs(fallback[2])
+        fitted_values = gaussian(drift_time, amp, mean, stddev)
+        results[i] = (np.array([amp, mean, stddev]), r_squared(intensity, fitted_values), fitted_values, "")
+    return results
+
+
+def fit_gaussian(drift_time, intensity):
+    """Deterministically fit a single ATD, returning (params, r2, fitted_values, flag)"""
+    return fit_gaussians_batched([(drift_time, intensity)])[0]
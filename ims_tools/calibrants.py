@@ -0,0 +1,96 @@
+"""Indexed calibrant reference library (Bush database plus any user-supplied sets)"""
+import functools
+import os
+import re
+from collections import namedtuple
+
+import pandas as pd
+
+BUSH_CSV = os.path.join(os.path.dirname(__file__), "..", "data", "bush.csv")
+
+CalibrantEntry = namedtuple("CalibrantEntry", ["mass", "ccs_he", "ccs_n2", "source"])
+
+# Spellings people use for calibrant folders, mapped onto the normalised database names
+_PREFIX_ALIASES = [
+    (re.compile(r"^denatured"), ""),
+    (re.compile(r"^polyala(?!nine)"), "polyalanine"),
+    (re.compile(r"^cytc$"), "cytochromec"),
+    (re.compile(r"^ubq$"), "ubiquitin"),
+]
+
+
+def normalise_name(name):
+    """Lower-case a protein/folder name and drop spaces and punctuation ('Cytochrome C' -> 'cytochromec')"""
+    key = re.sub(r"[^0-9a-z]", "", str(name).strip().lower())
+    for pattern, replacement in _PREFIX_ALIASES:
+        key = pattern.sub(replacement, key)
+    return key
+
+
+def _optional_float(value):
+    return float(value) if pd.notna(value) else None
+
+
+class CalibrantLibrary:
+    """O(1) lookup of (mass, CCS_he, CCS_n2) by (protein, charge), with normalised protein names"""
+
+    def __init__(self, entries=None, names=None):
+        self._entries = dict(entries or {})
+        # Normalised name -> name as written in the reference set it came from
+        self.names = dict(names or {})
+
+    @classmethod
+    def from_dataframe(cls, df, source):
+        """Build a library from a table with protein, charge, mass, CCS_he and CCS_n2 columns"""
+        df = df.rename(columns=lambda c: str(c).strip().lstrip("\ufeff"))
+        missing = {"protein", "charge", "mass", "CCS_he", "CCS_n2"} - set(df.columns)
+        if missing:
+            raise ValueError(f"{source} is missing columns: {', '.join(sorted(missing))}")
+
+        entries = {}
+        names = {}
+        for protein, charge, mass, ccs_he, ccs_n2 in df[["protein", "charge", "mass", "CCS_he", "CCS_n2"]].itertuples(index=False):
+            if pd.isna(protein) or pd.isna(charge):
+                continue
+            key = normalise_name(protein)
+            names.setdefault(key, str(protein).strip())
+            entries[(key, int(charge))] = CalibrantEntry(_optional_float(mass), _optional_float(ccs_he),
+                                                         _optional_float(ccs_n2), source)
+        return cls(entries, names)
+
+    @classmethod
+    def from_csv(cls, path_or_buffer, source=None):
+        df = pd.read_csv(path_or_buffer, skipinitialspace=True, encoding="utf-8-sig")
+        return cls.from_dataframe(df, source or os.path.basename(str(getattr(path_or_buffer, "name", path_or_buffer))))
+
+    def merge(self, *others):
+        """New library containing this one and `others`; later sets win for the same (protein, charge)"""
+        entries = dict(self._entries)
+        names = dict(self.names)
+        for other in others:
+            entries.update(other._entries)
+            for key, name in other.names.items():
+                names.setdefault(key, name)
+        return CalibrantLibrary(entries, names)
+
+    def resolve(self, folder_name):
+        """Normalised protein key for a calibrant folder name, or None if the library has no such protein"""
+        key = normalise_name(folder_name)
+        return key if key in self.names else None
+
+    def lookup(self, protein, charge):
+        """CalibrantEntry for a protein (folder name or key) and charge state, or None"""
+        return self._entries.get((normalise_name(protein), int(charge)))
+
+    def to_dataframe(self):
+        rows = [(self.names[key], charge, *entry) for (key, charge), entry in self._entries.items()]
+        return pd.DataFrame(rows, columns=["protein", "charge", "mass", "CCS_he", "CCS_n2", "source"])
+
+    def __len__(self):
+        return len(self._entries)
+
+
+@functools.lru_cache(maxsize=None)
+def bush_library():
+    """The bundled Bush database, parsed and indexed once per process"""
+    return CalibrantLibrary.from_csv(BUSH_CSV, source="Bush")
@@ -0,0 +1,72 @@
+"""Columnar (protein, Z) -> Drift/CCS/CCS Std.Dev. index over calibrated tables"""
+import numpy as np
+import pandas as pd
+
+VALUE_COLUMNS = ["Drift", "CCS", "CCS Std.Dev."]
+
+
+def _as_dtype(values, dtype):
+    """Cast a column, widening float32 through its decimal repr so 0.1f stays 0.1 rather than 0.10000000149"""
+    values = np.asarray(values)
+    if values.dtype == np.float32 and dtype == np.float64:
+        return values.astype(str).astype(np.float64)
+    return values.astype(dtype, copy=False)
+
+
+class CalibrationIndex:
+    """All calibration points sorted by (protein, Z), with each group a contiguous slice of three arrays
+
+    Built with one lexsort over every table; rows keep their original order within a group.
+    """
+
+    def __init__(self, keys, offsets, drift, ccs, ccs_std):
+        self.keys = list(keys)
+        self._slices = {key: slice(offsets[i], offsets[i + 1]) for i, key in enumerate(self.keys)}
+        self.drift = drift
+        self.ccs = ccs
+        self.ccs_std = ccs_std
+
+    @classmethod
+    def from_tables(cls, tables):
+        """Index {protein: table with Z, Drift, CCS, CCS Std.Dev. columns}"""
+        tables = {protein: df[df["Z"].notna()] for protein, df in tables.items()}
+        tables = {protein: df for protein, df in tables.items() if len(df)}
+        if not tables:
+            empty = np.empty(0)
+            return cls([], [0], empty, empty, empty)
+
+        proteins = list(tables)
+        dtypes = {column: np.result_type(*(tables[p][column].dtype for p in proteins)) for column in VALUE_COLUMNS}
+        protein_code = np.repeat(np.arange(len(proteins)), [len(tables[p]) for p in proteins])
+        z = np.concatenate([tables[p]["Z"].to_numpy().astype(np.int64) for p in proteins])
+        columns = {column: np.concatenate([_as_dtype(tables[p][column].to_numpy(), dtypes[column]) for p in proteins])
+                   for column in VALUE_COLUMNS}
+
+        order = np.lexsort((z, protein_code))
+        protein_code, z = protein_code[order], z[order]
+        starts = np.flatnonzero(np.r_[True, (np.diff(protein_code) != 0) | (np.diff(z) != 0)])
+        keys = [(proteins[protein_code[i]], int(z[i])) for i in starts]
+        offsets = np.r_[starts, len(order)]
+        return cls(keys, offsets, *(columns[column][order] for column in VALUE_COLUMNS))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self._slices
+
+    @property
+    def n_points(self):
+        return len(self.drift)
+
+    def get(self, key):
+        """(drift, ccs, ccs_std) array views for a (protein, Z), or None"""
+        part = self._slices.get(key)
+        if part is None:
+            return None
+        return self.drift[part], self.ccs[part], self.ccs_std[part]
+
+    def frame(self, key):
+        """Drift/CCS/CCS Std.Dev. table for a (protein, Z), or None"""
+        arrays = self.get(key)
+        return None if arrays is None else pd.DataFrame(dict(zip(VALUE_COLUMNS, arrays)))
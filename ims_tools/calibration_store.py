@@ -0,0 +1,144 @@
+"""Single-file columnar store of calibrated drift -> CCS tables, partitioned by (protein, Z)
+
+Parquet is written when pyarrow is installed, otherwise an uncompressed NPZ with the same layout.
+Either way rows are grouped by protein and charge state, columns are typed (int32 Z, float32
+Drift/CCS/CCS Std.Dev.) and a JSON header records the partitions and where the data came from, so
+readers can pull just the partitions they need without parsing text.
+"""
+import datetime
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional: fall back to NPZ
+    pa = pq = None
+
+from ims_tools.imscal_output import OUTPUT_COLUMNS, OUTPUT_DTYPES
+
+STORE_VERSION = 1
+METADATA_KEY = b"ims_tools.calibration"
+NPZ_COLUMNS = {"Z": "Z", "Drift": "Drift", "CCS": "CCS", "CCS Std.Dev.": "CCS_std"}
+ARTIFACT_TYPES = ["parquet", "npz"]
+
+
+def default_format():
+    return "parquet" if pq is not None else "npz"
+
+
+def provenance(source_hash=None, source_files=(), **extra):
+    """Provenance block stored with an artifact"""
+    return {"created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "source_hash": source_hash, "source_files": list(source_files),
+            "units": {"Drift": "s", "CCS": "Å²", "CCS Std.Dev.": "Å²"}, **extra}
+
+
+def _partitioned(tables):
+    """Yield (protein, Z, typed table) in protein then charge order, keeping row order within a partition"""
+    for protein in sorted(tables):
+        df = tables[protein][OUTPUT_COLUMNS].astype(OUTPUT_DTYPES)
+        for z, part in df.groupby("Z", sort=True):
+            yield protein, int(z), part.reset_index(drop=True)
+
+
+def write_calibration_store(tables, source=None, fmt=None):
+    """Serialise {protein: Z/Drift/CCS/CCS Std.Dev. table} to bytes; returns (data, file extension)"""
+    fmt = fmt or default_format()
+    parts = list(_partitioned(tables))
+    header = {"version": STORE_VERSION, "provenance": source or provenance(),
+              "partitions": [[protein, z, len(part)] for protein, z, part in parts]}
+    buffer = io.BytesIO()
+
+    if fmt == "parquet":
+        if pq is None:
+            raise ImportError("Writing Parquet needs pyarrow; use fmt='npz' instead.")
+        schema = pa.schema([("Z", pa.int32()), ("Drift", pa.float32()), ("CCS", pa.float32()),
+                            ("CCS Std.Dev.", pa.float32())], metadata={METADATA_KEY: json.dumps(header)})
+        with pq.ParquetWriter(buffer, schema) as writer:
+            # One row group per partition, so a reader can fetch (protein, Z) on its own
+            for _, _, part in parts:
+                writer.write_table(pa.Table.from_pandas(part, schema=schema, preserve_index=False),
+                                   row_group_size=max(len(part), 1))
+        return buffer.getvalue(), "parquet"
+
+    lengths = np.array([len(part) for _, _, part in parts], dtype=np.int64)
+    stacked = pd.concat([part for _, _, part in parts], ignore_index=True) if parts else pd.DataFrame(columns=OUTPUT_COLUMNS).astype(OUTPUT_DTYPES)
+    arrays = {key: stacked[column].to_numpy() for column, key in NPZ_COLUMNS.items()}
+    np.savez(buffer, offsets=np.r_[0, np.cumsum(lengths)], header=np.array(json.dumps(header)), **arrays)
+    return buffer.getvalue(), "npz"
+
+
+def dedupe_rows(df):
+    """Drop repeated (Z, Drift) rows, keeping the last (most recently ingested) one"""
+    return df.drop_duplicates(["Z", "Drift"], keep="last").reset_index(drop=True)
+
+
+def merge_tables(existing, new):
+    """{protein: table} with each protein's `new` tables appended to its existing one, de-duplicated on (Z, Drift)"""
+    merged = dict(existing)
+    for protein, dfs in new.items():
+        parts = ([merged[protein]] if protein in merged else []) + list(dfs)
+        merged[protein] = dedupe_rows(pd.concat(parts, ignore_index=True))
+    return merged
+
+
+class CalibrationStore:
+    """Read-only view of a calibration artifact; `read` decodes only the partitions asked for"""
+
+    def __init__(self, data):
+        if data[:4] == b"PAR1":
+            if pq is None:
+                raise ImportError("Reading a Parquet calibration file needs pyarrow.")
+            self._parquet = pq.ParquetFile(io.BytesIO(data))
+            self._columns = None
+            header = json.loads(self._parquet.schema_arrow.metadata[METADATA_KEY])
+        else:
+            self._parquet = None
+            # NpzFile decompresses a member on every access, so load each column once and slice it per read
+            with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+                header = json.loads(str(npz["header"]))
+                self._offsets = npz["offsets"]
+                self._columns = {column: npz[key] for column, key in NPZ_COLUMNS.items()}
+        if header.get("version") != STORE_VERSION:
+            raise ValueError(f"Unsupported calibration file version {header.get('version')}")
+        self.provenance = header["provenance"]
+        self.partitions = [(protein, int(z)) for protein, z, _ in header["partitions"]]
+        self.proteins = list(dict.fromkeys(protein for protein, _ in self.partitions))
+        # [protein, sha256, file] for every IMSCal output already merged into this file
+        self.manifest = self.provenance.get("manifest", [])
+
+    def read(self, protein, charges=None):
+        """Z/Drift/CCS/CCS Std.Dev. table of one protein, optionally only some charge states"""
+        picked = [i for i, (p, z) in enumerate(self.partitions)
+                  if p == protein and (charges is None or z in charges)]
+        if not picked:
+            return pd.DataFrame(columns=OUTPUT_COLUMNS).astype(OUTPUT_DTYPES)
+        if self._parquet is not None:
+            return self._parquet.read_row_groups(picked).to_pandas()
+        rows = np.concatenate([np.arange(self._offsets[i], self._offsets[i + 1]) for i in picked])
+        return pd.DataFrame({column: values[rows] for column, values in self._columns.items()})
+
+    def tables(self, proteins=None):
+        return {protein: self.read(protein) for protein in (proteins or self.proteins)}
+
+
+def read_calibration_uploads(files, wanted=None):
+    """{protein: table} from uploaded per-protein CSVs and/or calibration artifacts
+
+    `wanted` is an optional set of (protein, Z) pairs; artifacts then decode only those partitions.
+    """
+    tables = {}
+    for file in files:
+        if file.name.endswith(".csv"):
+            tables[file.name.replace(".csv", "")] = pd.read_csv(file)
+            continue
+        store = CalibrationStore(file.getvalue())
+        for protein in store.proteins:
+            charges = None if wanted is None else {z for p, z in wanted if p == protein}
+            if charges != set():
+                tables[protein] = store.read(protein, charges)
+    return tables
@@ -0,0 +1,120 @@
+"""Compact monotone (PCHIP) drift -> CCS curves per (protein, Z), fitted from calibrated tables"""
+import json
+
+import numpy as np
+from scipy.interpolate import PchipInterpolator
+
+CURVES_VERSION = 1
+# Knots are added until CCS is within this relative error everywhere...
+DEFAULT_CCS_RTOL = 1e-4
+# ...and the standard deviation within this fraction of its largest value
+DEFAULT_STD_RTOL = 1e-3
+START_KNOTS = 8
+
+
+def _worst_per_gap(knots, excess):
+    """Index of the worst point above tolerance between each pair of neighbouring knots"""
+    gap = np.searchsorted(knots, np.arange(len(excess)), side="right") - 1
+    order = np.lexsort((excess, gap))
+    last_of_gap = np.r_[gap[order][1:] != gap[order][:-1], True]
+    worst = order[last_of_gap]
+    return worst[excess[worst] > 1]
+
+
+def select_knots(drift, values, tolerances, start=START_KNOTS):
+    """Smallest knot set (by greedy refinement) whose PCHIP reproduces every `values` series within tolerance
+
+    Each round interpolates all series on the current knots in one pass and inserts, per gap between
+    knots, the point that is furthest out of tolerance.
+    """
+    n = len(drift)
+    knots = np.unique(np.linspace(0, n - 1, min(start, n)).round().astype(np.intp))
+    while len(knots) < n:
+        fitted = PchipInterpolator(drift[knots], values[:, knots], axis=1)(drift)
+        excess = (np.abs(fitted - values) / tolerances).max(axis=0)
+        new = _worst_per_gap(knots, excess)
+        if not len(new):
+            break
+        knots = np.union1d(knots, new)
+    return knots
+
+
+class CCSCurves:
+    """Knot arrays for every (protein, Z), stored back to back; evaluate() turns any drift array into CCS
+
+    Drift times are in seconds, as in the calibrated tables. Drift times outside a curve's calibrated
+    range are clamped to its ends, like the nearest-row lookup the tables were used for.
+    """
+
+    def __init__(self, keys, offsets, drift, ccs, ccs_std, source_rows=None):
+        self.keys = [(str(protein), int(z)) for protein, z in keys]
+        self._index = {key: i for i, key in enumerate(self.keys)}
+        self.offsets = np.asarray(offsets, dtype=np.intp)
+        self.drift = np.asarray(drift, dtype=float)
+        self.ccs = np.asarray(ccs, dtype=float)
+        self.ccs_std = np.asarray(ccs_std, dtype=float)
+        self.source_rows = source_rows
+        self._interpolators = {}
+
+    @classmethod
+    def from_tables(cls, tables, ccs_rtol=DEFAULT_CCS_RTOL, std_rtol=DEFAULT_STD_RTOL):
+        """Fit curves to {protein: Z/Drift/CCS/CCS Std.Dev. table}; duplicate drift times are averaged"""
+        keys, drift, ccs, ccs_std, lengths = [], [], [], [], []
+        source_rows = 0
+        for protein in sorted(tables):
+            df = tables[protein]
+            source_rows += len(df)
+            for z, part in df.groupby("Z", sort=True):
+                part = part.groupby("Drift", sort=True)[["CCS", "CCS Std.Dev."]].mean()
+                part = part[np.isfinite(part["CCS"])]
+                if len(part) < 2:
+                    continue
+                x = part.index.to_numpy(dtype=float)
+                values = np.vstack([part["CCS"].to_numpy(dtype=float),
+                                    np.nan_to_num(part["CCS Std.Dev."].to_numpy(dtype=float))])
+                tolerances = np.array([[ccs_rtol], [std_rtol]]) * np.vstack([np.abs(values[0]),
+                                                                             np.full(len(x), np.abs(values[1]).max())])
+                knots = select_knots(x, values, np.maximum(tolerances, np.finfo(float).tiny))
+                keys.append((protein, int(z)))
+                drift.append(x[knots])
+                ccs.append(values[0, knots])
+                ccs_std.append(values[1, knots])
+                lengths.append(len(knots))
+        offsets = np.r_[0, np.cumsum(lengths)].astype(np.intp)
+        concat = (lambda parts: np.concatenate(parts) if parts else np.empty(0))
+        return cls(keys, offsets, concat(drift), concat(ccs), concat(ccs_std), source_rows)
+
+    @property
+    def n_knots(self):
+        return int(self.offsets[-1])
+
+    def knots(self, protein, z):
+        """(drift, ccs, ccs_std) knot arrays of one curve"""
+        i = self._index[(str(protein), int(z))]
+        part = slice(self.offsets[i], self.offsets[i + 1])
+        return self.drift[part], self.ccs[part], self.ccs_std[part]
+
+    def __contains__(self, key):
+        return (str(key[0]), int(key[1])) in self._index
+
+    def evaluate(self, protein, z, drift):
+        """CCS and CCS Std.Dev. for an array of drift times (s) in one vectorised call"""
+        key = (str(protein), int(z))
+        if key not in self._interpolators:
+            x, ccs, ccs_std = self.knots(*key)
+            self._interpolators[key] = (x[0], x[-1], PchipInterpolator(x, np.vstack([ccs, ccs_std]), axis=1))
+        low, high, interpolator = self._interpolators[key]
+        ccs, ccs_std = interpolator(np.clip(np.asarray(drift, dtype=float), low, high))
+        return ccs, ccs_std
+
+    def to_json(self):
+        return json.dumps({"version": CURVES_VERSION, "kind": "pchip", "drift_units": "s",
+                           "source_rows": self.source_rows, "keys": self.keys, "offsets": self.offsets.tolist(),
+                           "drift": self.drift.tolist(), "ccs": self.ccs.tolist(), "ccs_std": self.ccs_std.tolist()})
+
+    @classmethod
+    def from_json(cls, text):
+        data = json.loads(text)
+        if data.get("version") != CURVES_VERSION or data.get("kind") != "pchip":
+            raise ValueError("Not a CCS curves file written by 'Process Output Files'.")
+        return cls(data["keys"], data["offsets"], data["drift"], data["ccs"], data["ccs_std"], data.get("source_rows"))
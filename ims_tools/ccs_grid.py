@@ -0,0 +1,75 @@
+"""Resampling calibrated CCSDs onto a shared CCS grid, one row per charge state (or other group)"""
+import numpy as np
+import pandas as pd
+
+DEFAULT_CCS_STEP = 1.0
+MIN_CCS_STEP = 0.01
+# Bounds the charge x CCS matrix (and its memory) whatever the range and step asked for
+MAX_CCS_GRID_POINTS = 20000
+
+
+def _snap_down(value):
+    """Largest 1, 2 or 5 x 10^k not above value"""
+    decade = 10.0 ** np.floor(np.log10(value))
+    return float(max(m for m in (1.0, 2.0, 5.0) if m * decade <= value) * decade)
+
+
+def _snap_up(value):
+    """Smallest 1, 2 or 5 x 10^k not below value"""
+    decade = 10.0 ** np.floor(np.log10(value))
+    return float(min(m * decade for m in (1.0, 2.0, 5.0, 10.0) if m * decade >= value))
+
+
+def capped_ccs_step(ccs_min, ccs_max, step, max_points=MAX_CCS_GRID_POINTS):
+    """`step`, or the smallest 1, 2 or 5 x 10^k step that keeps the grid within `max_points` values"""
+    step = max(float(step), MIN_CCS_STEP)
+    if (ccs_max - ccs_min) / step + 1 <= max_points:
+        return step
+    return _snap_up((ccs_max - ccs_min) / (max_points - 1))
+
+
+def make_ccs_grid(ccs_min, ccs_max, step=DEFAULT_CCS_STEP):
+    """Evenly spaced CCS values from ccs_min up to and including ccs_max (when it falls on a step)
+
+    Steps that would give more than MAX_CCS_GRID_POINTS values are coarsened by capped_ccs_step.
+    """
+    step = capped_ccs_step(ccs_min, ccs_max, step)
+    return np.arange(ccs_min, ccs_max + step, step)
+
+
+def adaptive_ccs_step(df, by="Charge"):
+    """Median CCS spacing of the calibrated points within each group, snapped down to 1, 2 or 5 x 10^k
+
+    The grid is then about as fine as the data without inventing detail between points; the step is
+    never below MIN_CCS_STEP, however densely the points are packed.
+    """
+    spacing = df.sort_values([by, "CCS"]).groupby(by)["CCS"].diff()
+    median = spacing[spacing > 0].median()
+    if not np.isfinite(median):
+        return DEFAULT_CCS_STEP
+    return max(_snap_down(median), MIN_CCS_STEP)
+
+
+def resample_ccs_grid(df, value_column, grid, by="Charge"):
+    """(group keys, matrix) with `value_column` linearly interpolated onto `grid` for every group
+
+    Each row is np.interp(grid, group CCS, group values, left=0, right=0); rows of the matrix follow the
+    sorted group keys. Pages cache the result, so the matrix is built once per table and grid.
+    """
+    df = df[df["CCS"].notna()]
+    grid = np.asarray(grid, dtype=float)
+    keys, rows = [], []
+    for key, group in df.groupby(by, sort=True):
+        group = group.sort_values("CCS", kind="stable")
+        keys.append(key)
+        rows.append(np.interp(grid, group["CCS"].to_numpy(dtype=float), group[value_column].to_numpy(dtype=float),
+                              left=0, right=0))
+    return keys, np.vstack(rows) if rows else np.zeros((0, len(grid)))
+
+
+def traces_frame(keys, matrix, grid, label=lambda key: f"{int(key)}+"):
+    """Wide table of resampled traces: a CCS column, one column per group and their sum"""
+    frame = pd.DataFrame(matrix.T, columns=[label(key) for key in keys])
+    frame.insert(0, "CCS", grid)
+    frame["Summed"] = matrix.sum(axis=0)
+    return frame
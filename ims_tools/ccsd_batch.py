@@ -0,0 +1,166 @@
+"""Scaling and plotting many (calibrated CSV, mass spectrum, mass) experiments at once"""
+import io
+import posixpath
+
+import numpy as np
+import pandas as pd
+from matplotlib.figure import Figure
+
+from ims_tools.ccs_grid import resample_ccs_grid
+from ims_tools.manifest import sequence_masses
+from ims_tools.mass_spectrum import DEFAULT_WINDOW_PERCENT, MassSpectrum, charge_state_mz
+
+BATCH_MANIFEST_COLUMNS = ["experiment", "calibrated_csv", "spectrum", "mass", "sequence"]
+CCSD_COLUMNS = ["Charge", "CCS", "CCS Std.Dev.", "Intensity"]
+
+
+def read_batch_manifest(uploaded_file):
+    """Read a batch manifest CSV, tolerating column case/spacing and missing optional columns"""
+    df = pd.read_csv(uploaded_file, skipinitialspace=True, encoding="utf-8-sig",
+                     dtype={"experiment": str, "calibrated_csv": str, "spectrum": str, "sequence": str})
+    df = df.rename(columns=lambda c: str(c).strip().lower().replace(" ", "_"))
+    missing = [c for c in ("calibrated_csv", "spectrum") if c not in df.columns]
+    if missing:
+        raise ValueError(f"The manifest needs {' and '.join(repr(c) for c in missing)} column(s) naming files in the ZIP.")
+    for column in BATCH_MANIFEST_COLUMNS:
+        if column not in df.columns:
+            df[column] = np.nan
+    return df[BATCH_MANIFEST_COLUMNS]
+
+
+def _member_lookup(members):
+    """Map full paths, and basenames that are unique in the archive, to member paths"""
+    lookup = {member: member for member in members}
+    basenames = pd.Series(members, dtype=object).map(posixpath.basename)
+    unique = basenames[~basenames.duplicated(keep=False)]
+    lookup.update({name: members[i] for i, name in unique.items() if name not in lookup})
+    return lookup
+
+
+def resolve_batch_manifest(manifest, members):
+    """Experiments table (experiment, calibrated_csv, spectrum, mass) and the manifest rows that cannot be used
+
+    File names may be full archive paths or basenames that are unique in the archive. An explicit mass
+    wins over one computed from a sequence; experiments default to the calibrated CSV's file stem.
+    """
+    lookup = _member_lookup(list(members))
+    manifest = manifest.copy()
+    for column in ("calibrated_csv", "spectrum"):
+        manifest[column] = manifest[column].fillna("").astype(str).str.strip()
+    csv_member = manifest["calibrated_csv"].map(lookup)
+    spectrum_member = manifest["spectrum"].map(lookup)
+    stem = manifest["calibrated_csv"].map(lambda name: posixpath.splitext(posixpath.basename(name))[0])
+    experiment = manifest["experiment"].fillna("").astype(str).str.strip()
+    experiment = experiment.where(experiment != "", stem)
+
+    mass = pd.to_numeric(manifest["mass"], errors="coerce")
+    has_sequence = manifest["sequence"].notna() & (manifest["sequence"].astype(str).str.strip() != "")
+    seq_mass = pd.Series(sequence_masses(manifest["sequence"].where(has_sequence)), index=manifest.index)
+    resolved_mass = mass.where(mass > 0, seq_mass)
+
+    checks = [
+        (csv_member.isna(), "calibrated CSV not in the ZIP"),
+        (spectrum_member.isna(), "spectrum not in the ZIP"),
+        (~(resolved_mass > 0), "no positive mass or recognisable sequence"),
+        (experiment.duplicated(keep="first"), "duplicate experiment name (first row used)"),
+    ]
+    messages = pd.Series("", index=manifest.index)
+    for mask, message in checks:
+        messages = messages.where(~mask, messages + np.where(messages == "", "", "; ") + message)
+    issues = pd.DataFrame({"row": manifest.index + 2, "experiment": experiment, "issue": messages})
+    issues = issues[messages != ""].reset_index(drop=True)
+
+    experiments = pd.DataFrame({"experiment": experiment, "calibrated_csv": csv_member,
+                                "spectrum": spectrum_member, "mass": resolved_mass})[messages == ""]
+    return experiments.reset_index(drop=True), issues
+
+
+def read_experiment(archive, calibrated_csv, spectrum):
+    """(calibrated table, MassSpectrum) for one experiment's archive members"""
+    with archive.open_member(calibrated_csv) as f:
+        cal_df = pd.read_csv(f)
+    missing = [c for c in CCSD_COLUMNS if c not in cal_df.columns]
+    if missing:
+        raise ValueError(f"{calibrated_csv} is missing the {', '.join(missing)} column(s)")
+    with archive.open_member(spectrum) as f:
+        ms_df = pd.read_csv(f, sep="\t", header=None, names=["m/z", "Intensity"])
+    return cal_df, MassSpectrum.from_frame(ms_df)
+
+
+def scale_experiments(tables, spectra, masses, window_percent=DEFAULT_WINDOW_PERCENT):
+    """Long-format table of every experiment's scaled CCSDs
+
+    All tables are stacked into one frame with an Experiment column; the ±window scale factors of every
+    (experiment, charge) come from each spectrum's running sum, and normalisation and scaling are one
+    grouped operation over the whole stack. Points with CCS Std.Dev. >= 50% of CCS are dropped, as for
+    a single experiment.
+    """
+    stacked = pd.concat(tables, names=["Experiment", None]).reset_index(level=0).reset_index(drop=True)
+    stacked = stacked[stacked["CCS Std.Dev."] < 0.5 * stacked["CCS"]]
+
+    keys = stacked[["Experiment", "Charge"]].drop_duplicates().reset_index(drop=True)
+    mz = charge_state_mz(keys["Experiment"].map(masses).to_numpy(dtype=float), keys["Charge"].to_numpy())
+    half_width = mz * window_percent / 100.0
+    factors = np.empty(len(keys))
+    for experiment, rows in keys.groupby("Experiment", sort=False).indices.items():
+        factors[rows] = spectra[experiment].integrate(mz[rows] - half_width[rows], mz[rows] + half_width[rows])
+    keys["Mass"] = keys["Experiment"].map(masses)
+    keys["Scale Factor"] = factors
+
+    scaled = stacked.merge(keys, on=["Experiment", "Charge"], how="left")
+    scaled["Normalized Intensity"] = scaled["Intensity"] / scaled.groupby(["Experiment", "Charge"])["Intensity"].transform("max")
+    scaled["Scaled Intensity"] = scaled["Normalized Intensity"] * scaled["Scale Factor"]
+    return scaled
+
+
+def experiment_traces(scaled, ccs_grid, value_column="Scaled Intensity"):
+    """{experiment: (charges, traces)} with one row of `value_column` on `ccs_grid` per charge, in table order
+
+    Every (experiment, charge) is resampled in the same call.
+    """
+    keys, matrix = resample_ccs_grid(scaled, value_column, ccs_grid, by=["Experiment", "Charge"])
+    rows = {experiment: ([], []) for experiment in scaled["Experiment"].unique()}
+    for i, (experiment, charge) in enumerate(keys):
+        rows[experiment][0].append(int(charge))
+        rows[experiment][1].append(i)
+    return {experiment: (charges, matrix[index]) for experiment, (charges, index) in rows.items() if charges}
+
+
+def render_ccsd_panels(job):
+    """PNG bytes of one multi-panel figure; `job` is a plain dict so it can be sent to a worker process
+
+    Keys: panels [(title, charges, traces)], ccs_grid, colours {charge: rgb}, n_cols, panel_size (w, h),
+    dpi, font_size, line_thickness, ccs_range (min, max) and y_max (None for per-panel scaling).
+    """
+    panels = job["panels"]
+    n_cols = min(job["n_cols"], len(panels))
+    n_rows = -(-len(panels) // n_cols)
+    width, height = job["panel_size"]
+    fig = Figure(figsize=(width * n_cols, height * n_rows), dpi=job["dpi"])
+    axes = fig.subplots(n_rows, n_cols, squeeze=False)
+    font_size = job["font_size"]
+
+    for ax, (title, charges, traces) in zip(axes.flat, panels):
+        for charge, trace in zip(charges, traces):
+            ax.plot(job["ccs_grid"], trace, color=job["colours"][charge], label=f"{charge}+", linewidth=job["line_thickness"])
+            ax.fill_between(job["ccs_grid"], 0, trace, color=job["colours"][charge], alpha=0.3)
+        ax.plot(job["ccs_grid"], traces.sum(axis=0), color="black", linewidth=job["line_thickness"], label="Summed")
+        ax.set_title(title, fontsize=font_size)
+        ax.set_xlim(job["ccs_range"])
+        if job["y_max"] is not None:
+            ax.set_ylim(0, job["y_max"] * 1.05)
+        ax.set_xlabel("CCS (Å²)", fontsize=font_size)
+        ax.set_yticks([])
+        ax.legend(fontsize=font_size * 0.7, frameon=False)
+        for label in ax.get_xticklabels():
+            label.set_fontsize(font_size)
+        for spine in ax.spines.values():
+            spine.set_edgecolor("black")
+            spine.set_linewidth(1.5)
+    for ax in axes.flat[len(panels):]:
+        ax.set_visible(False)
+
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=job["dpi"], bbox_inches="tight")
+    return buffer.getvalue()
@@ -0,0 +1,90 @@
+"""Applying one calibration to a series of conditions (CV, activation energy, replicate) at once"""
+import io
+import re
+
+import numpy as np
+import pandas as pd
+
+from ims_tools.drift_join import nearest_indices, take_nearest
+
+DEFAULT_CCS_BINS = 200
+
+
+def condition_sort_key(name):
+    """Order condition folders by the first number in their name ('CV5' < 'CV20'), then by name"""
+    match = re.search(r"-?\d+(?:\.\d+)?", name)
+    return (0, float(match.group()), name) if match else (1, 0.0, name)
+
+
+def _shared_drift(atds, conditions, charge):
+    """Drift axis shared by every condition that has this charge state, or None if the axes differ"""
+    present = [atds[condition][charge][0] for condition in conditions if charge in atds[condition]]
+    drift = present[0]
+    if any(len(d) != len(drift) or not np.array_equal(d, drift) for d in present[1:]):
+        return None
+    return drift
+
+
+def _interp_weights(x, grid):
+    """Indices and weights for linear interpolation of values at sorted x onto grid (zero outside x)"""
+    hi = np.clip(np.searchsorted(x, grid, side="left"), 1, len(x) - 1)
+    lo = hi - 1
+    span = x[hi] - x[lo]
+    t = np.where(span > 0, (grid - x[lo]) / np.where(span > 0, span, 1), 0.0)
+    inside = (grid >= x[0]) & (grid <= x[-1])
+    return lo, hi, np.clip(t, 0, 1), inside
+
+
+def calibrate_condition_series(index, protein, atds, ccs_bins=DEFAULT_CCS_BINS):
+    """Calibrate every condition of one protein in one pass per charge state
+
+    `atds` maps condition -> {charge: (drift_s, intensity)}. Conditions sharing a drift axis (the usual
+    case for a voltage ramp) are matched with a single nearest-drift search for the whole stack.
+    Returns (tables, cube): per-condition Charge/Drift/CCS/CCS Std.Dev./Intensity tables, and a dict
+    with 'conditions', 'charges', 'ccs' (a common grid) and 'intensity' (conditions x charges x CCS).
+    """
+    conditions = sorted(atds, key=condition_sort_key)
+    charges = sorted({z for per_condition in atds.values() for z in per_condition if (protein, z) in index})
+    parts = {condition: [] for condition in conditions}
+    matched = {}
+
+    for z in charges:
+        cal_drift, cal_ccs, cal_std = index.get((protein, z))
+        drift = _shared_drift(atds, conditions, z)
+        shared_idx = nearest_indices(drift, cal_drift) if drift is not None else None
+        intensity = np.full((len(conditions), len(cal_drift)), np.nan)
+        for i, condition in enumerate(conditions):
+            if z in atds[condition]:
+                raw_drift, raw_intensity = atds[condition][z]
+                idx = shared_idx if shared_idx is not None else nearest_indices(raw_drift, cal_drift)
+                # Tables keep the raw intensity dtype so exports match a single-condition run
+                row = take_nearest(raw_intensity, idx)
+                intensity[i] = row
+                parts[condition].append(pd.DataFrame({"Charge": z, "Drift": cal_drift, "CCS": cal_ccs,
+                                                      "CCS Std.Dev.": cal_std, "Intensity": row}))
+        matched[z] = (cal_ccs, intensity)
+
+    tables = {condition: pd.concat(dfs, ignore_index=True) for condition, dfs in parts.items() if dfs}
+
+    # Resample every (condition, charge) onto one CCS grid, sharing interpolation weights across conditions
+    all_ccs = np.concatenate([ccs for ccs, _ in matched.values()]) if matched else np.empty(0)
+    ccs_grid = np.linspace(np.nanmin(all_ccs), np.nanmax(all_ccs), ccs_bins) if len(all_ccs) else np.empty(0)
+    cube = np.zeros((len(conditions), len(charges), len(ccs_grid)))
+    for j, z in enumerate(charges):
+        ccs, intensity = matched[z]
+        order = np.argsort(ccs, kind="stable")
+        if len(order) < 2:
+            continue
+        lo, hi, t, inside = _interp_weights(ccs[order], ccs_grid)
+        values = np.nan_to_num(intensity[:, order])
+        cube[:, j, :] = np.where(inside, values[:, lo] * (1 - t) + values[:, hi] * t, 0.0)
+
+    return tables, {"conditions": conditions, "charges": charges, "ccs": ccs_grid, "intensity": cube}
+
+
+def cube_to_npz(cube):
+    """Serialise a condition x charge x CCS cube (with its axes) to NPZ bytes"""
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, conditions=np.array(cube["conditions"]), charges=np.array(cube["charges"]),
+                        ccs=cube["ccs"], intensity=cube["intensity"])
+    return buffer.getvalue()
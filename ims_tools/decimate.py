@@ -0,0 +1,42 @@
+"""Pixel-aware decimation of traces for plotting"""
+import numpy as np
+
+
+def minmax_decimate(x, y, n_pixels):
+    """Keep the minimum and maximum point of each pixel column so peaks survive decimation
+
+    Returns at most 2 * n_pixels + 2 points in x order; traces already that short are returned unchanged.
+    Use this only for drawing - integrate and export from the full-resolution arrays.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(x) <= 2 * n_pixels + 2:
+        return x, y
+
+    # Spectra and ATDs usually arrive sorted; checking is far cheaper than sorting again
+    if not np.all(x[1:] >= x[:-1]):
+        order = np.argsort(x, kind="stable")
+        x = x[order]
+        y = y[order]
+    span = x[-1] - x[0]
+    if span <= 0:
+        return x[[0, -1]], y[[0, -1]]
+
+    pixel = np.minimum(((x - x[0]) / span * n_pixels).astype(np.intp), n_pixels - 1)
+    if not np.isnan(y).any():
+        # Pixel runs are contiguous in sorted x: take the first minimum and last maximum of each run
+        starts = np.flatnonzero(np.r_[True, pixel[1:] != pixel[:-1]])
+        lengths = np.diff(np.r_[starts, len(x)])
+        is_min = np.flatnonzero(y == np.repeat(np.minimum.reduceat(y, starts), lengths))
+        is_max = np.flatnonzero(y == np.repeat(np.maximum.reduceat(y, starts), lengths))
+        first_min = is_min[np.searchsorted(is_min, starts)]
+        last_max = is_max[np.searchsorted(is_max, starts + lengths, side="left") - 1]
+        keep = np.unique(np.concatenate([first_min, last_max, [0, len(x) - 1]]))
+        return x[keep], y[keep]
+
+    # Sort by (pixel, y): the first and last entry of each pixel run are its min and max
+    by_value = np.lexsort((y, pixel))
+    starts = np.flatnonzero(np.r_[True, np.diff(pixel[by_value]) != 0])
+    ends = np.r_[starts[1:], len(by_value)] - 1
+    keep = np.unique(np.concatenate([by_value[starts], by_value[ends], [0, len(x) - 1]]))
+    return x[keep], y[keep]
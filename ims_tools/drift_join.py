@@ -0,0 +1,62 @@
+"""Nearest-drift-time matching of calibration points to raw ATD intensities"""
+import numpy as np
+
+
+def is_index_aligned(grid, values):
+    """True when values[i] is closer to grid[i] than half the smallest grid spacing, for every i
+
+    This is the common case of a calibration computed on the raw ATD's own drift axis; the nearest
+    grid point is then simply the same position.
+    """
+    grid = np.asarray(grid, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if len(grid) != len(values) or len(grid) < 2:
+        return False
+    spacing = np.diff(grid)
+    if not np.all(spacing > 0):
+        return False
+    return bool(np.all(np.abs(values - grid) < 0.5 * spacing.min()))
+
+
+def nearest_indices(grid, values):
+    """Position in `grid` of the element nearest each value, picked as Series.idxmin of |grid - value| would
+
+    NaN grid entries are ignored; ties go to the earliest grid position. NaN values get -1.
+    One sort of the grid and one searchsorted call replace a scan of the grid per value.
+    """
+    grid = np.asarray(grid, dtype=float)
+    values = np.asarray(values, dtype=float)
+    if is_index_aligned(grid, values):
+        return np.arange(len(values))
+
+    valid = np.flatnonzero(~np.isnan(grid))
+    if not len(valid):
+        return np.full(len(values), -1)
+    order = valid[np.argsort(grid[valid], kind="stable")]
+    sorted_grid = grid[order]
+
+    right = np.clip(np.searchsorted(sorted_grid, values, side="left"), 0, len(order) - 1)
+    left = np.clip(right - 1, 0, len(order) - 1)
+    # Among repeated drift values idxmin keeps the first occurrence; stable order puts it first in each run
+    left = np.searchsorted(sorted_grid, sorted_grid[left], side="left")
+
+    left_distance = np.abs(sorted_grid[left] - values)
+    right_distance = np.abs(sorted_grid[right] - values)
+    left_pos, right_pos = order[left], order[right]
+    tie_pick = np.minimum(left_pos, right_pos)
+    nearest = np.where(left_distance < right_distance, left_pos,
+                       np.where(right_distance < left_distance, right_pos, tie_pick))
+    return np.where(np.isnan(values), -1, nearest)
+
+
+def take_nearest(raw_intensity, idx):
+    """raw_intensity at positions from nearest_indices, NaN where the position is -1"""
+    raw_intensity = np.asarray(raw_intensity)
+    if np.all(idx >= 0):
+        return raw_intensity[idx]  # keeps the raw dtype, as the row-by-row lookup did
+    return np.where(idx >= 0, raw_intensity[np.maximum(idx, 0)], np.nan)
+
+
+def match_intensities(raw_drift, raw_intensity, drift):
+    """Intensity of the raw ATD point nearest each calibration drift time (NaN where drift is NaN)"""
+    return take_nearest(raw_intensity, nearest_indices(raw_drift, drift))
@@ -0,0 +1,48 @@
+"""Process-wide LRU cache of per-ATD fit results, keyed by upload content"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def content_hash(data):
+    """SHA-256 hex digest of an uploaded file's bytes"""
+    return hashlib.sha256(data).hexdigest()
+
+
+class FitCache:
+    """Bounded least-recently-used mapping of fit keys to results"""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(archive_hash, member_path, settings):
+        """Cache key for one ATD: archive content, path inside the archive and the fit settings"""
+        return archive_hash, member_path, tuple(sorted(settings.items()))
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# Shared by every session; entries are keyed by content hash so uploads never collide
+ATD_FIT_CACHE = FitCache()
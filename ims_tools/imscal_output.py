@@ -0,0 +1,131 @@
+"""Parsing the [CALIBRATED DATA] block of IMSCal output_X.dat files"""
+import hashlib
+import io
+from collections import namedtuple
+
+import pandas as pd
+
+from ims_tools.workers import iter_prefetched
+
+CALIBRATED_MARKER = b"[CALIBRATED DATA]"
+OUTPUT_COLUMNS = ["Z", "Drift", "CCS", "CCS Std.Dev."]
+OUTPUT_DTYPES = {"Z": "int32", "Drift": "float32", "CCS": "float32", "CCS Std.Dev.": "float32"}
+CHUNK_SIZE = 1 << 20
+
+
+class _PrefixedStream(io.RawIOBase):
+    """Raw stream yielding `prefix` and then the rest of `stream`, so nothing is copied or re-read"""
+
+    def __init__(self, prefix, stream):
+        self._prefix = memoryview(prefix)
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        if len(self._prefix):
+            n = min(len(buffer), len(self._prefix))
+            buffer[:n] = self._prefix[:n]
+            self._prefix = self._prefix[n:]
+            return n
+        return self._stream.readinto(buffer)
+
+
+def seek_calibrated_block(stream, chunk_size=CHUNK_SIZE):
+    """Advance a binary stream past the '[CALIBRATED DATA]' line; returns a stream over the rest, or None
+
+    The stream is scanned in fixed-size chunks, so only the chunk holding the marker is kept.
+    """
+    pending = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return None
+        # Only search complete lines; a partial last line waits for the next chunk
+        buffer = pending + chunk
+        complete_end = buffer.rfind(b"\n") + 1
+        complete, pending = buffer[:complete_end], buffer[complete_end:]
+
+        found = complete.find(CALIBRATED_MARKER)
+        while found >= 0:
+            line_start = complete.rfind(b"\n", 0, found) + 1
+            line_end = complete.find(b"\n", found)
+            if complete[line_start:line_end].strip() == CALIBRATED_MARKER:
+                return io.BufferedReader(_PrefixedStream(complete[line_end + 1:] + pending, stream), chunk_size)
+            found = complete.find(CALIBRATED_MARKER, line_end)
+
+
+def read_calibrated_block(stream):
+    """Z, Drift, CCS, CCS Std.Dev. table (int32/float32 columns) from an IMSCal output stream, or None"""
+    block = seek_calibrated_block(stream)
+    if block is None:
+        return None
+    return pd.read_csv(block, usecols=OUTPUT_COLUMNS, dtype=OUTPUT_DTYPES, engine="c")[OUTPUT_COLUMNS]
+
+
+# One IMSCal output file; table is None when the file has no readable [CALIBRATED DATA] block or was skipped
+OutputFile = namedtuple("OutputFile", ["protein", "member", "digest", "table", "skipped"])
+
+
+class _HashingStream(io.RawIOBase):
+    """Raw stream over `stream` that feeds every byte read through SHA-256"""
+
+    def __init__(self, stream):
+        self._stream = stream
+        self._digest = hashlib.sha256()
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._stream.readinto(buffer)
+        if n:
+            self._digest.update(memoryview(buffer)[:n])
+        return n
+
+    def hexdigest(self, chunk_size=CHUNK_SIZE):
+        """Digest of the whole stream, hashing whatever the reader left unread"""
+        buffer = bytearray(chunk_size)
+        while self.readinto(buffer):
+            pass
+        return self._digest.hexdigest()
+
+
+def member_digest(archive, member, chunk_size=CHUNK_SIZE):
+    """SHA-256 of a member's bytes, streamed in chunks without parsing"""
+    with archive.open_member(member) as stream:
+        return _HashingStream(stream).hexdigest(chunk_size)
+
+
+def _read_member(archive, member):
+    """(digest, table) of one member from a single decompression pass; table is None if unreadable"""
+    with archive.open_member(member) as stream:
+        hashing = _HashingStream(stream)
+        try:
+            table = read_calibrated_block(io.BufferedReader(hashing, CHUNK_SIZE))
+        except Exception:
+            table = None
+        return hashing.hexdigest(), table
+
+
+def iter_output_tables(archive, pattern="output_*.dat", max_in_flight=4, known=()):
+    """Yield an OutputFile for every IMSCal output in an UploadedArchive, in archive order
+
+    Files are hashed and parsed on helper threads; at most `max_in_flight` parsed tables are held at
+    once. Without `known`, each file is hashed while it is parsed. With it, each file is first hashed
+    in a cheap streaming pass, and files whose (protein, digest) is in `known` come back skipped
+    without being parsed.
+    """
+    known = set(map(tuple, known))
+
+    def parse(match):
+        protein, member = match
+        if not known:
+            digest, table = _read_member(archive, member)
+            return OutputFile(protein, member, digest, table, False)
+        digest = member_digest(archive, member)
+        if (protein, digest) in known:
+            return OutputFile(protein, member, digest, None, True)
+        return OutputFile(protein, member, digest, _read_member(archive, member)[1], False)
+    return iter_prefetched(parse, archive.find_files(pattern), max_in_flight=max_in_flight)
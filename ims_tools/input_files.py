@@ -0,0 +1,79 @@
+"""Reading sample ATDs and writing IMSCal input files straight into an in-memory ZIP"""
+import os
+
+import numpy as np
+
+
+def read_sample_atds(archive, folder_name, drift_mode, inject_time=None):
+    """Charge state ATDs of one sample folder as {filename: (drift_time, intensity)} plus failure notes
+
+    Drift times are shifted by the inject time for Cyclic data and clipped at zero. Files whose name is
+    not a whole charge state (e.g. '12a.txt') are reported as failed rather than read.
+    """
+    atds = {}
+    failed_files = []
+    for filename in archive.atd_files(folder_name):
+        if not os.path.splitext(filename)[0].isdigit():
+            failed_files.append(f"{filename} - file name is not a charge state")
+            continue
+        try:
+            data = archive.read_array(folder_name, filename)
+        except Exception as e:
+            failed_files.append(f"{filename} - {str(e)}")
+            continue
+
+        # Handle case where file might have different structure
+        if data.shape[1] < 2:
+            failed_files.append(f"{filename} - insufficient data columns")
+            continue
+
+        drift_time = data[:, 0]
+        intensity = data[:, 1]
+        if drift_mode == "Cyclic" and inject_time is not None:
+            drift_time = drift_time - inject_time
+        atds[filename] = (np.maximum(drift_time, 0), intensity)  # avoid negative times
+    return atds, failed_files
+
+
+# index, mass, charge, intensity, drift_time; floats are written with their shortest repr, as to_csv does
+ROW_FORMAT = "%d %r %d %r %r\n"
+
+
+def stack_input_rows(atds, mass):
+    """All charge states of a sample as one (n_rows, 5) IMSCal input array, plus the row count per file"""
+    charges = [int(os.path.splitext(filename)[0]) for filename in atds]
+    lengths = np.array([len(drift_time) for drift_time, _ in atds.values()], dtype=np.intp)
+    rows = np.empty((lengths.sum(), 5))
+    if len(rows):
+        rows[:, 0] = np.arange(len(rows)) - np.repeat(np.cumsum(lengths) - lengths, lengths)  # per-file index
+        rows[:, 1] = mass
+        rows[:, 2] = np.repeat(charges, lengths)
+        rows[:, 3] = np.concatenate([intensity for _, intensity in atds.values()])
+        rows[:, 4] = np.concatenate([drift_time for drift_time, _ in atds.values()])
+    return rows, lengths
+
+
+def format_input_rows(rows):
+    """Format an (n_rows, 5) input array in one string-formatting pass"""
+    return ((ROW_FORMAT * len(rows)) % tuple(rows.ravel().tolist())).encode("ascii")
+
+
+def write_sample_inputs(zipf, sample, atds, mass, combined=False):
+    """Add sample/input_X.dat entries (or one sample/input_all.dat) to an open ZipFile
+
+    Returns the ATD filenames written.
+    """
+    rows, lengths = stack_input_rows(atds, mass)
+    if combined:
+        if len(rows):
+            zipf.writestr(f"{sample}/input_all.dat", format_input_rows(rows))
+        return list(atds)
+
+    text = format_input_rows(rows)
+    # Every row has a trailing newline, so per-file boundaries fall on newline positions
+    line_starts = np.r_[0, np.flatnonzero(np.frombuffer(text, dtype=np.uint8) == ord("\n")) + 1]
+    bounds = line_starts[np.r_[0, np.cumsum(lengths)]]
+    for i, filename in enumerate(atds):
+        charge = os.path.splitext(filename)[0]
+        zipf.writestr(f"{sample}/input_{charge}.dat", text[bounds[i]:bounds[i + 1]])
+    return list(atds)
@@ -0,0 +1,116 @@
+"""Sample manifests: per-folder mass (or sequence), instrument and inject time for a whole upload"""
+import numpy as np
+import pandas as pd
+
+INSTRUMENTS = ("Cyclic", "Synapt")
+MANIFEST_COLUMNS = ["folder", "mass", "sequence", "instrument", "inject_time"]
+
+WATER_MASS = 18.01528
+# Average residue masses (Da) of the 20 standard amino acids plus selenocysteine and pyrrolysine
+RESIDUE_MASSES = {
+    "A": 71.0788, "R": 156.1875, "N": 114.1038, "D": 115.0886, "C": 103.1388,
+    "E": 129.1155, "Q": 128.1307, "G": 57.0519, "H": 137.1411, "I": 113.1594,
+    "L": 113.1594, "K": 128.1741, "M": 131.1926, "F": 147.1766, "P": 97.1167,
+    "S": 87.0782, "T": 101.1051, "W": 186.2132, "Y": 163.1760, "V": 99.1326,
+    "U": 150.0388, "O": 237.3018,
+}
+
+# Byte value -> residue mass, NaN for anything that is not a residue letter
+_RESIDUE_TABLE = np.full(256, np.nan)
+for _letter, _mass in RESIDUE_MASSES.items():
+    _RESIDUE_TABLE[ord(_letter)] = _mass
+
+
+def sequence_masses(sequences):
+    """Average neutral masses (Da) of one-letter sequences; NaN for blank or unrecognised sequences
+
+    All sequences are looked up as one byte array and summed per sequence with np.add.reduceat.
+    Whitespace is ignored and letters may be lower case.
+    """
+    cleaned = pd.Series(sequences, dtype=object).fillna("").astype(str).str.upper().str.replace(r"\s+", "", regex=True)
+    lengths = cleaned.str.len().to_numpy()
+    masses = np.full(len(cleaned), np.nan)
+    present = lengths > 0
+    if not present.any():
+        return masses
+
+    codes = np.frombuffer("".join(cleaned[present]).encode("ascii", "replace"), dtype=np.uint8)
+    residue = _RESIDUE_TABLE[codes]
+    starts = np.r_[0, np.cumsum(lengths[present])[:-1]]
+    masses[present] = np.add.reduceat(residue, starts) + WATER_MASS  # any NaN residue poisons its sequence
+    return masses
+
+
+def read_manifest(uploaded_file):
+    """Read a manifest CSV, tolerating column case/spacing and missing optional columns"""
+    df = pd.read_csv(uploaded_file, skipinitialspace=True, encoding="utf-8-sig", dtype={"folder": str, "sequence": str})
+    df = df.rename(columns=lambda c: str(c).strip().lower().replace(" ", "_"))
+    if "folder" not in df.columns:
+        raise ValueError("The manifest needs a 'folder' column naming each sample folder in the ZIP.")
+    for column in MANIFEST_COLUMNS:
+        if column not in df.columns:
+            df[column] = np.nan
+    return df[MANIFEST_COLUMNS]
+
+
+def fill_sample_defaults(samples, default_instrument, default_inject_time=None):
+    """Copy of a sample table with blank instrument/inject_time cells set to the page-wide settings"""
+    samples = samples.copy()
+    samples["instrument"] = samples["instrument"].fillna(default_instrument)
+    samples["inject_time"] = pd.to_numeric(samples["inject_time"], errors="coerce").fillna(
+        np.nan if default_inject_time is None else default_inject_time)
+    return samples
+
+
+def resolve_manifest(manifest, folders, default_instrument=None, default_inject_time=None):
+    """Sample table with one row per archive folder, filled from the manifest where it has an entry
+
+    Returns (samples, issues): `samples` has folder, mass, mass_source, instrument and inject_time
+    columns in archive order; `issues` lists manifest rows that could not be used and why. Without a
+    `default_instrument`, instrument and inject time stay blank wherever the manifest leaves them blank.
+    """
+    folders = pd.Index(folders, dtype=object)
+    if manifest is None or manifest.empty:
+        manifest = pd.DataFrame(columns=MANIFEST_COLUMNS)
+    manifest = manifest.copy()
+    manifest["folder"] = manifest["folder"].astype(str).str.strip()
+
+    # Every check is a column-wise mask over the whole manifest
+    mass = pd.to_numeric(manifest["mass"], errors="coerce")
+    has_sequence = manifest["sequence"].notna() & (manifest["sequence"].astype(str).str.strip() != "")
+    seq_mass = sequence_masses(manifest["sequence"].where(has_sequence))
+    instrument = manifest["instrument"].astype(str).str.strip().str.capitalize()
+    inject_time = pd.to_numeric(manifest["inject_time"], errors="coerce")
+
+    checks = [
+        (~manifest["folder"].isin(folders), "folder not in the ZIP"),
+        (manifest["folder"].duplicated(keep="first"), "duplicate folder (first row used)"),
+        (has_sequence & np.isnan(seq_mass), "sequence has unrecognised residues"),
+        (manifest["mass"].notna() & ~(mass > 0), "mass is not a positive number"),
+        (manifest["instrument"].notna() & ~instrument.isin(INSTRUMENTS), f"instrument is not one of {', '.join(INSTRUMENTS)}"),
+        (manifest["inject_time"].notna() & ~(inject_time >= 0), "inject time is not a non-negative number"),
+    ]
+    messages = pd.Series("", index=manifest.index)
+    for mask, message in checks:
+        messages = messages.where(~mask, messages + np.where(messages == "", "", "; ") + message)
+    issues = pd.DataFrame({"row": manifest.index + 2, "folder": manifest["folder"], "issue": messages})
+    issues = issues[messages != ""].reset_index(drop=True)
+
+    usable = manifest["folder"].isin(folders) & ~manifest["folder"].duplicated(keep="first")
+    # An explicit mass wins over a sequence-derived one
+    resolved_mass = mass.where(mass > 0, pd.Series(seq_mass, index=manifest.index))
+    by_folder = pd.DataFrame({
+        "mass": resolved_mass,
+        "mass_source": np.where(mass > 0, "manifest", np.where(np.isfinite(seq_mass), "sequence", "")),
+        "instrument": instrument.where(instrument.isin(INSTRUMENTS)),
+        "inject_time": inject_time.where(inject_time >= 0),
+    })[usable].set_axis(manifest.loc[usable, "folder"])
+
+    samples = by_folder.reindex(folders)
+    samples["mass"] = samples["mass"].fillna(0.0)
+    samples["mass_source"] = samples["mass_source"].fillna("")
+    samples.index.name = "folder"
+    samples = samples.reset_index()
+    if default_instrument is not None:
+        samples = fill_sample_defaults(samples, default_instrument, default_inject_time)
+    return samples, issues
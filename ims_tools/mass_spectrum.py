@@ -0,0 +1,88 @@
+"""Mass spectra with constant-time m/z window integration"""
+import numpy as np
+import pandas as pd
+
+PROTON_MASS = 1.007276
+DEFAULT_WINDOW_PERCENT = 1.0
+
+
+def charge_state_mz(mass, charges):
+    """m/z of the [M + zH]z+ ions of a species for each charge state"""
+    charges = np.asarray(charges, dtype=float)
+    return (mass + charges * PROTON_MASS) / charges
+
+
+def merge_windows(lo, hi):
+    """Union of [lo, hi] intervals as sorted, non-overlapping (lo, hi) arrays"""
+    order = np.argsort(lo, kind="stable")
+    lo, hi = np.asarray(lo, dtype=float)[order], np.asarray(hi, dtype=float)[order]
+    reach = np.maximum.accumulate(hi)
+    starts = np.r_[True, lo[1:] > reach[:-1]] if len(lo) else np.empty(0, dtype=bool)
+    ends = np.r_[starts[1:], True] if len(lo) else starts
+    return lo[starts], reach[ends]
+
+
+class MassSpectrum:
+    """A profile spectrum sorted by m/z once, with a running intensity sum so any window sum is two searchsorted calls
+
+    Windows are closed, [lo, hi], matching the boolean-mask selection they replace.
+    """
+
+    def __init__(self, mz, intensity):
+        mz = np.asarray(mz, dtype=float)
+        intensity = np.asarray(intensity, dtype=float)
+        keep = ~(np.isnan(mz) | np.isnan(intensity))
+        order = np.argsort(mz[keep], kind="stable")
+        self.mz = mz[keep][order]
+        self.intensity = intensity[keep][order]
+        self._cumulative = np.r_[0.0, np.cumsum(self.intensity)]
+
+    @classmethod
+    def from_frame(cls, df):
+        """From a table with 'm/z' and 'Intensity' columns"""
+        return cls(df["m/z"].to_numpy(), df["Intensity"].to_numpy())
+
+    def __len__(self):
+        return len(self.mz)
+
+    def bounds(self, lo, hi):
+        """Start and stop indices of the points inside each [lo, hi] window"""
+        return np.searchsorted(self.mz, lo, side="left"), np.searchsorted(self.mz, hi, side="right")
+
+    def integrate(self, lo, hi):
+        """Summed intensity inside each [lo, hi] window (scalars or arrays)"""
+        start, stop = self.bounds(lo, hi)
+        return self._cumulative[np.maximum(stop, start)] - self._cumulative[start]
+
+    def window(self, lo, hi):
+        """(m/z, intensity) views of the points inside one window"""
+        start, stop = self.bounds(lo, hi)
+        return self.mz[start:stop], self.intensity[start:stop]
+
+    def species_windows(self, species, charges, window_percent=DEFAULT_WINDOW_PERCENT):
+        """One row per (species, charge) window: Species, Charge, m/z, m/z min, m/z max, Intensity
+
+        `species` maps a name to its mass in Da (protein, proteoforms, salt adducts, oligomers).
+        """
+        names = list(species)
+        masses = np.array([species[name] for name in names], dtype=float)
+        charges = np.asarray(charges)
+        mz = (masses[:, None] + charges[None, :] * PROTON_MASS) / charges[None, :]
+        half_width = mz * window_percent / 100.0
+        windows = pd.DataFrame({
+            "Species": np.repeat(names, len(charges)),
+            "Charge": np.tile(charges, len(names)),
+            "m/z": mz.ravel(),
+            "m/z min": (mz - half_width).ravel(),
+            "m/z max": (mz + half_width).ravel(),
+        })
+        windows["Intensity"] = self.integrate(windows["m/z min"].to_numpy(), windows["m/z max"].to_numpy())
+        return windows
+
+    def scale_factors(self, windows):
+        """Summed intensity per charge over the union of its species windows, so overlapping windows count once"""
+        factors = {}
+        for charge, group in windows.groupby("Charge", sort=False):
+            lo, hi = merge_windows(group["m/z min"].to_numpy(), group["m/z max"].to_numpy())
+            factors[charge] = float(self.integrate(lo, hi).sum())
+        return factors
@@ -0,0 +1,87 @@
+"""Local registry of fitted calibrations keyed by instrument settings and calibrant set"""
+import json
+import os
+import tempfile
+import threading
+from datetime import datetime
+
+from ims_tools.twims_calibration import PowerLawCalibration
+
+REGISTRY_PATH = os.environ.get(
+    "IMS_CALIBRATION_REGISTRY",
+    os.path.join(os.path.dirname(__file__), "..", "data", "calibration_registry.json"),
+)
+
+_lock = threading.Lock()
+
+
+def instrument_settings(velocity, voltage, pressure, length, gas, data_type, inject_time=0.0):
+    """Normalised settings dict used to match calibrations between sessions"""
+    return {
+        "velocity": round(float(velocity), 3),
+        "voltage": round(float(voltage), 3),
+        "pressure": round(float(pressure), 4),
+        "length": round(float(length), 4),
+        "gas": gas,
+        "data_type": data_type,
+        "inject_time": round(float(inject_time or 0.0), 4) if data_type == "Cyclic" else 0.0,
+    }
+
+
+def calibrant_set(results_df):
+    """Sorted 'protein_charge' labels of the calibrant ions a calibration was fitted on"""
+    return sorted(f"{protein}_{charge}" for protein, charge in zip(results_df["protein"], results_df["charge state"]))
+
+
+def load_registry(path=None):
+    path = path or REGISTRY_PATH
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _write_registry(entries, path):
+    # Write to a temporary file first so a crash never leaves a half-written registry
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(entries, f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def save_calibration(calibration, settings, calibrants, diagnostics=None, path=None):
+    """Store a calibration, replacing any earlier one for the same settings and calibrant set"""
+    path = path or REGISTRY_PATH
+    entry = {
+        "settings": settings,
+        "calibrants": list(calibrants),
+        "saved": datetime.now().isoformat(timespec="seconds"),
+        "calibration": calibration.to_dict(),
+        "diagnostics": diagnostics or {},
+    }
+    with _lock:
+        entries = [e for e in load_registry(path)
+                   if not (e["settings"] == settings and e["calibrants"] == entry["calibrants"])]
+        entries.append(entry)
+        _write_registry(entries, path)
+    return entry
+
+
+def find_calibrations(path=None, **settings):
+    """Registry entries whose settings match every given keyword, newest first"""
+    matches = [e for e in load_registry(path)
+               if all(e["settings"].get(k) == v for k, v in settings.items())]
+    return sorted(matches, key=lambda e: e["saved"], reverse=True)
+
+
+def entry_calibration(entry):
+    return PowerLawCalibration.from_dict(entry["calibration"])
+
+
+def entry_label(entry):
+    s = entry["settings"]
+    return (f"{entry['saved']} - {s['data_type']}, {s['gas']}, {s['velocity']} m/s, {s['voltage']} V, "
+            f"pressure {s['pressure']}, {len(entry['calibrants'])} calibrant ions, "
+            f"R² {entry['calibration']['r2']:.4f}")
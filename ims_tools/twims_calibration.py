@@ -0,0 +1,183 @@
+"""Power-law TWIMS calibration (corrected drift time vs reduced CCS) fitted and applied in memory"""
+import numpy as np
+import pandas as pd
+
+PROTON_MASS = 1.007276
+GAS_MASSES = {"Helium": 4.002602, "Nitrogen": 28.0134}
+
+
+def reduced_mass(mass, charge, gas_mass):
+    """Reduced mass (Da) of an ion [M+zH]z+ and a drift gas molecule"""
+    ion_mass = mass + charge * PROTON_MASS
+    return ion_mass * gas_mass / (ion_mass + gas_mass)
+
+
+def corrected_drift_time(drift_ms, mass, charge, edc=0.0):
+    """Drift time (ms) minus the m/z-dependent transfer delay, C * sqrt(m/z) / 1000"""
+    mz = (mass + charge * PROTON_MASS) / charge
+    return drift_ms - edc * np.sqrt(mz) / 1000.0
+
+
+class PowerLawCalibration:
+    """ln(CCS / (z * sqrt(1/mu))) = ln(A) + X * ln(t'), fitted by least squares on calibrant apexes"""
+
+    def __init__(self, ln_a, exponent, covariance, residual_std, gas, edc, n_points, r2):
+        self.ln_a = ln_a
+        self.exponent = exponent
+        self.covariance = covariance
+        self.residual_std = residual_std
+        self.gas = gas
+        self.edc = edc
+        self.n_points = n_points
+        self.r2 = r2
+
+    @property
+    def a(self):
+        return float(np.exp(self.ln_a))
+
+    def _design(self, drift_ms, mass, charge):
+        drift_ms, mass, charge = np.broadcast_arrays(np.asarray(drift_ms, dtype=float),
+                                                     np.asarray(mass, dtype=float),
+                                                     np.asarray(charge, dtype=float))
+        t_corr = corrected_drift_time(drift_ms, mass, charge, self.edc)
+        scale = charge * np.sqrt(1 / reduced_mass(mass, charge, GAS_MASSES[self.gas]))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            log_t = np.where(t_corr > 0, np.log(t_corr), np.nan)
+        return log_t, scale
+
+    def predict(self, drift_ms, mass, charge):
+        """CCS (Å²) and its standard deviation for drift times in ms; NaN where t' <= 0"""
+        log_t, scale = self._design(drift_ms, mass, charge)
+        log_ccs_reduced = self.ln_a + self.exponent * log_t
+        ccs = np.exp(log_ccs_reduced) * scale
+
+        # Prediction interval of a new point, propagated from log space by the delta method
+        x = np.stack([np.ones_like(log_t), log_t], axis=-1)
+        leverage = np.einsum("...i,ij,...j->...", x, self.covariance, x)
+        ccs_std = ccs * np.sqrt(self.residual_std ** 2 + leverage)
+        return ccs, ccs_std
+
+    def to_dict(self):
+        return {"ln_a": float(self.ln_a), "exponent": float(self.exponent),
+                "covariance": np.asarray(self.covariance, dtype=float).tolist(),
+                "residual_std": float(self.residual_std), "gas": self.gas, "edc": float(self.edc),
+                "n_points": int(self.n_points), "r2": float(self.r2)}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["ln_a"], data["exponent"], np.array(data["covariance"]), data["residual_std"],
+                   data["gas"], data["edc"], data["n_points"], data["r2"])
+
+    def summary(self):
+        return {"A": self.a, "X": float(self.exponent), "EDC": self.edc, "gas": self.gas,
+                "points": self.n_points, "R²": float(self.r2), "residual (log)": float(self.residual_std)}
+
+
+def calibrant_design(results_df, gas, edc=0.0):
+    """Regression arrays (ln t', ln CCS') for a calibrant results table with CCS in nm²"""
+    mass = results_df["mass"].to_numpy(dtype=float)
+    charge = results_df["charge state"].astype(int).to_numpy(dtype=float)
+    drift_ms = results_df["drift time"].to_numpy(dtype=float)
+    ccs = results_df["calibrant_value"].to_numpy(dtype=float) * 100  # nm² to Å²
+
+    t_corr = corrected_drift_time(drift_ms, mass, charge, edc)
+    ccs_reduced = ccs / (charge * np.sqrt(1 / reduced_mass(mass, charge, GAS_MASSES[gas])))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.log(t_corr), np.log(ccs_reduced)
+
+
+def fit_power_law_calibration(results_df, gas, edc=0.0):
+    """Fit the TWIMS power-law calibration from a calibrant results table (drift time in ms)"""
+    log_t, log_ccs = calibrant_design(results_df, gas, edc)
+    usable = np.isfinite(log_t) & np.isfinite(log_ccs)
+    if usable.sum() < 3:
+        raise ValueError("At least three calibrant points with a positive corrected drift time are needed.")
+
+    x = np.column_stack([np.ones(usable.sum()), log_t[usable]])
+    y = log_ccs[usable]
+    coef, *_ = np.linalg.lstsq(x, y, rcond=None)
+    resid = y - x @ coef
+    dof = max(len(y) - 2, 1)
+    residual_var = resid @ resid / dof
+    covariance = residual_var * np.linalg.inv(x.T @ x)
+    r2 = 1 - (resid @ resid) / np.sum((y - y.mean()) ** 2)
+    return PowerLawCalibration(coef[0], coef[1], covariance, np.sqrt(residual_var), gas, edc, int(usable.sum()), r2)
+
+
+def calibrate_atds(calibration, atds, mass):
+    """Apply a calibration to every point of a sample's ATDs in one pass
+
+    `atds` maps charge state to drift times in ms. Returns the table IMSCal produces:
+    Z, Drift (s), CCS (Å²), CCS Std.Dev.
+    """
+    if not atds:
+        return pd.DataFrame(columns=["Z", "Drift", "CCS", "CCS Std.Dev."])
+    charges = np.concatenate([np.full(len(drift), int(z)) for z, drift in atds.items()])
+    drift_ms = np.concatenate([np.asarray(drift, dtype=float) for drift in atds.values()])
+    ccs, ccs_std = calibration.predict(drift_ms, mass, charges)
+    valid = np.isfinite(ccs)
+    return pd.DataFrame({
+        "Z": charges[valid],
+        "Drift": drift_ms[valid] / 1000.0,
+        "CCS": ccs[valid],
+        "CCS Std.Dev.": ccs_std[valid],
+    })
+
+
+def leave_out_errors(results_df, gas, edc=0.0):
+    """Cross-validated calibrant errors with each ion, and each whole protein, left out of the fit
+
+    Uses the closed-form deletion identities for least squares instead of refitting: leaving out
+    ion i gives residual e_i / (1 - h_ii); leaving out the ion set G of a protein gives
+    (I - H_GG)^-1 e_G, solved for every protein as one batched system. Proteins whose removal
+    leaves fewer than three ions get NaN.
+    """
+    log_t, log_ccs = calibrant_design(results_df, gas, edc)
+    usable = np.isfinite(log_t) & np.isfinite(log_ccs)
+    df = results_df[usable].reset_index(drop=True)
+    x = np.column_stack([np.ones(usable.sum()), log_t[usable]])
+    y = log_ccs[usable]
+    n = len(y)
+
+    xtx_inv = np.linalg.inv(x.T @ x)
+    hat = x @ xtx_inv @ x.T
+    resid = y - hat @ y
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ion_resid = resid / (1 - np.diag(hat))
+
+    # Pad every protein's ion indices to the largest group; padded slots get an identity row
+    codes, proteins = pd.factorize(df["protein"])
+    sizes = np.bincount(codes, minlength=len(proteins))
+    order = np.argsort(codes, kind="stable")
+    slot = np.arange(n) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    members = np.full((len(proteins), sizes.max()), -1)
+    members[codes[order], slot] = order
+    valid = members >= 0
+    safe = np.where(valid, members, 0)
+
+    block = np.eye(sizes.max()) - np.where(valid[:, :, None] & valid[:, None, :],
+                                           hat[safe[:, :, None], safe[:, None, :]], 0.0)
+    block[~valid] = 0
+    block[~valid, np.nonzero(~valid)[1]] = 1
+    rhs = np.where(valid, resid[safe], 0.0)
+    group_resid = np.linalg.pinv(block) @ rhs[..., None]
+    group_resid = group_resid[..., 0]
+    group_resid[n - sizes < 3] = np.nan
+
+    protein_resid = np.empty(n)
+    protein_resid[members[valid]] = group_resid[valid]
+
+    scale = np.exp(y) / df["calibrant_value"].to_numpy(dtype=float) / 100  # reduced CCS per Å²
+    literature = df["calibrant_value"].to_numpy(dtype=float) * 100
+    ion_ccs = np.exp(y - ion_resid) / scale
+    protein_ccs = np.exp(y - protein_resid) / scale
+    return pd.DataFrame({
+        "protein": df["protein"],
+        "charge state": df["charge state"],
+        "literature CCS (Å²)": literature,
+        "leave-ion-out CCS (Å²)": ion_ccs,
+        "leave-ion-out error (%)": 100 * (ion_ccs - literature) / literature,
+        "leave-protein-out CCS (Å²)": protein_ccs,
+        "leave-protein-out error (%)": 100 * (protein_ccs - literature) / literature,
+    })
@@ -0,0 +1,103 @@
+"""Worker-pool execution (ATD fits, file parsing, figure rendering) with results streamed back in input order"""
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ims_tools.atd_fitting import fit_gaussians_batched
+
+# Chunking is fixed (not derived from the worker count) so every mode fits identical batches
+DEFAULT_CHUNK_SIZE = 8
+# Below this many chunks, dispatching to worker processes costs more than fitting on the calling thread
+MIN_PARALLEL_CHUNKS = 16
+
+_POOLS = {}
+_POOL_LOCK = threading.Lock()
+
+
+def default_worker_count():
+    """Number of CPU cores available to this process"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _chunks(items, chunk_size):
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def shared_process_pool(n_workers):
+    """Process-wide pool with `n_workers` workers, reused across calls (and Streamlit reruns)
+
+    Forking a fresh pool per call costs more than small fits take. One pool is kept per size, so a
+    session asking for a different worker count never shuts down a pool other sessions are waiting on;
+    a pool is only replaced once a worker has died, when its outstanding futures have already failed.
+    """
+    with _POOL_LOCK:
+        pool = _POOLS.get(n_workers)
+        if pool is None or getattr(pool, "_broken", False):
+            if pool is not None:
+                pool.shutdown(wait=False)
+            pool = _POOLS[n_workers] = ProcessPoolExecutor(max_workers=n_workers)
+        return pool
+
+
+def _iter_pooled(func, items, n_workers, min_parallel):
+    """func(item) for each item in order: serially below `min_parallel` items or with one usable worker, else on the shared pool
+
+    Requests for more workers than there are cores are capped at the core count; on a single core the
+    pool only adds dispatch overhead, so the work runs on the calling thread.
+    """
+    n_workers = min(n_workers or default_worker_count(), default_worker_count())
+    if n_workers <= 1 or len(items) < max(min_parallel, 2):
+        yield from map(func, items)
+        return
+
+    futures = [shared_process_pool(n_workers).submit(func, item) for item in items]
+    try:
+        for future in futures:
+            yield future.result()
+    finally:
+        # The pool outlives this call; only drop the work nobody will collect
+        for future in futures:
+            future.cancel()
+
+
+def iter_fits(traces, n_workers=None, chunk_size=DEFAULT_CHUNK_SIZE, min_parallel=MIN_PARALLEL_CHUNKS):
+    """Yield (index, (params, r2, fitted_values, flag)) for each (drift_time, intensity) trace, in input order
+
+    Chunks of traces are fitted across the shared process pool; results are yielded as soon as every
+    earlier chunk has finished, so callers can update progress while later chunks are still running.
+    Uploads of fewer than `min_parallel` chunks are fitted on this thread, where they finish sooner.
+    """
+    chunks = _chunks(list(traces), chunk_size)
+    index = 0
+    for chunk_results in _iter_pooled(fit_gaussians_batched, chunks, n_workers, min_parallel):
+        for result in chunk_results:
+            yield index, result
+            index += 1
+
+
+def iter_mapped(func, items, n_workers=None):
+    """Yield func(item) for each item, in input order, across the shared process pool (serially with one worker)
+
+    For CPU-bound work that holds the GIL, such as rendering figures; func and items must be picklable.
+    """
+    yield from _iter_pooled(func, list(items), n_workers, min_parallel=2)
+
+
+def iter_prefetched(func, items, max_in_flight=4, n_threads=None):
+    """Yield func(item) for each item, in order, computing up to `max_in_flight` ahead on threads
+
+    Meant for I/O- and zlib-bound work (parsing uploads, compressing output) so the caller can consume
+    finished results while later ones are still being produced, with bounded memory.
+    """
+    with ThreadPoolExecutor(max_workers=n_threads or min(max_in_flight, default_worker_count() + 1)) as pool:
+        pending = deque()
+        for item in items:
+            pending.append(pool.submit(func, item))
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
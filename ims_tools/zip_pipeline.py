@@ -0,0 +1,63 @@
+"""ZIP archives whose entries are formatted and compressed off the calling thread while it produces the next ones"""
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from ims_tools.workers import default_worker_count
+
+
+def _entry_bytes(data):
+    if callable(data):
+        data = data()
+    return data.encode("utf-8") if isinstance(data, str) else data
+
+
+class PipelinedZipWriter:
+    """Write ZIP entries in submission order through zipfile, keeping up to `max_in_flight` of them in progress
+
+    `add` accepts bytes, str or a zero-argument callable returning either; callables (e.g. CSV formatting)
+    run on worker threads. A single writer thread then adds each entry with ZipFile.writestr, so deflate
+    also runs off the calling thread (zlib releases the GIL) while entries land in order. Once
+    `max_in_flight` entries are pending, `add` waits for the oldest, which bounds the memory they hold.
+    Level 0 stores entries uncompressed.
+    """
+
+    def __init__(self, fileobj, level=1, max_in_flight=4, n_threads=None):
+        self.level = level
+        self.max_in_flight = max_in_flight
+        compression = zipfile.ZIP_STORED if level == 0 else zipfile.ZIP_DEFLATED
+        self._zip = zipfile.ZipFile(fileobj, "w", compression, compresslevel=level or None)
+        self._formatters = ThreadPoolExecutor(max_workers=n_threads or min(max_in_flight, default_worker_count() + 1))
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._pending = deque()
+
+    def _write(self, name, formatted):
+        self._zip.writestr(name, formatted.result())
+
+    def add(self, name, data):
+        formatted = self._formatters.submit(_entry_bytes, data)
+        self._pending.append(self._writer.submit(self._write, name, formatted))
+        while len(self._pending) >= self.max_in_flight:
+            self._pending.popleft().result()
+
+    def _shutdown(self):
+        # Waits for the writer thread to go idle before the central directory is written
+        self._formatters.shutdown(cancel_futures=True)
+        self._writer.shutdown(cancel_futures=True)
+        self._zip.close()
+
+    def close(self):
+        try:
+            while self._pending:
+                self._pending.popleft().result()
+        finally:
+            self._shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._shutdown()
@@ -1,11 +1,17 @@
-import os
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
 import io
-import zipfile
+import hashlib
 import streamlit as st
+from ims_tools.archive import session_archive
+from ims_tools.atd_fitting import FIT_SETTINGS
+from ims_tools.calibrants import BUSH_CSV, CalibrantLibrary, bush_library
+from ims_tools.decimate import minmax_decimate
+from ims_tools.fit_cache import ATD_FIT_CACHE
+from ims_tools.registry import calibrant_set, find_calibrations, instrument_settings, save_calibration
+from ims_tools.twims_calibration import fit_power_law_calibration, leave_out_errors
+from ims_tools.workers import default_worker_count, iter_fits
 
 # === PAGE CONFIGURATION ===
 st.set_page_config(
@@ -306,147 +312,176 @@ st.markdown('<h3 class="section-header">Calibrant Folder Naming Convention</h3>'
 st.table(df)
 st.markdown('</div>', unsafe_allow_html=True)
 
-# Function to handle ZIP file upload and extract folder names
+# Function to read the uploaded ZIP in memory, kept in this session until a different file is uploaded
 def handle_zip_upload(uploaded_file):
-    temp_dir = '/tmp/extracted_zip/'
-    os.makedirs(temp_dir, exist_ok=True)
-
-    with zipfile.ZipFile(uploaded_file, 'r') as zip_ref:
-        zip_ref.extractall(temp_dir)
-
-    folders = [f for f in os.listdir(temp_dir) if os.path.isdir(os.path.join(temp_dir, f))]
+    archive = session_archive(st.session_state, 'calibrant_archive', uploaded_file)
+    folders = list(archive.folders)
     if not folders:
         st.error("No folders found in the ZIP file.")
-    return folders, temp_dir
+    return folders, archive
 
 with st.expander("Help it isn't working :("):
     st.write("The script is only looking inside the first layer of the zipped folder for protein names - if you saved the protein folders inside another folder before zipping then the script can't see them.")
+    st.write("Folder names are matched to the database ignoring case, spaces and punctuation, so 'Cytochrome C' and 'cytochromec' are the same calibrant.")
     st.write("Check if the sample data (on Ana's github) works - if it doesn't, then Ana has broken the website.")
 
-# Read the bush.csv file from the same folder as calibrant.py
-def read_bush_csv():
-    calibrant_file_path = os.path.join(os.path.dirname(__file__), '../data/bush.csv')
-    if os.path.exists(calibrant_file_path):
-        bush_df = pd.read_csv(calibrant_file_path)
-    else:
-        st.error(f"'{calibrant_file_path}' not found. Make sure 'bush.csv' is in the same directory as the script.")
-        bush_df = pd.DataFrame()  # Empty DataFrame if the file isn't found
-    return bush_df
-
-# Gaussian fit function
-def gaussian(x, amp, mean, stddev):
-    return amp * np.exp(-((x - mean) ** 2) / (2 * stddev ** 2))
-
-# R² Calculation
-def r_squared(y_true, y_pred):
-    ss_res = np.sum((y_true - y_pred) ** 2)
-    ss_tot = np.sum((y_true - np.mean(y_true)) ** 2)
-    return 1 - (ss_res / ss_tot)
-
-# Fit Gaussian and retry with different initial guesses
-def fit_gaussian_with_retries(drift_time, intensity, n_attempts=10):
-    best_r2 = -np.inf
-    best_params = None
-    best_fitted_values = None
-
-    for _ in range(n_attempts):
-        initial_guess = [
-            np.random.uniform(0.8 * max(intensity), 1.2 * max(intensity)),
-            np.random.uniform(np.min(drift_time), np.max(drift_time)),
-            np.random.uniform(0.1 * np.std(drift_time), 2 * np.std(drift_time))
-        ]
-
+# Load the Bush database (indexed once per process) and merge in any user-supplied reference sets
+def load_calibrant_library(reference_files):
+    try:
+        library = bush_library()
+    except FileNotFoundError:
+        st.error(f"'{BUSH_CSV}' not found. Make sure 'bush.csv' is in the data folder.")
+        return None
+    extra_sets = []
+    for file in reference_files or []:
         try:
-            params, _ = curve_fit(gaussian, drift_time, intensity, p0=initial_guess)
-            fitted_values = gaussian(drift_time, *params)
-            r2 = r_squared(intensity, fitted_values)
-
-            if r2 > best_r2:
-                best_r2 = r2
-                best_params = params
-                best_fitted_values = fitted_values
-        except RuntimeError:
-            continue
-
-    return best_params, best_r2, best_fitted_values
-
-# Function to process each folder and extract data from .txt files
-def process_folder_data(folder_name, base_path, bush_df, calibrant_type):
-    folder_path = os.path.join(base_path, folder_name)
+            extra_sets.append(load_reference_set(file.getvalue(), file.name))
+        except ValueError as e:
+            st.error(f"Could not use {file.name}: {e}")
+    return library.merge(*extra_sets)
+
+# Parse an uploaded reference CSV once per process, keyed by its content
+@st.cache_resource(max_entries=16)
+def load_reference_set(data, name):
+    return CalibrantLibrary.from_csv(io.BytesIO(data), source=name)
+
+# Function to match the fitted ATDs of one folder against the calibrant database
+def process_folder_data(folder_name, filenames, traces, fits, library, calibrant_type):
     results = []
     plots = []
     skipped_entries = []
+    flagged = []
 
-    # Determine the column for the selected calibrant type
-    calibrant_column = 'CCS_he' if calibrant_type == 'Helium' else 'CCS_n2'
-
-    # Iterate through each file in the folder
-    for filename in os.listdir(folder_path):
-        if filename.endswith('.txt') and filename[0].isdigit():  # Only process .txt files
-            file_path = os.path.join(folder_path, filename)
-
-            data = np.loadtxt(file_path)
-            drift_time = data[:, 0]
-            intensity = data[:, 1]
+    # Folder names are matched ignoring case, spaces and punctuation
+    protein = library.resolve(folder_name)
 
-            # Perform Gaussian fit
-            params, r2, fitted_values = fit_gaussian_with_retries(drift_time, intensity)
-            if params is not None:
-                amp, apex, stddev = params
-                charge_state = filename.split('.')[0]
-                
-                # Look up the calibrant data from bush.csv based on protein and charge state
-                calibrant_row = bush_df[(bush_df['protein'] == folder_name) & (bush_df['charge'] == int(charge_state))]
+    for filename, (drift_time, intensity), (params, r2, fitted_values, flag) in zip(filenames, traces, fits):
+        if params is not None:
+            amp, apex, stddev = params
+            charge_state = filename.split('.')[0]
+            
+            # Look up the calibrant data based on protein and charge state
+            entry = library.lookup(protein, charge_state) if protein is not None else None
+            
+            if entry is not None:
+                calibrant_value = entry.ccs_he if calibrant_type == 'Helium' else entry.ccs_n2
+                mass = entry.mass
                 
-                if not calibrant_row.empty:
-                    calibrant_value = calibrant_row[calibrant_column].values[0]
-                    mass = calibrant_row['mass'].values[0]
-                    
-                    # Only add to results if calibrant_value is not None/NaN
-                    if pd.notna(calibrant_value) and calibrant_value is not None:
-                        results.append([folder_name, mass, charge_state, apex, r2, calibrant_value])
-                        plots.append((drift_time, intensity, fitted_values, filename, apex, r2))
-                    else:
-                        skipped_entries.append(f"{folder_name} charge {charge_state} - no {calibrant_type.lower()} CCS value available")
+                # Only add to results if calibrant_value is not None/NaN
+                if pd.notna(calibrant_value) and calibrant_value is not None:
+                    results.append([folder_name, mass, charge_state, apex, r2, calibrant_value])
+                    plots.append((drift_time, intensity, fitted_values, filename, apex, r2))
                 else:
-                    skipped_entries.append(f"{folder_name} charge {charge_state} - not found in database")
+                    skipped_entries.append(f"{folder_name} charge {charge_state} - no {calibrant_type.lower()} CCS value available")
             else:
-                skipped_entries.append(f"{folder_name} charge {filename.split('.')[0]} - Gaussian fit failed")
+                skipped_entries.append(f"{folder_name} charge {charge_state} - not found in database")
+        elif flag:
+            flagged.append([folder_name, filename.split('.')[0], flag])
+        else:
+            skipped_entries.append(f"{folder_name} charge {filename.split('.')[0]} - Gaussian fit failed")
 
     # Convert results to DataFrame
     results_df = pd.DataFrame(results, columns=['protein', 'mass', 'charge state', 'drift time', 'r2', 'calibrant_value'])
 
-    return results_df, plots, skipped_entries
+    return results_df, plots, skipped_entries, flagged
+
+THUMBNAIL_DPI = 100
+
+# Render one fit as a small PNG, cached by fit hash so paging back and forth is free
+@st.cache_data(max_entries=512, show_spinner=False)
+def render_fit_thumbnail(fit_hash, _drift_time, _intensity, _fitted_values, title):
+    fig, ax = plt.subplots(figsize=(4, 3), dpi=THUMBNAIL_DPI)
+    # Raw points are decimated to the thumbnail's pixel width; peak maxima are kept
+    x, y = minmax_decimate(_drift_time, _intensity, 4 * THUMBNAIL_DPI)
+    ax.plot(x, y, 'b.', label='Raw Data', markersize=3)
+    x, y = minmax_decimate(_drift_time, _fitted_values, 4 * THUMBNAIL_DPI)
+    ax.plot(x, y, 'r-', label='Gaussian Fit', linewidth=1)
+    ax.set_title(title, fontsize=9)
+    ax.set_xlabel('Drift Time')
+    ax.set_ylabel('Intensity')
+    ax.legend(fontsize=7)
+    ax.grid()
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    plt.close(fig)
+    return buffer.getvalue()
+
+def fit_hash(drift_time, intensity, fitted_values):
+    digest = hashlib.sha1()
+    for array in (drift_time, intensity, fitted_values):
+        digest.update(np.ascontiguousarray(array, dtype=float).tobytes())
+    return digest.hexdigest()
+
+# Full-resolution sheet of every fit, only built when the user asks to export it
+def render_fit_sheet(plots):
+    n_cols = 3
+    n_rows = (len(plots) + n_cols - 1) // n_cols
+
+    fig = plt.figure(figsize=(12, 4 * n_rows))
+    for i, (drift_time, intensity, fitted_values, filename, apex, r2) in enumerate(plots):
+        ax = fig.add_subplot(n_rows, n_cols, i + 1)
+        ax.plot(drift_time, intensity, 'b.', label='Raw Data', markersize=3)
+        ax.plot(drift_time, fitted_values, 'r-', label='Gaussian Fit', linewidth=1)
+        ax.set_title(f'{filename}\nApex: {apex:.2f}, R²: {r2:.3f}')
+        ax.set_xlabel('Drift Time')
+        ax.set_ylabel('Intensity')
+        ax.legend()
+        ax.grid()
+
+    fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    plt.close(fig)
+    return buffer.getvalue()
+
+# Paginated gallery of fit thumbnails; only the visible page is rendered
+def show_fit_gallery(plots):
+    n_cols = 3
+    col1, col2 = st.columns(2)
+    with col1:
+        per_page = st.selectbox("Fits per page", options=[6, 9, 12, 24], index=1)
+    n_pages = (len(plots) + per_page - 1) // per_page
+    with col2:
+        page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+
+    visible = plots[(page - 1) * per_page:page * per_page]
+    for row_start in range(0, len(visible), n_cols):
+        for col, (drift_time, intensity, fitted_values, filename, apex, r2) in zip(st.columns(n_cols), visible[row_start:row_start + n_cols]):
+            with col:
+                st.image(render_fit_thumbnail(fit_hash(drift_time, intensity, fitted_values),
+                                              drift_time, intensity, fitted_values,
+                                              f'{filename}\nApex: {apex:.2f}, R²: {r2:.3f}'))
+
+    if st.button("🖼️ Prepare full-resolution sheet of all fits"):
+        st.download_button(
+            label="📥 Download Fit Sheet (PNG)",
+            data=render_fit_sheet(plots),
+            file_name="gaussian_fits.png",
+            mime="image/png"
+        )
 
 # Function to display the data and plots
-def display_results(results_df, plots, skipped_entries):
+def display_results(results_df, plots, skipped_entries, flagged):
     if not results_df.empty:
         st.markdown('<h3 class="section-header">Gaussian Fit Results</h3>', unsafe_allow_html=True)
         st.dataframe(results_df)
         st.markdown('</div>', unsafe_allow_html=True)
 
-        # Plot all the fits
-        n_plots = len(plots)
-        if n_plots > 0:
-            n_cols = 3
-            n_rows = (n_plots + n_cols - 1) // n_cols
-
-            plt.figure(figsize=(12, 4 * n_rows))
-            for i, (drift_time, intensity, fitted_values, filename, apex, r2) in enumerate(plots):
-                plt.subplot(n_rows, n_cols, i + 1)
-                plt.plot(drift_time, intensity, 'b.', label='Raw Data', markersize=3)
-                plt.plot(drift_time, fitted_values, 'r-', label='Gaussian Fit', linewidth=1)
-                plt.title(f'{filename}\nApex: {apex:.2f}, R²: {r2:.3f}')
-                plt.xlabel('Drift Time')
-                plt.ylabel('Intensity')
-                plt.legend()
-                plt.grid()
-
-            plt.tight_layout()
-            st.pyplot(plt)
+        # Plot the fits one gallery page at a time
+        if plots:
+            show_fit_gallery(plots)
     else:
         st.markdown('<div class="warning-card">No valid calibrant data found that matches the database.</div>', unsafe_allow_html=True)
 
+    # ATDs the peak checks refused to fit are listed on their own, so none drop out of the calibration unnoticed
+    if flagged:
+        st.markdown('<div class="section-card">', unsafe_allow_html=True)
+        st.markdown(f'<h3 class="section-header">🚩 {len(flagged)} ATDs Not Fitted</h3>', unsafe_allow_html=True)
+        st.markdown('<div class="warning-card">These ATDs look saturated (a flat top at the detector ceiling) or multimodal, so they were left out of the calibration. Check them before relying on the result.</div>', unsafe_allow_html=True)
+        st.dataframe(pd.DataFrame(flagged, columns=['protein', 'charge state', 'reason']), hide_index=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+
     # Show skipped entries if any
     if skipped_entries:
         st.markdown('<div class="section-card">', unsafe_allow_html=True)
@@ -476,6 +511,71 @@ def generate_dat_file(results_df, velocity, voltage, pressure, length):
     
     return dat_content
 
+# Fit the power-law TWIMS calibration in-app and keep it in the session for the sample pages
+def calibration_section(adjusted_df, calibrant_type, settings):
+    st.markdown('<div class="section-card">', unsafe_allow_html=True)
+    st.markdown('<h3 class="section-header">📐 In-app Calibration</h3>', unsafe_allow_html=True)
+    st.markdown("Instead of running IMSCal, you can fit the TWIMS power-law calibration (ln of reduced CCS against ln of corrected drift time) here. It is kept for this session, so on 'Get Input Files' you can then calibrate your sample ATDs directly and skip IMSCal and 'Process Output Files'.")
+
+    edc = st.number_input("EDC delay coefficient (leave at 0 to skip the m/z-dependent transfer time correction)", min_value=0.0, value=0.0, step=0.01)
+    try:
+        calibration = fit_power_law_calibration(adjusted_df, calibrant_type, edc)
+    except ValueError as e:
+        st.markdown(f'<div class="warning-card">{e}</div>', unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
+        return
+
+    st.session_state['twims_calibration'] = calibration
+    st.table(pd.DataFrame([calibration.summary()]))
+
+    predicted, predicted_std = calibration.predict(adjusted_df['drift time'], adjusted_df['mass'],
+                                                   adjusted_df['charge state'].astype(int))
+    literature = adjusted_df['calibrant_value'].astype(float) * 100
+    check_df = pd.DataFrame({
+        'protein': adjusted_df['protein'],
+        'charge state': adjusted_df['charge state'],
+        'literature CCS (Å²)': literature,
+        'calibrated CCS (Å²)': predicted,
+        'CCS Std.Dev.': predicted_std,
+        'error (%)': 100 * (predicted - literature) / literature,
+    })
+    st.dataframe(check_df)
+
+    # Cross-validation: spot calibrants that the rest of the set does not agree with
+    with st.expander("🔍 Leave-one-out calibrant check"):
+        cv_df = leave_out_errors(adjusted_df, calibrant_type, edc)
+        ion_rms = np.sqrt(np.nanmean(cv_df['leave-ion-out error (%)'] ** 2))
+        protein_rms = np.sqrt(np.nanmean(cv_df['leave-protein-out error (%)'] ** 2))
+        st.write(f"RMS error with each ion left out: **{ion_rms:.2f} %**, with each protein left out: **{protein_rms:.2f} %**")
+
+        labels = [f"{protein} {charge}+" for protein, charge in zip(cv_df['protein'], cv_df['charge state'])]
+        positions = np.arange(len(labels))
+        fig, ax = plt.subplots(figsize=(max(6, 0.25 * len(labels)), 3.5))
+        ax.bar(positions - 0.2, cv_df['leave-ion-out error (%)'], width=0.4, label='Ion left out')
+        ax.bar(positions + 0.2, cv_df['leave-protein-out error (%)'], width=0.4, label='Protein left out')
+        ax.axhline(0, color='black', linewidth=0.8)
+        ax.set_xticks(positions)
+        ax.set_xticklabels(labels, rotation=90, fontsize=7)
+        ax.set_ylabel('Predicted vs literature CCS (%)')
+        ax.legend()
+        fig.tight_layout()
+        st.pyplot(fig)
+        plt.close(fig)
+        st.dataframe(cv_df)
+
+    # Keep the calibration for later sessions, keyed by instrument settings and calibrant set
+    errors = check_df['error (%)'].abs()
+    diagnostics = {'max_abs_error_pct': float(errors.max()), 'mean_abs_error_pct': float(errors.mean()), **calibration.summary()}
+    if st.button("💾 Save calibration to the registry"):
+        save_calibration(calibration, settings, calibrant_set(adjusted_df), diagnostics)
+        st.success("Saved - 'Get Input Files' can now use this calibration in any later session.")
+    existing = find_calibrations(**settings)
+    if existing:
+        st.caption(f"{len(existing)} saved calibration(s) match these instrument settings; the newest is from {existing[0]['saved']}.")
+
+    st.markdown('<div class="success-card">Calibration saved for this session - go to \'Get Input Files\' to apply it to your samples.</div>', unsafe_allow_html=True)
+    st.markdown('</div>', unsafe_allow_html=True)
+
 def calibrate_page():
     # Step 1: Upload ZIP file
     st.markdown('<h3 class="section-header">📁 Upload Calibrant Data</h3>', unsafe_allow_html=True)
@@ -484,12 +584,16 @@ def calibrate_page():
     
     if uploaded_zip_file is not None:
         # Extract the folders from the ZIP file
-        folders, temp_dir = handle_zip_upload(uploaded_zip_file)
+        folders, archive = handle_zip_upload(uploaded_zip_file)
 
-        # Step 2: Read bush.csv for calibrant data
-        bush_df = read_bush_csv()
+        # Step 2: Load the calibrant reference library
+        reference_files = st.file_uploader(
+            "Optional: extra calibrant reference CSVs (columns protein, charge, mass, CCS_he, CCS_n2 - e.g. a polyalanine series); these override Bush values for the same protein and charge",
+            type="csv", accept_multiple_files=True
+        )
+        library = load_calibrant_library(reference_files)
 
-        if bush_df.empty:
+        if library is None:
             st.markdown('<div class="error-card">Cannot proceed without the Bush calibrant database.</div>', unsafe_allow_html=True)
             return
 
@@ -521,27 +625,77 @@ def calibrate_page():
         all_results_df = pd.DataFrame(columns=['protein', 'mass', 'charge state', 'drift time', 'r2', 'calibrant_value'])
         all_plots = []
         all_skipped = []
+        all_flagged = []
 
         st.markdown('<div class="section-card">', unsafe_allow_html=True)
         st.markdown('<h3 class="section-header">🔬 Processing Results</h3>', unsafe_allow_html=True)
-        
+
+        n_workers = st.number_input(
+            "Worker processes for fitting (1 fits everything on this thread)",
+            min_value=1, max_value=default_worker_count(), value=default_worker_count()
+        )
+
+        # Fits are cached by upload content, so widget changes only redo the database lookup and export
+        jobs = [(folder, filename) for folder in folders for filename in archive.atd_files(folder)]
+        keys = [ATD_FIT_CACHE.key(archive.content_hash, f"{folder}/{filename}", FIT_SETTINGS) for folder, filename in jobs]
+        atds = [ATD_FIT_CACHE.get(key) for key in keys]
+        to_fit = [i for i, atd in enumerate(atds) if atd is None]
+
+        if to_fit:
+            traces = [archive.read_atd(*jobs[i]) for i in to_fit]
+            progress_bar = st.progress(0)
+            status_text = st.empty()
+            live_table = st.empty()
+            live_rows = []
+
+            # Fits arrive in upload order, so the table and progress bar fill in deterministically
+            for n, fit in iter_fits(traces, n_workers=int(n_workers)):
+                i = to_fit[n]
+                atds[i] = (traces[n], fit)
+                ATD_FIT_CACHE.put(keys[i], atds[i])
+                folder, filename = jobs[i]
+                params, r2, _, _ = fit
+                live_rows.append([folder, filename.split('.')[0],
+                                  params[1] if params is not None else np.nan,
+                                  r2 if params is not None else np.nan])
+                progress_bar.progress((n + 1) / len(to_fit))
+                status_text.text(f"Fitted {n + 1} of {len(to_fit)} ATDs ({folder}, {filename})")
+                if (n + 1) % 8 == 0 or n + 1 == len(to_fit):
+                    live_table.dataframe(pd.DataFrame(live_rows, columns=['protein', 'charge state', 'drift time', 'r2']))
+            live_table.empty()
+
+        if len(to_fit) < len(jobs):
+            st.caption(f"Reused {len(jobs) - len(to_fit)} cached fits from this upload.")
+
         for folder in folders:
             st.write(f"Processing folder: **{folder}**")
-            results_df, plots, skipped_entries = process_folder_data(folder, temp_dir, bush_df, calibrant_type)
+            folder_jobs = [i for i, (job_folder, _) in enumerate(jobs) if job_folder == folder]
+            filenames = [jobs[i][1] for i in folder_jobs]
+            traces = [atds[i][0] for i in folder_jobs]
+            folder_fits = [atds[i][1] for i in folder_jobs]
+            results_df, plots, skipped_entries, flagged = process_folder_data(folder, filenames, traces, folder_fits, library, calibrant_type)
             all_results_df = pd.concat([all_results_df, results_df], ignore_index=True)
             all_plots.extend(plots)
             all_skipped.extend(skipped_entries)
+            all_flagged.extend(flagged)
 
         st.markdown('</div>', unsafe_allow_html=True)
 
         # Step 6: Display results
-        display_results(all_results_df, all_plots, all_skipped)
+        display_results(all_results_df, all_plots, all_skipped, all_flagged)
 
         # Only show download options if we have valid results
         if not all_results_df.empty:
             st.markdown('<div class="section-card">', unsafe_allow_html=True)
             st.markdown('<h3 class="section-header">📥 Download Results</h3>', unsafe_allow_html=True)
             
+            # Step 8: Prepare adjusted drift times for .dat file if cyclic
+            if data_type.lower() == "cyclic":
+                adjusted_df = all_results_df.copy()
+                adjusted_df['drift time'] = adjusted_df['drift time'] - inject_time
+            else:
+                adjusted_df = all_results_df
+
             col1, col2 = st.columns(2)
             
             with col1:
@@ -556,13 +710,6 @@ def calibrate_page():
                 )
 
             with col2:
-                # Step 8: Prepare adjusted drift times for .dat file if cyclic
-                if data_type.lower() == "cyclic":
-                    adjusted_df = all_results_df.copy()
-                    adjusted_df['drift time'] = adjusted_df['drift time'] - inject_time
-                else:
-                    adjusted_df = all_results_df
-
                 # Step 9: .dat file download
                 dat_file_content = generate_dat_file(adjusted_df, velocity, voltage, pressure, length)
                 if dat_file_content:
@@ -574,6 +721,10 @@ def calibrate_page():
                     )
             
             st.markdown('</div>', unsafe_allow_html=True)
+
+            # Step 10: Optional in-app calibration instead of the IMSCal round trip
+            settings = instrument_settings(velocity, voltage, pressure, length, calibrant_type, data_type, inject_time)
+            calibration_section(adjusted_df, calibrant_type, settings)
         else:
             st.markdown('<div class="error-card">No valid results to download. Please check your data and database matching.</div>', unsafe_allow_html=True)
 
@@ -1,11 +1,14 @@
-import os
 import io
 import zipfile
-import numpy as np
 import pandas as pd
 import streamlit as st
-from pathlib import Path
-from tempfile import TemporaryDirectory
+from ims_tools.archive import session_archive
+from ims_tools.fit_cache import content_hash
+from ims_tools.input_files import read_sample_atds, write_sample_inputs
+from ims_tools.manifest import INSTRUMENTS, fill_sample_defaults, read_manifest, resolve_manifest
+from ims_tools.registry import entry_calibration, entry_label, find_calibrations
+from ims_tools.twims_calibration import calibrate_atds
+from ims_tools.workers import iter_prefetched
 
 # === PAGE CONFIGURATION ===
 st.set_page_config(
@@ -285,97 +288,69 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 def handle_zip_upload(uploaded_file):
-    temp_dir = '/tmp/samples_extracted/'
-    
-    if os.path.exists(temp_dir):
-        for root, dirs, files in os.walk(temp_dir, topdown=False):
-            for name in files:
-                os.remove(os.path.join(root, name))
-            for name in dirs:
-                os.rmdir(os.path.join(root, name))
-
-    os.makedirs(temp_dir, exist_ok=True)
-
-    with zipfile.ZipFile(uploaded_file, 'r') as zip_ref:
-        zip_ref.extractall(temp_dir)
-
-    folders = [f for f in os.listdir(temp_dir) if os.path.isdir(os.path.join(temp_dir, f))]
+    archive = session_archive(st.session_state, 'sample_archive', uploaded_file)
+    folders = list(archive.folders)
     if not folders:
         st.markdown('<div class="error-card">No folders found in the ZIP file.</div>', unsafe_allow_html=True)
-        return [], temp_dir
-    return folders, temp_dir
-
-
-def process_sample_folder(folder_name, folder_path, mass, drift_mode, inject_time=None):
-    sample_output = io.BytesIO()
-    dat_files = {}
-    processed_files = []
-    failed_files = []
-
-    output_folder = os.path.join(folder_path, folder_name)
-    os.makedirs(output_folder, exist_ok=True)
-
-    sample_folder_path = os.path.join(folder_path, folder_name)
-    
-    if not os.path.exists(sample_folder_path):
-        return output_folder, processed_files, failed_files
-
-    for filename in os.listdir(sample_folder_path):
-        if filename.endswith('.txt') and filename[0].isdigit():
-            file_path = os.path.join(sample_folder_path, filename)
-            
-            try:
-                data = np.loadtxt(file_path)
-                
-                # Handle case where file might have different structure
-                if data.ndim == 1:
-                    st.warning(f"File {filename} in {folder_name} appears to have only one column. Expected two columns (drift_time, intensity).")
-                    failed_files.append(f"{filename} - insufficient data columns")
-                    continue
-                
-                if data.shape[1] < 2:
-                    st.warning(f"File {filename} in {folder_name} has fewer than 2 columns. Expected (drift_time, intensity).")
-                    failed_files.append(f"{filename} - insufficient data columns")
-                    continue
-
-                drift_time = data[:, 0]
-                intensity = data[:, 1]
-
-                if drift_mode == "Cyclic" and inject_time is not None:
-                    drift_time = drift_time - inject_time
-
-                drift_time = np.maximum(drift_time, 0)  # avoid negative times
-
-                index = np.arange(len(drift_time))
-                df = pd.DataFrame({
-                    "index": index,
-                    "mass": mass,
-                    "charge": filename[:-4],
-                    "intensity": intensity,
-                    "drift_time": drift_time
-                })
-
-                dat_filename = f"input_{os.path.splitext(filename)[0]}.dat"
-                dat_path = os.path.join(output_folder, dat_filename)
-                df.to_csv(dat_path, sep=' ', index=False, header=False)
-                processed_files.append(filename)
-                
-            except Exception as e:
-                st.warning(f"Error processing file {filename} in {folder_name}: {str(e)}")
-                failed_files.append(f"{filename} - {str(e)}")
-    
-    return output_folder, processed_files, failed_files
+    return folders, archive
+
+
+# Parse samples on helper threads while finished ones are written, yielding (sample, atds, failed_files) in order
+def iter_sample_atds(archive, sample_settings):
+    def read(sample):
+        drift_mode, inject_time = sample_settings[sample]
+        return (sample, *read_sample_atds(archive, sample, drift_mode, inject_time))
+    return iter_prefetched(read, list(sample_settings))
+
+
+# One row per sample folder, pre-filled from the manifest (validated against the ZIP in one pass).
+# Instrument/inject time cells the manifest leaves blank stay blank here and take the page settings after editing.
+def load_sample_table(manifest_file, sample_folders):
+    manifest = None
+    if manifest_file is not None:
+        try:
+            manifest = read_manifest(manifest_file)
+        except Exception as e:
+            st.markdown(f'<div class="error-card">Could not read the manifest: {e}</div>', unsafe_allow_html=True)
+    samples, issues = resolve_manifest(manifest, sample_folders)
+    if manifest is not None:
+        n_filled = int((samples["mass_source"] != "").sum())
+        st.write(f"Manifest filled masses for **{n_filled}** of {len(samples)} samples.")
+    return samples, issues
+
+
+# Convert a sample's ATDs straight to CCS with the calibration fitted on the 'Calibrate' page
+def calibrate_sample_folder(atds, mass, calibration):
+    drift_times = {int(filename[:-4]): drift_time for filename, (drift_time, _) in atds.items()}
+    return calibrate_atds(calibration, drift_times, mass)
+
+# Offer the in-app calibrated tables for download, one CSV per protein as 'Process Output Files' makes
+def show_calibrated_tables(calibrated_tables, all_failed_files):
+    total_failed = sum(len(files) for files in all_failed_files.values())
+    if not calibrated_tables:
+        st.markdown('<div class="error-card">No files were successfully calibrated. Please check your data format and try again.</div>', unsafe_allow_html=True)
+        return
+
+    st.markdown('<div class="success-card">', unsafe_allow_html=True)
+    st.write(f"✅ **Calibrated {len(calibrated_tables)} samples!**")
+    if total_failed > 0:
+        st.write(f"• Failed to process: **{total_failed}** files")
+    st.markdown('</div>', unsafe_allow_html=True)
 
-def generate_output_zip(sample_folders_paths):
+    st.markdown('<div class="section-card">', unsafe_allow_html=True)
+    st.markdown('<h3 class="section-header">📥 Download Calibrated Data</h3>', unsafe_allow_html=True)
+    st.write("Unzip this and upload the CSVs to 'Calibrate ATDs' - no need for IMSCal or 'Process Output Files'.")
     zip_buffer = io.BytesIO()
     with zipfile.ZipFile(zip_buffer, "w") as zipf:
-        for sample_folder in sample_folders_paths:
-            for root, _, files in os.walk(sample_folder):
-                for file in files:
-                    full_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(full_path, os.path.dirname(sample_folder))
-                    zipf.write(full_path, arcname=relative_path)
-    return zip_buffer
+        for protein_name, calibrated_df in calibrated_tables.items():
+            zipf.writestr(f"{protein_name}.csv", calibrated_df.to_csv(index=False))
+    st.download_button(
+        label="📦 Download Calibrated CSV Files (ZIP)",
+        data=zip_buffer.getvalue(),
+        file_name="calibrated_ccs_tables.zip",
+        mime="application/zip"
+    )
+    st.markdown('</div>', unsafe_allow_html=True)
 
 # Main Streamlit app
 def generate_input_dat_files_app():
@@ -387,7 +362,7 @@ def generate_input_dat_files_app():
     st.markdown('</div>', unsafe_allow_html=True)
 
     if uploaded_zip_file is not None:
-        sample_folders, base_path = handle_zip_upload(uploaded_zip_file)
+        sample_folders, archive = handle_zip_upload(uploaded_zip_file)
         
         if not sample_folders:
             return
@@ -399,47 +374,91 @@ def generate_input_dat_files_app():
         inject_time = None
         if drift_mode == "Cyclic":
             inject_time = st.number_input("Enter inject time to subtract (ms)", min_value=0.0, value=12.0)
+
+        # A calibration fitted on the 'Calibrate' page this session, or one saved earlier, can be applied directly
+        calibration = st.session_state.get('twims_calibration')
+        saved_calibrations = find_calibrations(data_type=drift_mode)
+        if saved_calibrations:
+            with st.expander(f"📚 Use a saved calibration ({len(saved_calibrations)} for {drift_mode})"):
+                labels = [entry_label(entry) for entry in saved_calibrations]
+                choice = st.selectbox("Saved calibrations", options=["(none)"] + labels)
+                if choice != "(none)":
+                    entry = saved_calibrations[labels.index(choice)]
+                    calibration = entry_calibration(entry)
+                    if drift_mode == "Cyclic":
+                        st.write(f"This calibration was fitted with an inject time of {entry['settings']['inject_time']} ms.")
+        output_mode = "IMSCal input files"
+        if calibration is not None:
+            output_mode = st.radio(
+                "What would you like to generate?",
+                options=["IMSCal input files", "Calibrated CCS tables (in-app calibration)"],
+                help="The in-app calibration produces the same Z, Drift, CCS, CCS Std.Dev. tables as 'Process Output Files', without running IMSCal."
+            )
         
-        st.markdown('</div>', unsafe_allow_html=True)
+        combined_inputs = False
+        if output_mode == "IMSCal input files":
+            combined_inputs = st.checkbox(
+                "Write one combined input file per sample",
+                help="Stacks every charge state of a sample into input_all.dat (the charge column tells them apart) instead of one input_X.dat per charge state."
+            )
 
-        all_sample_paths = []
+        st.markdown('</div>', unsafe_allow_html=True)
 
         st.markdown('<div class="section-card">', unsafe_allow_html=True)
         st.markdown('<h3 class="section-header">🧬 Sample Information</h3>', unsafe_allow_html=True)
-        st.write("Enter the molecular mass (Da) for each sample protein:")
+        st.write("Enter the molecular mass (Da) for each sample protein, or upload a manifest to fill the table in.")
+        manifest_file = st.file_uploader(
+            "Optional sample manifest (CSV)", type="csv",
+            help="Columns: folder, mass, sequence, instrument, inject_time. Only 'folder' is required; a sequence is used to compute the average mass when no mass is given, and blank instrument/inject time cells use the settings above."
+        )
+        samples, manifest_issues = load_sample_table(manifest_file, sample_folders)
+        if not manifest_issues.empty:
+            with st.expander(f"⚠️ {len(manifest_issues)} manifest rows could not be used"):
+                st.dataframe(manifest_issues, hide_index=True, use_container_width=True)
 
         with st.form("sample_mass_form"):
-            sample_mass_map = {}
-            
-            # Create columns for better layout
-            if len(sample_folders) > 1:
-                cols = st.columns(min(3, len(sample_folders)))
-                for i, sample in enumerate(sample_folders):
-                    with cols[i % len(cols)]:
-                        st.markdown(f'<div class="protein-card">', unsafe_allow_html=True)
-                        st.markdown(f'<strong>{sample}</strong>')
-                        mass = st.number_input(f"Mass (Da)", min_value=0.0, key=sample, label_visibility="collapsed")
-                        sample_mass_map[sample] = mass
-                        st.markdown('</div>', unsafe_allow_html=True)
-            else:
-                for sample in sample_folders:
-                    st.markdown(f'<div class="protein-card">', unsafe_allow_html=True)
-                    mass = st.number_input(f"Mass of '{sample}' (Da)", min_value=0.0, key=sample)
-                    sample_mass_map[sample] = mass
-                    st.markdown('</div>', unsafe_allow_html=True)
-            
+            # One editable table instead of a widget per sample keeps large batches responsive. Keyed on the
+            # folders and manifest only, so changing the instrument or inject time keeps typed-in masses
+            table_identity = "\n".join(sample_folders).encode() + (manifest_file.getvalue() if manifest_file is not None else b"")
+            edited = st.data_editor(
+                samples,
+                key=f"sample_table_{content_hash(table_identity)}",
+                hide_index=True,
+                use_container_width=True,
+                disabled=["folder", "mass_source"],
+                column_config={
+                    "folder": st.column_config.TextColumn("Sample folder"),
+                    "mass": st.column_config.NumberColumn("Mass (Da)", min_value=0.0, format="%.2f"),
+                    "mass_source": st.column_config.TextColumn("Mass from"),
+                    "instrument": st.column_config.SelectboxColumn("Instrument", options=list(INSTRUMENTS), help="Blank uses the instrument chosen above"),
+                    "inject_time": st.column_config.NumberColumn("Inject time (ms)", min_value=0.0, help="Only used for Cyclic data; blank uses the inject time above"),
+                },
+            )
             submitted = st.form_submit_button("🔬 Generate .dat Files")
 
         st.markdown('</div>', unsafe_allow_html=True)
 
         if submitted:
-            # Validate that masses are provided
-            missing_masses = [sample for sample, mass in sample_mass_map.items() if mass == 0.0]
-            if missing_masses:
+            edited = fill_sample_defaults(edited, drift_mode, inject_time)
+            sample_mass_map = dict(zip(edited["folder"], edited["mass"].fillna(0.0)))
+            sample_settings = {
+                row.folder: (row.instrument, row.inject_time if row.instrument == "Cyclic" else None)
+                for row in edited.itertuples(index=False)
+            }
+
+            # Validate that masses (and inject times for Cyclic samples) are provided
+            missing_masses = [sample for sample, mass in sample_mass_map.items() if mass <= 0.0]
+            missing_inject = [sample for sample, (mode, inject) in sample_settings.items() if mode == "Cyclic" and pd.isna(inject)]
+            if missing_masses or missing_inject:
                 st.markdown('<div class="warning-card">', unsafe_allow_html=True)
-                st.write("⚠️ Please provide masses for the following samples:")
-                for sample in missing_masses:
-                    st.write(f"• {sample}")
+                if missing_masses:
+                    st.write("⚠️ Please provide masses for the following samples:")
+                    for sample in missing_masses:
+                        st.write(f"• {sample}")
+                if missing_inject:
+                    st.write("⚠️ Please provide inject times for the following Cyclic samples:")
+                    for sample in missing_inject:
+                        st.write(f"• {sample}")
                 st.markdown('</div>', unsafe_allow_html=True)
                 return
 
@@ -451,60 +470,70 @@ def generate_input_dat_files_app():
             
             all_processed_files = {}
             all_failed_files = {}
-            
-            with TemporaryDirectory() as tmp_output_dir:
-                for i, sample in enumerate(sample_folders):
+
+            if output_mode != "IMSCal input files":
+                calibrated_tables = {}
+                for i, (sample, atds, failed_files) in enumerate(iter_sample_atds(archive, sample_settings)):
+                    status_text.text(f"Calibrating {sample}...")
+                    progress_bar.progress((i + 1) / len(sample_folders))
+                    for failure in failed_files:
+                        st.warning(f"Error processing file in {sample}: {failure}")
+                    calibrated_df = calibrate_sample_folder(atds, sample_mass_map[sample], calibration)
+                    all_processed_files[sample] = list(atds)
+                    all_failed_files[sample] = failed_files
+                    if not calibrated_df.empty:
+                        calibrated_tables[sample] = calibrated_df
+
+                show_calibrated_tables(calibrated_tables, all_failed_files)
+                st.markdown('</div>', unsafe_allow_html=True)
+                return
+
+            # .dat files go straight into a compressed in-memory ZIP; nothing is written next to the upload
+            zip_buffer = io.BytesIO()
+            with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED, compresslevel=6) as zipf:
+                for i, (sample, atds, failed_files) in enumerate(iter_sample_atds(archive, sample_settings)):
                     status_text.text(f"Processing {sample}...")
                     progress_bar.progress((i + 1) / len(sample_folders))
-                    
-                    sample_path, processed_files, failed_files = process_sample_folder(
-                        folder_name=sample,
-                        folder_path=base_path,
-                        mass=sample_mass_map[sample],
-                        drift_mode=drift_mode,
-                        inject_time=inject_time
-                    )
-                    all_sample_paths.append(sample_path)
-                    all_processed_files[sample] = processed_files
+                    for failure in failed_files:
+                        st.warning(f"Error processing file in {sample}: {failure}")
+                    all_processed_files[sample] = write_sample_inputs(zipf, sample, atds, sample_mass_map[sample], combined=combined_inputs)
                     all_failed_files[sample] = failed_files
 
-                # Show processing results
-                st.markdown('<div class="success-card">', unsafe_allow_html=True)
-                st.write("✅ **Processing Complete!**")
+            # Show processing results
+            st.markdown('<div class="success-card">', unsafe_allow_html=True)
+            st.write("✅ **Processing Complete!**")
+            
+            total_processed = sum(len(files) for files in all_processed_files.values())
+            total_failed = sum(len(files) for files in all_failed_files.values())
+            
+            st.write(f"• Successfully processed: **{total_processed}** files")
+            if total_failed > 0:
+                st.write(f"• Failed to process: **{total_failed}** files")
+            st.markdown('</div>', unsafe_allow_html=True)
+
+            # Show detailed results
+            with st.expander("📊 Detailed Processing Results"):
+                for sample in sample_folders:
+                    st.write(f"**{sample}:**")
+                    if all_processed_files[sample]:
+                        st.write(f"  ✅ Processed: {', '.join(all_processed_files[sample])}")
+                    if all_failed_files[sample]:
+                        st.write(f"  ❌ Failed: {', '.join(all_failed_files[sample])}")
+
+            if total_processed > 0:
+                st.markdown('<div class="section-card">', unsafe_allow_html=True)
+                st.markdown('<h3 class="section-header">📥 Download Results</h3>', unsafe_allow_html=True)
                 
-                total_processed = sum(len(files) for files in all_processed_files.values())
-                total_failed = sum(len(files) for files in all_failed_files.values())
+                st.download_button(
+                    label="📦 Download All .dat Files (ZIP)",
+                    data=zip_buffer.getvalue(),
+                    file_name="sample_dat_files.zip",
+                    mime="application/zip"
+                )
                 
-                st.write(f"• Successfully processed: **{total_processed}** files")
-                if total_failed > 0:
-                    st.write(f"• Failed to process: **{total_failed}** files")
                 st.markdown('</div>', unsafe_allow_html=True)
-
-                # Show detailed results
-                with st.expander("📊 Detailed Processing Results"):
-                    for sample in sample_folders:
-                        st.write(f"**{sample}:**")
-                        if all_processed_files[sample]:
-                            st.write(f"  ✅ Processed: {', '.join(all_processed_files[sample])}")
-                        if all_failed_files[sample]:
-                            st.write(f"  ❌ Failed: {', '.join(all_failed_files[sample])}")
-
-                if total_processed > 0:
-                    zip_buffer = generate_output_zip(all_sample_paths)
-
-                    st.markdown('<div class="section-card">', unsafe_allow_html=True)
-                    st.markdown('<h3 class="section-header">📥 Download Results</h3>', unsafe_allow_html=True)
-                    
-                    st.download_button(
-                        label="📦 Download All .dat Files (ZIP)",
-                        data=zip_buffer.getvalue(),
-                        file_name="sample_dat_files.zip",
-                        mime="application/zip"
-                    )
-                    
-                    st.markdown('</div>', unsafe_allow_html=True)
-                else:
-                    st.markdown('<div class="error-card">No files were successfully processed. Please check your data format and try again.</div>', unsafe_allow_html=True)
+            else:
+                st.markdown('<div class="error-card">No files were successfully processed. Please check your data format and try again.</div>', unsafe_allow_html=True)
 
             st.markdown('</div>', unsafe_allow_html=True)
 
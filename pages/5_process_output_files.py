@@ -1,9 +1,9 @@
 import streamlit as st
-import zipfile
-import tempfile
-import os
-import pandas as pd
-from io import BytesIO, StringIO
+from io import BytesIO
+from ims_tools.archive import session_archive
+from ims_tools.calibration_store import ARTIFACT_TYPES, CalibrationStore, merge_tables, provenance, write_calibration_store
+from ims_tools.ccs_curves import DEFAULT_CCS_RTOL, CCSCurves
+from ims_tools.imscal_output import iter_output_tables
 
 # === PAGE CONFIGURATION ===
 st.set_page_config(
@@ -303,6 +303,11 @@ def process_outputs_page():
         type="zip",
         help="Select a ZIP file containing folders with output_X.dat files"
     )
+    existing_file = st.file_uploader(
+        "Optional: a calibrations file from an earlier run to update",
+        type=ARTIFACT_TYPES,
+        help="Outputs already merged into this file (same protein, same file contents) are skipped; new charge states and files are added, and repeated (Z, Drift) rows are de-duplicated. Download the updated calibrations file afterwards."
+    )
     
     if uploaded_zip:
         # Processing status
@@ -312,127 +317,142 @@ def process_outputs_page():
         </div>
         """, unsafe_allow_html=True)
         
-        with tempfile.TemporaryDirectory() as tmpdir:
-            zip_path = os.path.join(tmpdir, "uploaded.zip")
-            with open(zip_path, "wb") as f:
-                f.write(uploaded_zip.getvalue())
-            
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                zip_ref.extractall(tmpdir)
+        archive = session_archive(st.session_state, 'output_archive', uploaded_zip)
+        
+        # In update mode, outputs already recorded in the calibrations file's manifest are not parsed again
+        existing_store = None
+        if existing_file is not None:
+            try:
+                existing_store = CalibrationStore(existing_file.getvalue())
+            except Exception as e:
+                st.markdown(f'<div class="status-card error-card">❌ Could not read the calibrations file: {e}</div>', unsafe_allow_html=True)
+                return
+        manifest = list(existing_store.manifest) if existing_store is not None else []
+        known = {(protein, digest) for protein, digest, _ in manifest}
+        
+        protein_data = {}
+        files_processed = 0
+        files_skipped = 0
+        
+        # Process files: each output_X.dat is parsed from its [CALIBRATED DATA] line onwards, several at a time
+        for output in iter_output_tables(archive, known=known):
+            if output.skipped or (output.protein, output.digest) in known:
+                files_skipped += 1
+                continue
+            if output.table is None:
+                continue
+            protein_data.setdefault(output.protein, []).append(output.table)
+            manifest.append([output.protein, output.digest, output.member])
+            known.add((output.protein, output.digest))
+            files_processed += 1
+        
+        # New rows are appended to the existing tables and repeated (protein, Z, Drift) rows dropped
+        existing_tables = existing_store.tables() if existing_store is not None else {}
+        combined_tables = merge_tables(existing_tables, protein_data)
+        
+        # Display results
+        if combined_tables:
+            skipped_badge = f' (<span class="metric-badge">{files_skipped} already merged, skipped</span>)' if files_skipped else ''
+            st.markdown(f"""
+            <div class="status-card success-card">
+                <strong>✅ Processing Complete!</strong><br>
+                Found data for <span class="metric-badge">{len(combined_tables)} proteins</span> 
+                from <span class="metric-badge">{files_processed} new files</span>{skipped_badge}
+            </div>
+            """, unsafe_allow_html=True)
             
-            protein_data = {}
-            files_processed = 0
+            # Downloads section
+            st.markdown("""
+            <div class="section-card">
+                <div class="section-header">📥 Download Processed Data</div>
+            </div>
+            """, unsafe_allow_html=True)
             
-            # Process files
-            for root, dirs, files in os.walk(tmpdir):
-                for file in files:
-                    if file.startswith("output_") and file.endswith(".dat"):
-                        file_path = os.path.join(root, file)
-                        # Infer protein name from the first folder in the relative path
-                        rel_path = os.path.relpath(file_path, tmpdir)
-                        parts = rel_path.split(os.sep)
-                        if len(parts) < 2:
-                            continue
-                        protein_name = parts[0]
-                        
-                        with open(file_path, 'r') as f:
-                            lines = f.readlines()
-                        
-                        try:
-                            cal_index = next(i for i, line in enumerate(lines) if line.strip() == "[CALIBRATED DATA]")
-                            data_lines = lines[cal_index + 1:]
-                        except StopIteration:
-                            continue
-                        
-                        try:
-                            df = pd.read_csv(StringIO(''.join(data_lines)))
-                            df = df[['Z', 'Drift', 'CCS', 'CCS Std.Dev.']]
-                            
-                            if protein_name not in protein_data:
-                                protein_data[protein_name] = []
-                            protein_data[protein_name].append(df)
-                            files_processed += 1
-                        except Exception:
-                            continue
+            # Create columns for organized download layout
+            col1, col2 = st.columns(2)
             
-            # Display results
-            if protein_data:
-                st.markdown(f"""
-                <div class="status-card success-card">
-                    <strong>✅ Processing Complete!</strong><br>
-                    Found data for <span class="metric-badge">{len(protein_data)} proteins</span> 
-                    from <span class="metric-badge">{files_processed} files</span>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                # Downloads section
-                st.markdown("""
-                <div class="section-card">
-                    <div class="section-header">📥 Download Processed Data</div>
-                </div>
-                """, unsafe_allow_html=True)
+            for i, (protein_name, combined_df) in enumerate(combined_tables.items()):
                 
-                # Create columns for organized download layout
-                col1, col2 = st.columns(2)
-                
-                for i, (protein_name, dfs) in enumerate(protein_data.items()):
-                    combined_df = pd.concat(dfs, ignore_index=True)
-                    
-                    # Show protein info card
-                    st.markdown(f"""
-                    <div class="protein-card">
-                        <h4 style="color: #667eea; margin: 0 0 0.5rem 0;">🧬 {protein_name}</h4>
-                        <p style="margin: 0; color: #64748b;">
-                            <span class="metric-badge">{len(combined_df)} data points</span>
-                            <span class="metric-badge">{len(dfs)} files combined</span>
-                        </p>
-                    </div>
-                    """, unsafe_allow_html=True)
-                    
-                    # Prepare download
-                    buffer = BytesIO()
-                    combined_df.to_csv(buffer, index=False)
-                    buffer.seek(0)
-                    
-                    # Download button
-                    st.download_button(
-                        label=f"📊 Download {protein_name}.csv",
-                        data=buffer,
-                        file_name=f"{protein_name}.csv",
-                        mime="text/csv",
-                        key=f"download_{protein_name}"
-                    )
-                
-                # Summary information
-                st.markdown("""
-                <div class="info-card">
-                    <h4 style="color: #667eea; margin-top: 0;">📋 Next Steps</h4>
-                    <p>Your processed data is now ready for download. Each CSV file contains:</p>
-                    <ul>
-                        <li><strong>Z:</strong> Charge state</li>
-                        <li><strong>Drift:</strong> Drift time</li>
-                        <li><strong>CCS:</strong> Collision cross-section value</li>
-                        <li><strong>CCS Std.Dev.:</strong> Standard deviation</li>
-                    </ul>
-                    <p><strong>Ready to continue?</strong> Go to 'Process and Plot Data' to finish your analysis.</p>
+                # Show protein info card
+                st.markdown(f"""
+                <div class="protein-card">
+                    <h4 style="color: #667eea; margin: 0 0 0.5rem 0;">🧬 {protein_name}</h4>
+                    <p style="margin: 0; color: #64748b;">
+                        <span class="metric-badge">{len(combined_df)} data points</span>
+                        <span class="metric-badge">{len(protein_data.get(protein_name, []))} new files combined</span>
+                    </p>
                 </div>
                 """, unsafe_allow_html=True)
                 
-            else:
-                st.markdown("""
-                <div class="status-card warning-card">
-                    <strong>⚠️ No Valid Data Found</strong><br>
-                    No valid output_X.dat files were found in the uploaded ZIP file. 
-                    Please ensure your ZIP contains folders with properly formatted output files.
-                </div>
-                """, unsafe_allow_html=True)
+                # Prepare download
+                buffer = BytesIO()
+                combined_df.to_csv(buffer, index=False)
+                buffer.seek(0)
                 
-                # Help section
-                st.markdown("""
-                <div class="info-card">
-                    <h4 style="color: #667eea; margin-top: 0;">📖 Expected File Structure</h4>
-                    <p>Your ZIP file should contain:</p>
-                    <pre style="background: #f1f5f9; padding: 1rem; border-radius: 6px; font-size: 0.9rem;">
+                # Download button
+                st.download_button(
+                    label=f"📊 Download {protein_name}.csv",
+                    data=buffer,
+                    file_name=f"{protein_name}.csv",
+                    mime="text/csv",
+                    key=f"download_{protein_name}"
+                )
+            
+            # Every protein in one typed, partitioned file that 'Calibrate ATDs' and the aIMS page read without re-parsing
+            store_data, store_ext = write_calibration_store(
+                combined_tables, provenance(archive.content_hash, [member for _, _, member in manifest],
+                                            producer="Process Output Files", manifest=manifest)
+            )
+            st.download_button(
+                label=f"🗂️ Download all proteins as one .{store_ext} file",
+                data=store_data,
+                file_name=f"calibrations.{store_ext}",
+                mime="application/octet-stream",
+                key="download_calibration_store",
+                help="Columnar file partitioned by protein and charge state, with typed columns and a record of the source files. Upload it instead of the CSVs on the next pages."
+            )
+            
+            # Monotone CCS curves per (protein, Z): a few knots instead of one row per drift timepoint
+            curves = CCSCurves.from_tables(combined_tables)
+            st.download_button(
+                label="📈 Download CCS curves (.json)",
+                data=curves.to_json(),
+                file_name="ccs_curves.json",
+                mime="application/json",
+                key="download_ccs_curves",
+                help=f"{len(curves.keys)} curves with {curves.n_knots} knots in total, fitted to {curves.source_rows} rows (CCS within {DEFAULT_CCS_RTOL:.0e} relative error). The aIMS page evaluates these directly at any drift time."
+            )
+            
+            # Summary information
+            st.markdown("""
+            <div class="info-card">
+                <h4 style="color: #667eea; margin-top: 0;">📋 Next Steps</h4>
+                <p>Your processed data is now ready for download. Each CSV file contains:</p>
+                <ul>
+                    <li><strong>Z:</strong> Charge state</li>
+                    <li><strong>Drift:</strong> Drift time</li>
+                    <li><strong>CCS:</strong> Collision cross-section value</li>
+                    <li><strong>CCS Std.Dev.:</strong> Standard deviation</li>
+                </ul>
+                <p><strong>Ready to continue?</strong> Go to 'Process and Plot Data' to finish your analysis.</p>
+            </div>
+            """, unsafe_allow_html=True)
+            
+        else:
+            st.markdown("""
+            <div class="status-card warning-card">
+                <strong>⚠️ No Valid Data Found</strong><br>
+                No valid output_X.dat files were found in the uploaded ZIP file. 
+                Please ensure your ZIP contains folders with properly formatted output files.
+            </div>
+            """, unsafe_allow_html=True)
+            
+            # Help section
+            st.markdown("""
+            <div class="info-card">
+                <h4 style="color: #667eea; margin-top: 0;">📖 Expected File Structure</h4>
+                <p>Your ZIP file should contain:</p>
+                <pre style="background: #f1f5f9; padding: 1rem; border-radius: 6px; font-size: 0.9rem;">
 your_data.zip/
 ├── Protein1/
 │   ├── output_1.dat
@@ -442,8 +462,8 @@ your_data.zip/
 │   ├── output_1.dat
 │   └── ...
 └── ...</pre>
-                    <p>Each output_X.dat file should contain a <code>[CALIBRATED DATA]</code> section.</p>
-                </div>
-                """, unsafe_allow_html=True)
+                <p>Each output_X.dat file should contain a <code>[CALIBRATED DATA]</code> section.</p>
+            </div>
+            """, unsafe_allow_html=True)
 
 process_outputs_page()
@@ -4,6 +4,11 @@ import tempfile
 import os
 import pandas as pd
 from io import BytesIO
+from ims_tools.calibration_index import CalibrationIndex
+from ims_tools.calibration_store import ARTIFACT_TYPES, read_calibration_uploads
+from ims_tools.condition_batch import calibrate_condition_series, cube_to_npz
+from ims_tools.drift_join import match_intensities
+from ims_tools.zip_pipeline import PipelinedZipWriter
 
 # === PAGE CONFIGURATION ===
 st.set_page_config(
@@ -296,6 +301,90 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# Drift files laid out as protein/condition/X.txt: {protein: {condition: {charge: path}}}
+def find_condition_series(tmpdir):
+    series = {}
+    for root, _, files in os.walk(tmpdir):
+        parts = os.path.relpath(root, tmpdir).split(os.sep)
+        if len(parts) != 2:
+            continue
+        for file in files:
+            if file.endswith(".txt") and file.split(".")[0].isdigit():
+                series.setdefault(parts[0], {}).setdefault(parts[1], {})[int(file.split(".")[0])] = os.path.join(root, file)
+    return series
+
+
+# Calibrate every condition of every protein against one calibration and offer the cube and per-condition CSVs
+def show_condition_batch(series, calibration_lookup, data_type, inject_time, compression_level):
+    outputs = {}
+    failed = []
+    for protein_name, conditions in series.items():
+        atds = {}
+        for condition, paths in conditions.items():
+            for charge_state, file_path in paths.items():
+                if (protein_name, charge_state) not in calibration_lookup:
+                    continue
+                try:
+                    raw_df = pd.read_csv(file_path, sep="\t", header=None, names=["Drift", "Intensity"])
+                except Exception as e:
+                    failed.append(f"{protein_name}/{condition}/{charge_state}.txt - {e}")
+                    continue
+                drift = raw_df["Drift"].to_numpy(dtype=float)
+                if data_type == "Cyclic" and inject_time is not None:
+                    drift = drift - inject_time
+                atds.setdefault(condition, {})[charge_state] = (drift / 1000.0, raw_df["Intensity"].to_numpy())
+        if atds:
+            outputs[protein_name] = calibrate_condition_series(calibration_lookup, protein_name, atds)
+
+    for failure in failed:
+        st.error(f"Failed to read file {failure}")
+    if not outputs:
+        st.markdown("""
+        <div class="status-card warning-card">
+            <strong>⚠️ No Matching Data Found</strong><br>
+            No condition folders with calibrated charge states were found. Expected drift_files.zip/Protein1/CV20/2.txt etc.
+        </div>
+        """, unsafe_allow_html=True)
+        return
+
+    n_conditions = sum(len(cube["conditions"]) for _, cube in outputs.values())
+    st.markdown(f"""
+    <div class="status-card success-card">
+        <strong>🎉 Processing Complete!</strong><br>
+        Calibrated <span class="metric-badge">{n_conditions} conditions</span>
+        for <span class="metric-badge">{len(outputs)} proteins</span>
+    </div>
+    """, unsafe_allow_html=True)
+
+    zip_buffer = BytesIO()
+    with PipelinedZipWriter(zip_buffer, level=compression_level) as zip_out:
+        for protein_name, (tables, cube) in outputs.items():
+            st.markdown(f"""
+            <div class="protein-card">
+                <h4 style="color: #667eea; margin: 0 0 0.5rem 0;">🧬 {protein_name}</h4>
+                <p style="margin: 0; color: #64748b;">
+                    <span class="metric-badge">{len(cube["conditions"])} conditions</span>
+                    <span class="metric-badge">{len(cube["charges"])} charge states</span>
+                    <span class="metric-badge">{len(cube["ccs"])} CCS bins</span>
+                </p>
+            </div>
+            """, unsafe_allow_html=True)
+            for condition, table in tables.items():
+                zip_out.add(f"{protein_name}/{condition}.csv", lambda table=table: table.to_csv(index=False))
+            zip_out.add(f"{protein_name}/intensity_cube.npz", lambda cube=cube: cube_to_npz(cube))
+
+    st.download_button(
+        label="📦 Download Calibrated Condition Series (ZIP)",
+        data=zip_buffer.getvalue(),
+        file_name="calibrated_condition_series.zip",
+        mime="application/zip"
+    )
+    st.markdown("""
+    <div class="info-card">
+        <p>Each protein folder holds one CSV per condition (same columns as a single run, ready for 'Process and Plot Data') and <code>intensity_cube.npz</code> with arrays <code>conditions</code>, <code>charges</code>, <code>ccs</code> and <code>intensity</code> (condition × charge × CCS, each charge state resampled onto the shared CCS axis).</p>
+    </div>
+    """, unsafe_allow_html=True)
+
 def calibrate_drift_files_page():
     
     # Step 1: Upload drift files
@@ -369,6 +458,20 @@ def calibrate_drift_files_page():
                     </div>
                     """, unsafe_allow_html=True)
 
+            # A condition series (e.g. a collision voltage ramp) adds one folder level per protein
+            batch_mode = st.radio(
+                "How are your drift files organised?",
+                ["One folder per protein", "Condition series (protein/condition/X.txt)"],
+                help="For a series (collision voltages, activation energies, replicates), put one folder per condition inside each protein folder; one calibration is applied to all of them."
+            ) != "One folder per protein"
+
+            # Output CSVs are deflated on worker threads while later proteins are still being matched
+            compression_level = st.slider(
+                "Download compression level",
+                min_value=0, max_value=9, value=1,
+                help="0 stores the CSVs uncompressed. 1 already gives most of the size reduction; higher levels take noticeably longer for a few percent more"
+            )
+
             # Step 3: Upload calibration files
             st.markdown("""
             <div class="section-card">
@@ -377,10 +480,10 @@ def calibrate_drift_files_page():
             """, unsafe_allow_html=True)
             
             cal_csvs = st.file_uploader(
-                "Upload the CSV files from the 'Process Output Files' page", 
-                type="csv", 
+                "Upload the CSV files (or the single calibrations file) from the 'Process Output Files' page", 
+                type=["csv"] + ARTIFACT_TYPES, 
                 accept_multiple_files=True,
-                help="Select all CSV files generated in the previous step"
+                help="Select all CSV files generated in the previous step, or the one .parquet/.npz file holding every protein"
             )
 
             # Check if both drift zip and calibration CSVs are uploaded
@@ -399,24 +502,19 @@ def calibrate_drift_files_page():
                 </div>
                 """, unsafe_allow_html=True)
                 
-                # Load the calibration data into a dictionary
-                calibration_lookup = {}
-                total_cal_points = 0
-                
-                for file in cal_csvs:
-                    protein_name = file.name.replace(".csv", "")
-                    df = pd.read_csv(file)
-                    
-                    for _, row in df.iterrows():
-                        key = (protein_name, int(row["Z"]))
-                        if key not in calibration_lookup:
-                            calibration_lookup[key] = []
-                        calibration_lookup[key].append({
-                            "Drift": row["Drift"],
-                            "CCS": row["CCS"],
-                            "CCS Std.Dev.": row["CCS Std.Dev."]
-                        })
-                        total_cal_points += 1
+                # Only the (protein, charge state) partitions of a calibration file that have drift files are decoded
+                if batch_mode:
+                    series = find_condition_series(tmpdir)
+                    wanted = {(protein, z) for protein, conditions in series.items() for paths in conditions.values() for z in paths}
+                else:
+                    wanted = {
+                        (os.path.basename(root), int(file.split(".")[0]))
+                        for root, _, files in os.walk(tmpdir)
+                        for file in files if file.endswith(".txt") and file.split(".")[0].isdigit()
+                    }
+                # Index the calibration points by (protein, charge state) as contiguous sorted slices
+                calibration_lookup = CalibrationIndex.from_tables(read_calibration_uploads(cal_csvs, wanted))
+                total_cal_points = calibration_lookup.n_points
 
                 st.markdown(f"""
                 <div class="protein-card">
@@ -428,22 +526,33 @@ def calibrate_drift_files_page():
                 </div>
                 """, unsafe_allow_html=True)
 
-                # Prepare to save the output dataframes
-                output_buffers = {}
-                processed_files = 0
-                matched_points = 0
+                if batch_mode:
+                    show_condition_batch(series, calibration_lookup, data_type, inject_time, compression_level)
+                    return
 
-                # Process each drift file
+                # Group the drift files by protein, so each protein's CSV can be compressed as soon as it is matched
+                protein_files = {}
                 for root, _, files in os.walk(tmpdir):
                     for file in files:
                         if file.endswith(".txt") and file.split(".")[0].isdigit():
-                            charge_state = int(file.split(".")[0])
-                            protein_name = os.path.basename(root)
+                            protein_files.setdefault(os.path.basename(root), []).append((int(file.split(".")[0]), root, file))
+
+                # Only per-protein point counts are kept; the tables themselves go straight to the ZIP writer
+                protein_stats = {}
+                processed_files = 0
+                matched_points = 0
+                zip_buffer = BytesIO()
+
+                # Process each drift file
+                with PipelinedZipWriter(zip_buffer, level=compression_level) as zip_out:
+                    for protein_name, charge_files in protein_files.items():
+                        protein_dfs = []
+                        for charge_state, root, file in charge_files:
                             key = (protein_name, charge_state)
                             cal_data = calibration_lookup.get(key)
 
                             # Skip if no calibration data is found
-                            if not cal_data:
+                            if cal_data is None:
                                 continue
 
                             # Read the raw drift data
@@ -462,40 +571,32 @@ def calibrate_drift_files_page():
                             # Convert from ms to s for matching with calibration data
                             raw_df["Drift"] = raw_df["Drift"] / 1000.0
 
-                            # Match calibration drift times to intensities
-                            out_rows = []
-                            for entry in cal_data:
-                                drift_val = entry["Drift"]
-                                # Find the row in raw_df with the closest drift time
-                                closest_idx = (raw_df["Drift"] - drift_val).abs().idxmin()
-                                matched_intensity = raw_df.loc[closest_idx, "Intensity"]
-
-                                out_rows.append({
-                                    "Charge": charge_state,
-                                    "Drift": drift_val,
-                                    "CCS": entry["CCS"],
-                                    "CCS Std.Dev.": entry["CCS Std.Dev."],
-                                    "Intensity": matched_intensity
-                                })
-                                matched_points += 1
-
-                            # Create the dataframe for the matched data
-                            out_df = pd.DataFrame(out_rows)
-
-                            # Save each protein's data
-                            out_key = f"{protein_name}.csv"
-                            if out_key not in output_buffers:
-                                output_buffers[out_key] = []
-                            output_buffers[out_key].append(out_df)
+                            # Match every calibration drift time to the nearest raw drift time in one sorted search
+                            cal_drift, cal_ccs, cal_std = cal_data
+                            out_df = pd.DataFrame({
+                                "Charge": charge_state,
+                                "Drift": cal_drift,
+                                "CCS": cal_ccs,
+                                "CCS Std.Dev.": cal_std,
+                                "Intensity": match_intensities(raw_df["Drift"].to_numpy(), raw_df["Intensity"].to_numpy(), cal_drift)
+                            })
+                            matched_points += len(out_df)
+                            protein_dfs.append(out_df)
+
+                        # Hand the protein's CSV to the writer; formatting and deflate run on its threads
+                        if protein_dfs:
+                            combined = pd.concat(protein_dfs, ignore_index=True)
+                            zip_out.add(f"{protein_name}.csv", lambda combined=combined: combined.to_csv(index=False))
+                            protein_stats[protein_name] = (len(combined), len(protein_dfs))
 
                 # Results section
-                if output_buffers:
+                if protein_stats:
                     st.markdown(f"""
                     <div class="status-card success-card">
                         <strong>🎉 Processing Complete!</strong><br>
                         Processed <span class="metric-badge">{processed_files} files</span>
                         with <span class="metric-badge">{matched_points} matched data points</span>
-                        for <span class="metric-badge">{len(output_buffers)} proteins</span>
+                        for <span class="metric-badge">{len(protein_stats)} proteins</span>
                     </div>
                     """, unsafe_allow_html=True)
                     
@@ -507,28 +608,17 @@ def calibrate_drift_files_page():
                     """, unsafe_allow_html=True)
                     
                     # Show protein breakdown
-                    for filename, dfs in output_buffers.items():
-                        protein_name = filename.replace('.csv', '')
-                        total_points = sum(len(df) for df in dfs)
-                        
+                    for protein_name, (total_points, n_charges) in protein_stats.items():
                         st.markdown(f"""
                         <div class="protein-card">
                             <h4 style="color: #667eea; margin: 0 0 0.5rem 0;">🧬 {protein_name}</h4>
                             <p style="margin: 0; color: #64748b;">
                                 <span class="metric-badge">{total_points} calibrated points</span>
-                                <span class="metric-badge">{len(dfs)} charge states</span>
+                                <span class="metric-badge">{n_charges} charge states</span>
                             </p>
                         </div>
                         """, unsafe_allow_html=True)
                     
-                    # Create ZIP download
-                    zip_buffer = BytesIO()
-                    with zipfile.ZipFile(zip_buffer, "w") as zip_out:
-                        for filename, dfs in output_buffers.items():
-                            combined = pd.concat(dfs, ignore_index=True)
-                            csv_bytes = combined.to_csv(index=False).encode("utf-8")
-                            zip_out.writestr(filename, csv_bytes)
-
                     zip_buffer.seek(0)
                     st.download_button(
                         label="📦 Download Calibrated Drift Data (ZIP)",
@@ -1,16 +1,34 @@
 import streamlit as st
+import zipfile
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from io import BytesIO
+from ims_tools.archive import session_archive
+from ims_tools.ccsd_batch import (experiment_traces, read_batch_manifest, read_experiment, render_ccsd_panels,
+                                  resolve_batch_manifest, scale_experiments)
+from ims_tools.ccs_grid import DEFAULT_CCS_STEP, MAX_CCS_GRID_POINTS, MIN_CCS_STEP, adaptive_ccs_step, capped_ccs_step, make_ccs_grid, resample_ccs_grid, traces_frame
+from ims_tools.decimate import minmax_decimate
+from ims_tools.fit_cache import content_hash
+from ims_tools.mass_spectrum import DEFAULT_WINDOW_PERCENT, MassSpectrum
+from ims_tools.workers import iter_mapped, iter_prefetched
 
 st.header("Process and Plot your IMS Data")
 
 st.write("At this stage you should have a calibrated csv file for each experiment. This step allows you to (a) upload a mass spectrum and scale and sum the CCSDs and (b) plot the CCSDs either stacked or summed. Again, no fitting has taken place here.")
 
 with st.expander("Click to find out how the scaling is happening..."):
-    st.write('The script uses the mass you input to calculate the m/z values for the charge states. It is then integrating over a region of +/- 1% of each m/z value to generate scale factors, which are then multiplied by the normalised data to give scaled intensity. If your data is salty or full of different proteoforms this might be too much of an oversimplification - think about this before using the results.')
+    st.write('The script uses the mass you input to calculate the m/z values for the charge states. It is then integrating over a region of +/- 1% (or the window you set) of each m/z value to generate scale factors, which are then multiplied by the normalised data to give scaled intensity. The same windows are shaded on the mass spectrum plot. If your data is salty or full of different proteoforms, add the adduct or proteoform masses as additional species: their windows at each charge state are added to the scale factor (overlapping windows are only counted once). Think about whether this is appropriate before using the results.')
+
+# Hash of a calibrated table, so resampled grids are cached per upload and settings rather than per object
+def table_hash(df):
+    return content_hash(pd.util.hash_pandas_object(df, index=False).values.tobytes())
+
+# Charge x CCS matrix for one table, value column and grid, computed once and shared across reruns
+@st.cache_data(max_entries=32, show_spinner=False)
+def cached_ccs_matrix(df_hash, _cal_df, value_column, ccs_min, ccs_max, ccs_step):
+    return resample_ccs_grid(_cal_df, value_column, make_ccs_grid(ccs_min, ccs_max, ccs_step))
 
 def plot_and_scale_page():
 
@@ -28,19 +46,27 @@ def plot_and_scale_page():
         ms_df = pd.read_csv(ms_file, sep="\t", header=None, names=["m/z", "Intensity"])
         ms_df.dropna(inplace=True)
 
-        PROTON_MASS = 1.007276
         all_charges = sorted(cal_df["Charge"].unique())
         selected_charges = st.multiselect("Select charge states to include", all_charges, default=all_charges)
 
         cal_df = cal_df[cal_df["Charge"].isin(selected_charges)]
 
-        scale_factors = {}
-        for z in selected_charges:
-            mz = (protein_mass + z * PROTON_MASS) / z
-            mz_min = mz * 0.99
-            mz_max = mz * 1.01
-            intensity_sum = ms_df[(ms_df["m/z"] >= mz_min) & (ms_df["m/z"] <= mz_max)]["Intensity"].sum()
-            scale_factors[z] = intensity_sum
+        window_percent = st.number_input("Integration window (± % of m/z)", min_value=0.01, max_value=10.0,
+                                         value=DEFAULT_WINDOW_PERCENT, step=0.1,
+                                         help="Used both for the scale factors and for the shaded regions on the mass spectrum")
+        st.write("Optional: add adducts, proteoforms or oligomers whose charge-state windows should count towards the scale factors.")
+        extra_species = st.data_editor(
+            pd.DataFrame({"Species": pd.Series(dtype=str), "Mass (Da)": pd.Series(dtype=float)}),
+            num_rows="dynamic",
+            key="extra_species"
+        ).dropna()
+        species = {"Protein": protein_mass}
+        species.update({str(name): float(mass) for name, mass in zip(extra_species["Species"], extra_species["Mass (Da)"]) if mass > 0})
+
+        # Sort the spectrum once; every window sum is then two searchsorted calls on its running total
+        spectrum = MassSpectrum.from_frame(ms_df)
+        windows = spectrum.species_windows(species, np.asarray(selected_charges, dtype=int), window_percent)
+        scale_factors = spectrum.scale_factors(windows)
 
         # Map scale factors to the dataframe
         cal_df["Scale Factor"] = cal_df["Charge"].map(scale_factors)
@@ -67,7 +93,19 @@ def plot_and_scale_page():
 
         ccs_min_input = st.number_input("CCS x-axis min", value=float(np.floor(cal_df["CCS"].min())))
         ccs_max_input = st.number_input("CCS x-axis max", value=float(np.ceil(cal_df["CCS"].max())))
-        ccs_grid = np.arange(ccs_min_input, ccs_max_input + 1, 1.0)
+        if st.checkbox("Choose the CCS grid step from the data", help="Median CCS spacing of the calibrated points, rounded down to 1, 2 or 5 x 10^k Å²"):
+            ccs_step = adaptive_ccs_step(cal_df)
+            st.write(f"CCS grid step: {ccs_step:g} Å²")
+        else:
+            ccs_step = st.number_input("CCS grid step (Å²)", min_value=MIN_CCS_STEP, value=DEFAULT_CCS_STEP, step=0.5)
+        if capped_ccs_step(ccs_min_input, ccs_max_input, ccs_step) != ccs_step:
+            ccs_step = capped_ccs_step(ccs_min_input, ccs_max_input, ccs_step)
+            st.write(f"CCS grid step raised to {ccs_step:g} Å² to keep the grid within {MAX_CCS_GRID_POINTS} points")
+        ccs_grid = make_ccs_grid(ccs_min_input, ccs_max_input, ccs_step)
+
+        # Every charge state resampled onto the grid, cached per table and grid; both plot modes and the export read this matrix
+        value_column = "Scaled Intensity" if use_scaled else "Intensity"
+        grid_charges, ccs_matrix = cached_ccs_matrix(table_hash(cal_df), cal_df, value_column, ccs_min_input, ccs_max_input, ccs_step)
 
         ccs_label_value = st.number_input("Optional CCS label position (leave blank if unused)", value=0.0, step=1.0, format="%.1f")
 
@@ -76,14 +114,19 @@ def plot_and_scale_page():
         # === Mass Spectrum Plot ===
         st.subheader("Mass Spectrum with Charge State Integration Regions")
         fig1, ax1 = plt.subplots(figsize=(fig_width, fig_height), dpi=fig_dpi)
-        ax1.plot(ms_df["m/z"], ms_df["Intensity"], color="gray", label="Mass Spectrum")
-
-        for i, z in enumerate(selected_charges):
-            mz = (protein_mass + z * PROTON_MASS) / z
-            mz_min = mz * 0.995
-            mz_max = mz * 1.005
-            region = ms_df[(ms_df["m/z"] >= mz_min) & (ms_df["m/z"] <= mz_max)]
-            ax1.fill_between(region["m/z"], region["Intensity"], color=palette[i], alpha=0.5, label=f"{z}+")
+        # Draw at most the min and max of each pixel column; scale factors and exports use the full-resolution spectrum
+        plot_pixels = int(fig_width * fig_dpi)
+        mz_span = spectrum.mz[-1] - spectrum.mz[0] if len(spectrum) else 0.0
+        ax1.plot(*minmax_decimate(spectrum.mz, spectrum.intensity, plot_pixels), color="gray", label="Mass Spectrum")
+
+        charge_colours = dict(zip(selected_charges, palette))
+        labelled = set()
+        for z, mz_min, mz_max in zip(windows["Charge"], windows["m/z min"], windows["m/z max"]):
+            window_pixels = max(1, int(np.ceil(plot_pixels * (mz_max - mz_min) / mz_span))) if mz_span > 0 else 1
+            region_mz, region_intensity = minmax_decimate(*spectrum.window(mz_min, mz_max), window_pixels)
+            label = None if z in labelled else f"{z}+"
+            labelled.add(z)
+            ax1.fill_between(region_mz, region_intensity, color=charge_colours[z], alpha=0.5, label=label)
 
         ax1.set_xlabel("m/z", fontsize=font_size)
         ax1.set_ylabel("")
@@ -102,20 +145,15 @@ def plot_and_scale_page():
         # === CCS Plot ===
         st.subheader("Scaled Intensity vs CCS")
         fig2, ax2 = plt.subplots(figsize=(fig_width, fig_height), dpi=fig_dpi)
-        interpolated_traces = []
         max_y_value = 0
 
         if plot_mode == "Summed":
-            for i, (charge, group) in enumerate(cal_df.groupby("Charge")):
-                group_sorted = group.sort_values("CCS")
-                y_values = group_sorted["Scaled Intensity"] if use_scaled else group_sorted["Intensity"]
-                interp = np.interp(ccs_grid, group_sorted["CCS"], y_values, left=0, right=0)
-                interpolated_traces.append(interp)
+            for i, (charge, interp) in enumerate(zip(grid_charges, ccs_matrix)):
                 ax2.plot(ccs_grid, interp, color=palette[i], label=f"{int(charge)}+", linewidth=line_thickness)
                 ax2.fill_between(ccs_grid, 0, interp, color=palette[i], alpha=0.3)
                 max_y_value = max(max_y_value, interp.max())
 
-            total_trace = np.sum(interpolated_traces, axis=0)
+            total_trace = ccs_matrix.sum(axis=0)
             ax2.plot(ccs_grid, total_trace, color="black", linewidth=line_thickness, label="Summed")
             ax2.legend(fontsize=font_size, frameon=False)
 
@@ -126,11 +164,7 @@ def plot_and_scale_page():
             base_max = 0
             interpolated = {}
 
-            for charge, group in cal_df.groupby("Charge"):
-                group_sorted = group.sort_values("CCS")
-                y_values = group_sorted["Scaled Intensity"] if use_scaled else group_sorted["Intensity"]
-                interp = np.interp(ccs_grid, group_sorted["CCS"], y_values, left=0, right=0)
-
+            for charge, interp in zip(grid_charges, ccs_matrix):
                 # Only normalize if using unscaled data
                 if not use_scaled and interp.max() > 0:
                     interp = interp / interp.max()
@@ -184,4 +218,109 @@ def plot_and_scale_page():
         fig_buffer.seek(0)
         st.download_button("Download CCS Plot as PNG", data=fig_buffer, file_name="ccs_plot.png", mime="image/png", key="ccs_download")
 
-plot_and_scale_page()
+        traces_csv = traces_frame(grid_charges, ccs_matrix, ccs_grid).to_csv(index=False).encode("utf-8")
+        st.download_button("Download Resampled Traces CSV", data=traces_csv, file_name="ccs_traces.csv", mime="text/csv", key="traces_download")
+
+# Many experiments (a titration, a time course) from one ZIP and a manifest naming each experiment's files and mass
+def batch_scale_page():
+
+    st.write("Upload a ZIP holding the calibrated CSVs and mass spectra of every experiment, and a manifest CSV with the columns `experiment`, `calibrated_csv`, `spectrum` and `mass` (or `sequence`). File names can be paths inside the ZIP or just the file name if it is unique.")
+    batch_zip = st.file_uploader("Upload a ZIP of calibrated CSVs and mass spectra", type="zip")
+    manifest_file = st.file_uploader("Upload the batch manifest CSV", type="csv")
+    window_percent = st.number_input("Integration window (± % of m/z)", min_value=0.01, max_value=10.0,
+                                     value=DEFAULT_WINDOW_PERCENT, step=0.1, key="batch_window")
+
+    if not (batch_zip and manifest_file):
+        return
+
+    archive = session_archive(st.session_state, "ccsd_batch_archive", batch_zip)
+    try:
+        manifest = read_batch_manifest(manifest_file)
+    except ValueError as e:
+        st.error(str(e))
+        return
+    experiments, issues = resolve_batch_manifest(manifest, archive.file_members())
+    if len(issues):
+        with st.expander(f"{len(issues)} manifest rows skipped"):
+            st.dataframe(issues, hide_index=True)
+    if experiments.empty:
+        st.error("No usable experiments in the manifest.")
+        return
+
+    # Parse the experiments on threads while earlier ones are collected
+    def read(row):
+        try:
+            return row.experiment, read_experiment(archive, row.calibrated_csv, row.spectrum), None
+        except Exception as e:
+            return row.experiment, None, e
+
+    tables, spectra = {}, {}
+    for experiment, parsed, error in iter_prefetched(read, list(experiments.itertuples(index=False))):
+        if error is not None:
+            st.error(f"Failed to read experiment {experiment}: {error}")
+            continue
+        tables[experiment], spectra[experiment] = parsed
+    if not tables:
+        return
+
+    masses = dict(zip(experiments["experiment"], experiments["mass"]))
+    scaled = scale_experiments(tables, spectra, masses, window_percent)
+
+    st.subheader("Scaled Calibrated Data (all experiments)")
+    st.write(f"{len(tables)} experiments, {scaled['Charge'].nunique()} charge states, {len(scaled)} points.")
+    st.dataframe(scaled)
+    st.download_button("Download Combined Scaled CSV", data=scaled.to_csv(index=False).encode("utf-8"),
+                       file_name="scaled_calibrated_batch.csv", mime="text/csv", key="batch_csv_download")
+
+    st.subheader("Plot Options")
+    palette_choice = st.selectbox("Choose a color palette", list(sns.palettes.SEABORN_PALETTES.keys()), key="batch_palette")
+    panel_width = st.slider("Panel width", min_value=2, max_value=10, value=4)
+    panel_height = st.slider("Panel height", min_value=2, max_value=10, value=3)
+    n_cols = st.slider("Panels per row", min_value=1, max_value=8, value=4)
+    panels_per_figure = st.slider("Panels per figure", min_value=1, max_value=48, value=12)
+    fig_dpi = st.slider("Figure DPI", min_value=100, max_value=1000, value=150, key="batch_dpi")
+    font_size = st.slider("Font size", min_value=5, max_value=24, value=10, key="batch_font")
+    line_thickness = st.slider("Line thickness", min_value=0.1, max_value=5.0, value=1.0, step=0.1, key="batch_line")
+    use_scaled = st.radio("Use Scaled or Unscaled Intensities?", ["Scaled", "Unscaled"], key="batch_scaled") == "Scaled"
+    shared_scale = st.checkbox("Same intensity scale on every panel", value=use_scaled)
+
+    ccs_min_input = st.number_input("CCS x-axis min", value=float(np.floor(scaled["CCS"].min())), key="batch_ccs_min")
+    ccs_max_input = st.number_input("CCS x-axis max", value=float(np.ceil(scaled["CCS"].max())), key="batch_ccs_max")
+    if st.checkbox("Choose the CCS grid step from the data", key="batch_adaptive_step"):
+        ccs_step = adaptive_ccs_step(scaled)
+        st.write(f"CCS grid step: {ccs_step:g} Å²")
+    else:
+        ccs_step = st.number_input("CCS grid step (Å²)", min_value=MIN_CCS_STEP, value=DEFAULT_CCS_STEP, step=0.5, key="batch_ccs_step")
+    if capped_ccs_step(ccs_min_input, ccs_max_input, ccs_step) != ccs_step:
+        ccs_step = capped_ccs_step(ccs_min_input, ccs_max_input, ccs_step)
+        st.write(f"CCS grid step raised to {ccs_step:g} Å² to keep the grid within {MAX_CCS_GRID_POINTS} points")
+    ccs_grid = make_ccs_grid(ccs_min_input, ccs_max_input, ccs_step)
+
+    if not st.checkbox("Render figures"):
+        return
+
+    traces = experiment_traces(scaled, ccs_grid, "Scaled Intensity" if use_scaled else "Normalized Intensity")
+    all_charges = sorted(scaled["Charge"].unique())
+    colours = {int(z): tuple(c) for z, c in zip(all_charges, sns.color_palette(palette_choice, n_colors=len(all_charges)))}
+    y_max = max(t.sum(axis=0).max() for _, t in traces.values()) if shared_scale else None
+    panels = [(experiment, charges, t) for experiment, (charges, t) in traces.items()]
+    jobs = [{"panels": panels[i:i + panels_per_figure], "ccs_grid": ccs_grid, "colours": colours, "n_cols": n_cols,
+             "panel_size": (panel_width, panel_height), "dpi": fig_dpi, "font_size": font_size,
+             "line_thickness": line_thickness, "ccs_range": (ccs_min_input, ccs_max_input), "y_max": y_max}
+            for i in range(0, len(panels), panels_per_figure)]
+
+    # Figures are rendered in a process pool and shown as each one (in order) is ready
+    progress = st.progress(0.0)
+    figure_buffer = BytesIO()
+    with zipfile.ZipFile(figure_buffer, "w") as zip_out:
+        for n, png in enumerate(iter_mapped(render_ccsd_panels, jobs)):
+            st.image(png)
+            zip_out.writestr(f"ccsd_panels_{n + 1:02d}.png", png)
+            progress.progress((n + 1) / len(jobs))
+    st.download_button("Download Figures (ZIP of PNGs)", data=figure_buffer.getvalue(), file_name="ccsd_panels.zip",
+                       mime="application/zip", key="batch_figures_download")
+
+if st.radio("Mode", ["Single experiment", "Batch (ZIP + manifest)"], horizontal=True) == "Single experiment":
+    plot_and_scale_page()
+else:
+    batch_scale_page()
@@ -10,6 +10,8 @@ from scipy.interpolate import griddata
 from scipy.signal import savgol_filter
 import matplotlib.colors as mcolors
 import seaborn as sns
+from ims_tools.calibration_store import ARTIFACT_TYPES, CalibrationStore
+from ims_tools.ccs_curves import CCSCurves
 
 # === PAGE CONFIGURATION ===
 st.set_page_config(
@@ -180,7 +182,7 @@ with st.container():
     with col1:
         twim_extract_file = st.file_uploader("Upload the TWIM Extract CSV file", type="csv")
     with col2:
-        calibration_file = st.file_uploader("Upload the calibration CSV file", type="csv")
+        calibration_file = st.file_uploader("Upload the calibration CSV file (or calibrations / CCS curves file)", type=["csv", "json"] + ARTIFACT_TYPES)
     
     st.markdown('</div>', unsafe_allow_html=True)
 
@@ -212,8 +214,22 @@ if twim_extract_file and calibration_file:
         with st.expander("View TWIM Extract Data Preview"):
             st.dataframe(twim_df.head())
 
-        # Read calibration data
-        cal_df = pd.read_csv(calibration_file)
+        # Read calibration data; a calibrations file holds several proteins, so pick one
+        cal_curves = None
+        if calibration_file.name.endswith(".csv"):
+            cal_df = pd.read_csv(calibration_file)
+        elif calibration_file.name.endswith(".json"):
+            # CCS curves are evaluated directly at every drift time instead of searching table rows
+            cal_curves = CCSCurves.from_json(calibration_file.getvalue())
+            cal_protein = st.selectbox("Protein in CCS curves file", list(dict.fromkeys(p for p, _ in cal_curves.keys)))
+            cal_df = pd.concat([
+                pd.DataFrame(dict(zip(["Drift", "CCS", "CCS Std.Dev."], cal_curves.knots(p, z)), Z=z))
+                for p, z in cal_curves.keys if p == cal_protein
+            ], ignore_index=True)[["Z", "Drift", "CCS", "CCS Std.Dev."]]
+        else:
+            cal_store = CalibrationStore(calibration_file.getvalue())
+            cal_protein = st.selectbox("Protein in calibrations file", cal_store.proteins)
+            cal_df = cal_store.read(cal_protein)
         
         with st.expander("View Calibration Data Preview"):
             st.dataframe(cal_df.head())
@@ -251,6 +267,9 @@ if twim_extract_file and calibration_file:
 
             cal_data["CCS Std.Dev."] = cal_data["CCS Std.Dev."].fillna(0)
             cal_data = cal_data[cal_data["CCS Std.Dev."] <= 0.1 * cal_data["CCS"]]
+            if cal_data.empty:
+                st.markdown('<div class="status-card error-card">❌ No calibration points for this charge state have a CCS Std.Dev. within 10% of the CCS.</div>', unsafe_allow_html=True)
+                st.stop()
             cal_data["Drift (ms)"] = cal_data["Drift"] * 1000
 
             calibrated_data = []
@@ -258,17 +277,33 @@ if twim_extract_file and calibration_file:
             drift_times = twim_df["Drift Time"]
             collision_voltages = twim_df.columns[1:]
 
-            for idx, drift_time in enumerate(drift_times):
-                intensities = twim_df.iloc[idx, 1:].values
-                if pd.isna(drift_time):
-                    continue
-                drift_time_rounded = round(drift_time, 4)
-                closest_idx = (cal_data["Drift (ms)"] - drift_time_rounded).abs().idxmin()
-                ccs_value = cal_data.loc[closest_idx, "CCS"]
-
-                for col_idx, intensity in enumerate(intensities):
-                    cv = collision_voltages[col_idx]
-                    calibrated_data.append([ccs_value, drift_time, float(cv), intensity])
+            if cal_curves is not None:
+                # Evaluate the curve on all drift times at once, clamped to the drift range of the knots that
+                # pass the same 10% Std.Dev. filter as table rows, so both file types give the same points
+                drift_ms = drift_times.to_numpy(dtype=float)
+                clamped = np.clip(drift_ms / 1000, cal_data["Drift"].min(), cal_data["Drift"].max())
+                ccs_values, _ = cal_curves.evaluate(cal_protein, charge_state, clamped)
+                keep = ~np.isnan(drift_ms)
+                intensities = twim_df.iloc[:, 1:].to_numpy(dtype=float)[keep]
+                n_cv = len(collision_voltages)
+                calibrated_data = np.column_stack([
+                    np.repeat(ccs_values[keep], n_cv),
+                    np.repeat(drift_ms[keep], n_cv),
+                    np.tile(collision_voltages.astype(float), keep.sum()),
+                    intensities.ravel(),
+                ])
+            else:
+                for idx, drift_time in enumerate(drift_times):
+                    intensities = twim_df.iloc[idx, 1:].values
+                    if pd.isna(drift_time):
+                        continue
+                    drift_time_rounded = round(drift_time, 4)
+                    closest_idx = (cal_data["Drift (ms)"] - drift_time_rounded).abs().idxmin()
+                    ccs_value = cal_data.loc[closest_idx, "CCS"]
+
+                    for col_idx, intensity in enumerate(intensities):
+                        cv = collision_voltages[col_idx]
+                        calibrated_data.append([ccs_value, drift_time, float(cv), intensity])
 
             # Convert calibrated data to NumPy array
             calibrated_array = np.array(calibrated_data)
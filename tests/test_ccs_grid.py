@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+from ims_tools.ccs_grid import MAX_CCS_GRID_POINTS, MIN_CCS_STEP, adaptive_ccs_step, capped_ccs_step, make_ccs_grid
+
+
+def test_adaptive_step_snaps_to_the_data_spacing():
+    df = pd.DataFrame({"Charge": np.repeat([10, 11], 50), "CCS": np.tile(np.arange(50) * 2.3 + 1500, 2)})
+    assert adaptive_ccs_step(df) == 2.0
+
+
+def test_dense_degenerate_ccs_range_keeps_a_minimum_step():
+    # Near-duplicate CCS values: the median spacing is ~1e-9 Å², far below any useful grid step
+    df = pd.DataFrame({"Charge": 10, "CCS": 1500 + np.arange(1000) * 1e-9})
+    step = adaptive_ccs_step(df)
+    assert step == MIN_CCS_STEP
+    assert len(make_ccs_grid(1000.0, 9000.0, step)) <= MAX_CCS_GRID_POINTS
+
+
+def test_grid_is_capped_for_a_wide_range():
+    step = capped_ccs_step(0.0, 1e6, 0.01)
+    grid = make_ccs_grid(0.0, 1e6, 0.01)
+    assert len(grid) <= MAX_CCS_GRID_POINTS
+    assert np.allclose(np.diff(grid), step)
+    assert capped_ccs_step(1000.0, 2000.0, 1.0) == 1.0
+    assert len(make_ccs_grid(1500.0, 1500.0, 1.0)) == 1